@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+def normalize_query(text):
+    """Key under which identical questions are coalesced."""
+    return " ".join(text.lower().split())
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key
+    wait for that call and share its result instead of repeating it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+class AnswerCache:
+    """Answers keyed by query embedding, served to any query whose cosine
+    similarity to a cached one reaches the threshold.
+
+    Entries remember the chunk ids the answer was grounded on and are
+    dropped together whenever the index version changes.
+    """
+
+    SIMILARITY_THRESHOLD = 0.95
+    MAX_ENTRIES = 1000
+    MAX_AGE_SECONDS = 3600
+    INDEX_CHECK_SECONDS = 30
+
+    def __init__(self, similarity_threshold=None, max_entries=None, clock=time.monotonic):
+        self.similarity_threshold = similarity_threshold or self.SIMILARITY_THRESHOLD
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.entries = []
+        self.index_version = None
+        self.index_checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.single_flight = SingleFlight()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def lookup(self, embedding):
+        """Returns the best cached entry for the embedding, or None."""
+        query = self.__unit(embedding)
+        now = self.clock()
+        with self.lock:
+            if not self.entries:
+                self.misses += 1
+                return None
+            scores = self.vectors @ query
+            best = int(np.argmax(scores))
+            entry = self.entries[best]
+            if scores[best] < self.similarity_threshold or now - entry["created"] > self.MAX_AGE_SECONDS:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, embedding, chunk_ids, answer):
+        vector = self.__unit(embedding)
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                # Entries are kept in insertion order, so the oldest goes first
+                self.entries.pop(0)
+                self.vectors = self.vectors[1:]
+            self.entries.append({"chunk_ids": list(chunk_ids), "answer": answer, "created": self.clock()})
+            self.vectors = vector[np.newaxis, :] if self.vectors is None else np.vstack([self.vectors, vector])
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+            self.vectors = None
+
+    def check_index_version(self, get_version):
+        """Drops every entry when the index has changed since the last check.
+
+        get_version is called at most once per INDEX_CHECK_SECONDS; failures
+        keep the cache as it is.
+        """
+        now = self.clock()
+        with self.lock:
+            if self.index_checked_at is not None and now - self.index_checked_at < self.INDEX_CHECK_SECONDS:
+                return
+            self.index_checked_at = now
+        try:
+            version = get_version()
+        except Exception as e:
+            logging.warning(f"Could not read index version, keeping cached answers: {e}")
+            return
+        with self.lock:
+            if version != self.index_version:
+                if self.entries:
+                    logging.info(f"Index changed, dropping {len(self.entries)} cached answers")
+                self.entries = []
+                self.vectors = None
+                self.index_version = version
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def __unit(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
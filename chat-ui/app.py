@@ -5,8 +5,20 @@ from openai import AzureOpenAI
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 import json
+import tempfile
+import time
+from contextlib import closing
 import requests # Added
 import pandas as pd # Added
+from embeddingcache import EmbeddingCache
+from ratelimiter import get_rate_limiter
+from answercache import AnswerCache, normalize_query
+from localvectorindex import LocalVectorIndex
+from azuresearchbackend import AzureSearchBackend
+from contextpacker import ContextPacker
+from vectorformat import check_vector_format
+from searchindexes import SearchIndexAdmin
+import telemetry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,107 +26,413 @@ logger = logging.getLogger(__name__)
 # --- Configuration ---
 AZURE_SEARCH_API_URL = os.environ.get("AZURE_SEARCH_API_URL")
 AZURE_SEARCH_API_KEY = os.environ.get("AZURE_SEARCH_API_KEY")
-AZURE_SEARCH_INDEX_NAME = "rag-index"
+# Index alias that function-app/src/indexmigration.py swaps, by default the
+# one infra creates, or an index; an alias is resolved to the index behind
+# it again every SEARCH_INDEX_RESOLVE_SECONDS
+AZURE_SEARCH_INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX_NAME", "rag")
+SEARCH_INDEX_RESOLVE_SECONDS = float(os.environ.get("SEARCH_INDEX_RESOLVE_SECONDS", "60"))
+# Must match the embedding field type of the index: float32, float16 or int8
+VECTOR_FORMAT = check_vector_format(os.environ.get("VECTOR_FORMAT") or "float32")
+# "azure" (default) or "local" to search the in-process index the function
+# app writes to LOCAL_INDEX_PATH, skipping a network hop per query
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "azure").lower()
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", os.path.join(tempfile.gettempdir(), "rag-index"))
+LOCAL_INDEX_IVF_LISTS = int(os.environ.get("LOCAL_INDEX_IVF_LISTS", "0")) or None
 
 AZURE_OPENAI_ENDPOINT = os.environ.get("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_API_KEY = os.environ.get("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_CHAT_DEPLOYMENT = "gpt-4o-chat"
-AZURE_OPENAI_EMBEDDING_DEPLOYMENT = "text-embedding-ada-002"
+# Used when the index does not record the deployment its vectors came from
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+
+# Deployment quotas; unset means no client-side cap
+AZURE_OPENAI_CHAT_TPM = int(os.environ.get("AZURE_OPENAI_CHAT_TPM", "0")) or None
+AZURE_OPENAI_CHAT_RPM = int(os.environ.get("AZURE_OPENAI_CHAT_RPM", "0")) or None
+AZURE_OPENAI_EMBEDDING_TPM = int(os.environ.get("AZURE_OPENAI_EMBEDDING_TPM", "0")) or None
+AZURE_OPENAI_EMBEDDING_RPM = int(os.environ.get("AZURE_OPENAI_EMBEDDING_RPM", "0")) or None
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "chat-embedding-cache.sqlite"))
+
+# Render answers token by token as they are generated
+STREAM_CHAT_RESPONSES = os.environ.get("STREAM_CHAT_RESPONSES", "true").lower() == "true"
+
+# Results fetched per question; the context packer keeps the useful ones
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "10"))
+# Most tokens of retrieved context sent with each question
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", ContextPacker.TOKEN_BUDGET))
+# The GPT-2 tokenizer file the function app chunks with, exported by
+# `python -m src.tokenizer` and copied here before deploying
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gpt2-tokenizer.json")
+
+# Cosine similarity at which a cached answer is reused for a new question
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", AnswerCache.SIMILARITY_THRESHOLD))
+
+# "none" (default) or "opentelemetry" to send per-stage spans and metrics
+# to the OpenTelemetry providers configured for this process
+TELEMETRY_EXPORTER = os.environ.get("TELEMETRY_EXPORTER", "none")
 
 AZURE_FUNCTION_APP_URL = os.environ.get("AZURE_FUNCTION_APP_URL")
 AZURE_FUNCTION_APP_KEY = os.environ.get("AZURE_FUNCTION_APP_KEY")
+# Names listed per request for the sidebar, and how long a listed page is
+# shown before the function app is asked again whether it changed
+BLOB_LIST_PAGE_SIZE = int(os.environ.get("BLOB_LIST_PAGE_SIZE", "100"))
+BLOB_LIST_TTL_SECONDS = float(os.environ.get("BLOB_LIST_TTL_SECONDS", "30"))
+# Uploads are streamed to the function app in pieces of this size
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
 
 # --- Client Initialization ---
+@st.cache_resource
+def configure_telemetry(exporter: str):
+    # Once per server process, not on every rerun of the script
+    return telemetry.configure_or_disable(exporter)
+
+configure_telemetry(TELEMETRY_EXPORTER)
+
 search_credential = AzureKeyCredential(AZURE_SEARCH_API_KEY) if AZURE_SEARCH_API_KEY else None
-search_client = SearchClient(endpoint=AZURE_SEARCH_API_URL,
-                             index_name=AZURE_SEARCH_INDEX_NAME,
-                             credential=search_credential,
-                             api_version="2023-11-01") if AZURE_SEARCH_API_URL and search_credential else None
+search_configured = bool(AZURE_SEARCH_API_URL and search_credential)
+
+@st.cache_data(ttl=SEARCH_INDEX_RESOLVE_SECONDS, show_spinner=False)
+def resolve_search_index(name: str):
+    # The index and the deployment its vectors came from are read together,
+    # so a query is never embedded for one index and run against another
+    index_name, deployment = SearchIndexAdmin(AZURE_SEARCH_API_URL, AZURE_SEARCH_API_KEY).resolve(name)
+    return index_name, deployment or AZURE_OPENAI_EMBEDDING_DEPLOYMENT
 
+_last_search_target = None
+
+def get_search_target():
+    """Returns (index name, embedding deployment) for the next query."""
+    global _last_search_target
+    if RETRIEVAL_BACKEND == "local" or not search_configured:
+        return AZURE_SEARCH_INDEX_NAME, AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+    try:
+        _last_search_target = resolve_search_index(AZURE_SEARCH_INDEX_NAME)
+        return _last_search_target
+    except Exception as e:
+        # Queries use the GA API version, which does not take an alias, so
+        # the last index it resolved to is the better guess
+        if _last_search_target is not None:
+            logger.warning(f"Could not resolve search index {AZURE_SEARCH_INDEX_NAME}, querying {_last_search_target[0]}: {e}")
+            return _last_search_target
+        logger.warning(f"Could not resolve search index {AZURE_SEARCH_INDEX_NAME}, querying it as is: {e}")
+        return AZURE_SEARCH_INDEX_NAME, AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+
+@st.cache_resource(max_entries=2)
+def get_search_client(index_name: str):
+    return SearchClient(endpoint=AZURE_SEARCH_API_URL,
+                        index_name=index_name,
+                        credential=search_credential,
+                        api_version="2024-07-01")
+
+# Throttled calls are retried by the rate limiters below, which are shared
+# by every session of this server process
 openai_client = AzureOpenAI(
-    api_version="2023-05-15",
+    # stream_options needs 2024-09-01-preview or later
+    api_version="2024-10-21",
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY
+    api_key=AZURE_OPENAI_API_KEY,
+    max_retries=0
 ) if AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY else None
+chat_rate_limiter = get_rate_limiter(AZURE_OPENAI_CHAT_DEPLOYMENT, AZURE_OPENAI_CHAT_TPM, AZURE_OPENAI_CHAT_RPM)
+
+def estimate_tokens(text: str):
+    return len(text) // 4 + 1
+
+@st.cache_resource
+def get_embedding_cache():
+    # One cache per server process, shared by every session and rerun
+    return EmbeddingCache(EMBEDDING_CACHE_PATH)
+
+@st.cache_resource(max_entries=2)
+def get_answer_cache(index_name: str):
+    # One per index: answers, and the query vectors they are keyed by, do
+    # not carry over to an index built with another embedding model
+    return AnswerCache(ANSWER_CACHE_SIMILARITY)
+
+@st.cache_resource
+def get_tokenizer():
+    # The GPT-2 tokenizer the function app chunks with, so context budgets
+    # and chunk sizes are measured the same way
+    try:
+        from tokenizers import Tokenizer
+        return Tokenizer.from_file(TOKENIZER_PATH)
+    except Exception as e:
+        logger.error(f"GPT-2 tokenizer unavailable at {TOKENIZER_PATH}, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str):
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def get_local_index_version():
+    try:
+        return os.path.getmtime(os.path.join(LOCAL_INDEX_PATH, LocalVectorIndex.DOCUMENTS_FILE))
+    except OSError:
+        return None
+
+@st.cache_resource(max_entries=1)
+def get_local_index(version):
+    # Keyed by version so the index is re-opened (memory-mapped, so cheaply)
+    # after the function app writes a new one
+    return LocalVectorIndex(LOCAL_INDEX_PATH, ivf_lists=LOCAL_INDEX_IVF_LISTS)
+
+def get_search_backend(index_name: str):
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index(get_local_index_version())
+    return AzureSearchBackend(get_search_client(index_name), VECTOR_FORMAT)
+
+def get_index_version(index_name: str):
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index_version()
+    # index_name is the concrete index, so a swap of the alias also
+    # starts a new answer cache (get_answer_cache)
+    return get_search_backend(index_name).index_version()
 
 # --- RAG Core Functions ---
 # (Keep get_embedding, search_documents, get_chat_completion functions as they were)
-def get_embedding(text: str):
-    if not all([openai_client, AZURE_OPENAI_EMBEDDING_DEPLOYMENT]):
+def get_embedding(text: str, deployment: str):
+    if not all([openai_client, deployment]):
         st.error("OpenAI Embedding client not configured.")
         return None
+    cache = get_embedding_cache()
+    cached = cache.get(deployment, text)
+    if cached is not None:
+        return cached
     try:
-        return openai_client.embeddings.create(input=[text], model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT).data[0].embedding
+        with telemetry.span("query.embed"):
+            embedding = get_rate_limiter(deployment, AZURE_OPENAI_EMBEDDING_TPM, AZURE_OPENAI_EMBEDDING_RPM).call(
+                lambda: openai_client.embeddings.create(input=[text], model=deployment),
+                tokens=estimate_tokens(text)
+            ).data[0].embedding
+        cache.put(deployment, text, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"Error getting embedding: {e}")
         st.error(f"Failed to generate embedding: {e}")
         return None
 
-def search_documents(query_text: str, top_k: int = 3):
-    if not search_client:
+def search_documents(query_text: str, index_name: str, deployment: str, top_k: int = RETRIEVAL_CANDIDATES):
+    if RETRIEVAL_BACKEND != "local" and not search_configured:
         st.error("Azure Search client not configured.")
         return []
     try:
-        vector = get_embedding(query_text)
+        vector = get_embedding(query_text, deployment)
         if not vector: return []
-        vector_query = {"vector": [float(x) for x in vector], "k": top_k, "fields": "embedding", "kind": "vector"}
-        results = search_client.search(search_text=None, vector_queries=[vector_query], select=["id", "content", "metadata"])
-        return list(results)
+        with telemetry.span("query.search", backend=RETRIEVAL_BACKEND, top_k=top_k):
+            # Embeddings are returned too, for deduplicating the results
+            return get_search_backend(index_name).search(vector, top_k, include_vectors=True)
     except Exception as e:
         logger.error(f"Error searching documents: {e}")
         st.error(f"Azure Search query failed: {e}")
         return []
 
+def build_messages(user_query: str, retrieved_docs: list):
+    system_message = "Answer the user's query using *only* the provided context documents. If the context doesn't contain the answer, state that.\n\nContext Documents:\n---\n"
+    packer = ContextPacker(count_tokens, CONTEXT_TOKEN_BUDGET)
+    with telemetry.span("query.pack", candidates=len(retrieved_docs)) as span:
+        passages = packer.pack(retrieved_docs)
+        span.set_attribute("passages", len(passages))
+    context = "\n---\n".join([packer.format_passage(passage) for passage in passages]) if passages else "No relevant documents found."
+
+    return [{"role": "system", "content": system_message + context}, {"role": "user", "content": user_query}]
+
 def get_chat_completion(user_query: str, retrieved_docs: list):
     if not all([openai_client, AZURE_OPENAI_CHAT_DEPLOYMENT]):
         st.error("OpenAI Chat client not configured.")
         return "Error: Chat client not configured."
 
-    system_message = "Answer the user's query using *only* the provided context documents. If the context doesn't contain the answer, state that.\n\nContext Documents:\n---\n"
-    context = "\n---\n".join([
-        f"Source Page: {json.loads(doc['metadata']).get('source_page', 'N/A') if isinstance(doc['metadata'], str) else doc.get('metadata', {}).get('source_page', 'N/A')}\nContent: {doc['content']}"
-        for doc in retrieved_docs
-    ]) if retrieved_docs else "No relevant documents found."
-
-    messages = [{"role": "system", "content": system_message + context}, {"role": "user", "content": user_query}]
+    messages = build_messages(user_query, retrieved_docs)
     try:
-        response = openai_client.chat.completions.create(model=AZURE_OPENAI_CHAT_DEPLOYMENT, messages=messages)
+        response = chat_rate_limiter.call(
+            lambda: openai_client.chat.completions.create(model=AZURE_OPENAI_CHAT_DEPLOYMENT, messages=messages),
+            tokens=sum(estimate_tokens(message["content"]) for message in messages)
+        )
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Error getting chat completion: {e}")
         st.error(f"Azure OpenAI call failed: {e}")
         return f"Error generating response: {e}"
 
+def stream_chat_completion(user_query: str, retrieved_docs: list, metrics: dict):
+    """Yields the answer as it is generated.
+
+    Fills metrics with time_to_first_token and total_time in seconds, both
+    measured from the moment the request is sent, and sets metrics["error"]
+    when generation fails.
+    """
+    if not all([openai_client, AZURE_OPENAI_CHAT_DEPLOYMENT]):
+        st.error("OpenAI Chat client not configured.")
+        metrics["error"] = True
+        yield "Error: Chat client not configured."
+        return
+
+    messages = build_messages(user_query, retrieved_docs)
+    started = time.perf_counter()
+
+    def send():
+        # Runs once the rate limiter lets the request through, so waiting
+        # for quota is not counted as time to first token
+        nonlocal started
+        started = time.perf_counter()
+        return openai_client.chat.completions.create(
+            model=AZURE_OPENAI_CHAT_DEPLOYMENT,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+    try:
+        stream = chat_rate_limiter.stream(send, tokens=sum(estimate_tokens(message["content"]) for message in messages))
+        # Closed even when the reader stops early, which frees the rate limiter slot
+        with closing(stream):
+            for chunk in stream:
+                # Azure sends content filter results, and the usage at the end,
+                # in chunks without choices
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if "time_to_first_token" not in metrics:
+                    metrics["time_to_first_token"] = time.perf_counter() - started
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        logger.error(f"Error streaming chat completion: {e}")
+        st.error(f"Azure OpenAI call failed: {e}")
+        metrics["error"] = True
+        yield f"Error generating response: {e}"
+    finally:
+        metrics["total_time"] = time.perf_counter() - started
+        if "time_to_first_token" in metrics:
+            telemetry.record(telemetry.TIME_TO_FIRST_TOKEN, metrics["time_to_first_token"])
+            logger.info(f"Chat completion streamed, time to first token: {metrics['time_to_first_token']:.3f}s, total: {metrics['total_time']:.3f}s")
+
+def answer_query(user_query: str):
+    """Answers from the semantic cache when a close enough question has been
+    answered before; identical questions asked at the same time share one
+    backend call.
+
+    Must be called inside the assistant's chat message: with streaming on,
+    a freshly generated answer is written there as it arrives. Returns
+    (answer, metrics, rendered).
+    """
+    # Resolved once, so the whole answer comes from one index
+    index_name, deployment = get_search_target()
+    cache = get_answer_cache(index_name)
+    cache.check_index_version(lambda: get_index_version(index_name))
+    # Only the caller that runs compute() renders while generating; callers
+    # coalesced onto it and cache hits render the finished answer themselves
+    rendered = False
+
+    def compute():
+        nonlocal rendered
+        metrics = {}
+        with st.spinner("Thinking..."):
+            vector = get_embedding(user_query, deployment)
+            if vector:
+                cached = cache.lookup(vector)
+                if cached is not None:
+                    return cached["answer"], {"cached": True}
+            retrieved_docs = search_documents(user_query, index_name, deployment)
+            if not STREAM_CHAT_RESPONSES:
+                started = time.perf_counter()
+                with telemetry.span("query.completion", streaming=False):
+                    response = get_chat_completion(user_query, retrieved_docs)
+                metrics["total_time"] = time.perf_counter() - started
+                metrics["error"] = response.startswith("Error")
+        if STREAM_CHAT_RESPONSES:
+            with telemetry.span("query.completion", streaming=True):
+                response = st.write_stream(stream_chat_completion(user_query, retrieved_docs, metrics))
+            rendered = True
+        # Only answers grounded on retrieved chunks are worth reusing; an
+        # empty result may just be a failed search
+        if vector and retrieved_docs and not metrics.get("error"):
+            cache.put(vector, [doc["id"] for doc in retrieved_docs], response)
+        return response, metrics
+
+    with telemetry.span("query") as span:
+        response, metrics = cache.single_flight.do(normalize_query(user_query), compute)
+        span.set_attribute("cached", bool(metrics.get("cached")))
+    return response, metrics, rendered
+
+def format_metrics(metrics: dict):
+    if metrics.get("cached"):
+        return "Answered from cache"
+    parts = []
+    if "time_to_first_token" in metrics:
+        parts.append(f"First token {metrics['time_to_first_token']:.2f}s")
+    if "total_time" in metrics:
+        parts.append(f"total {metrics['total_time']:.2f}s")
+    return " · ".join(parts)
+
 # --- Blob Storage Interaction Functions ---
 def get_function_headers():
     headers = {"Content-Type": "application/json"}
     if AZURE_FUNCTION_APP_KEY: headers["x-functions-key"] = AZURE_FUNCTION_APP_KEY
     return headers
 
-def fetch_blobs_from_function():
+@st.cache_resource
+def get_blob_list_cache():
+    # Shared by all sessions: {continuation token: (fetched at, ETag, page)}
+    return {}
+
+def fetch_blob_page(continuation_token=None, revalidate=False):
+    """One page of GET /blobs, served from the cache for BLOB_LIST_TTL_SECONDS
+    and then revalidated with its ETag, so an unchanged page costs a 304."""
+    cache = get_blob_list_cache()
+    cached = cache.get(continuation_token)
+    if cached and not revalidate and time.time() - cached[0] < BLOB_LIST_TTL_SECONDS:
+        return cached[2]
+    params = {"limit": BLOB_LIST_PAGE_SIZE}
+    if continuation_token:
+        params["continuation_token"] = continuation_token
+    headers = get_function_headers()
+    if cached and cached[1]:
+        headers["If-None-Match"] = cached[1]
+    response = requests.get(f"{AZURE_FUNCTION_APP_URL}/api/blobs", params=params, headers=headers, timeout=15)
+    if response.status_code == 304 and cached:
+        page = cached[2]
+    else:
+        response.raise_for_status()
+        page = response.json()
+    cache[continuation_token] = (time.time(), response.headers.get("ETag"), page)
+    return page
+
+def fetch_blobs_from_function(page_count=1, revalidate=False):
+    """Names on the first page_count pages, and whether there are more."""
     if not AZURE_FUNCTION_APP_URL:
         st.sidebar.error("Function App URL missing.")
-        return []
-    list_url = f"{AZURE_FUNCTION_APP_URL}/api/blobs"
+        return [], False
     try:
-        response = requests.get(list_url, headers=get_function_headers(), timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        if 'blobs' in data and isinstance(data['blobs'], list):
-            return sorted([blob.get('name', 'Unknown Name') for blob in data['blobs']], key=os.path.basename)
-        else:
-            st.sidebar.warning("API response format incorrect.", icon="⚠️")
-            return []
+        names = []
+        continuation_token = None
+        for _ in range(page_count):
+            data = fetch_blob_page(continuation_token, revalidate)
+            if 'blobs' not in data or not isinstance(data['blobs'], list):
+                st.sidebar.warning("API response format incorrect.", icon="⚠️")
+                return [], False
+            names.extend(blob.get('name', 'Unknown Name') for blob in data['blobs'])
+            continuation_token = data.get('continuation_token')
+            if not continuation_token:
+                break
+        return sorted(names, key=os.path.basename), bool(continuation_token)
     except (requests.exceptions.RequestException, json.JSONDecodeError, Exception) as e:
         logger.error(f"Error fetching blobs: {e}")
         st.sidebar.error(f"Error fetching list: {e}", icon="🚨")
-        return []
+        return [], False
+
+def iter_file_chunks(file, chunk_size=UPLOAD_CHUNK_SIZE):
+    file.seek(0)
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
 
-def upload_blob_to_function(file_bytes, filename):
+def upload_blob_to_function(file, filename):
     if not AZURE_FUNCTION_APP_URL:
         st.sidebar.error("Function App URL missing.")
         return False
-    if not filename or not file_bytes:
+    if not filename or not file.size:
         st.sidebar.warning("File and filename required.", icon="⚠️")
         return False
 
@@ -125,7 +443,9 @@ def upload_blob_to_function(file_bytes, filename):
     try:
         # *** Use shorter spinner text ***
         with st.spinner("Uploading..."):
-            response = requests.post(upload_url, headers=headers, data=file_bytes, timeout=60)
+            # Sent with chunked transfer encoding, a chunk at a time, rather
+            # than as one copy of the whole file
+            response = requests.post(upload_url, headers=headers, data=iter_file_chunks(file), timeout=60)
             response.raise_for_status()
         # Use success message within the sidebar
         st.sidebar.success(f"Uploaded '{filename}'!", icon="✅")
@@ -160,8 +480,8 @@ with st.sidebar:
 
         list_placeholder = st.container()
 
-        def display_simple_blob_list(max_len=25):
-            blob_names = fetch_blobs_from_function()
+        def display_simple_blob_list(max_len=25, revalidate=False):
+            blob_names, has_more = fetch_blobs_from_function(st.session_state.get('blob_pages', 1), revalidate)
             list_placeholder.empty()
             with list_placeholder:
                 if blob_names:
@@ -175,13 +495,16 @@ with st.sidebar:
                         </div>
                         """
                         st.markdown(tooltip_html, unsafe_allow_html=True)
+                    if has_more and st.button("Show more", key="sidebar_more_button"):
+                        st.session_state.blob_pages = st.session_state.get('blob_pages', 1) + 1
+                        st.rerun()
                 else:
                     st.info("No documents indexed.")
 
         # Refresh logic
         if refresh_button:
              if 'blob_list_loaded' in st.session_state: del st.session_state['blob_list_loaded']
-             display_simple_blob_list()
+             display_simple_blob_list(revalidate=True)
              st.session_state.blob_list_loaded = True
         elif 'blob_list_loaded' not in st.session_state:
              display_simple_blob_list()
@@ -204,8 +527,10 @@ with st.sidebar:
         # *** Upload button appears *below* uploader when file is selected ***
         if uploaded_file is not None:
             if st.button(f"⬆️ Upload", key="sidebar_upload_button", help=f"Upload {uploaded_file.name}"):
-                success = upload_blob_to_function(uploaded_file.getvalue(), uploaded_file.name)
+                success = upload_blob_to_function(uploaded_file, uploaded_file.name)
                 if success:
+                    get_answer_cache(get_search_target()[0]).clear()
+                    get_blob_list_cache().clear()
                     if 'blob_list_loaded' in st.session_state: del st.session_state['blob_list_loaded']
                     st.rerun()
 
@@ -219,19 +544,22 @@ if "messages" not in st.session_state:
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("metrics"):
+            st.caption(format_metrics(message["metrics"]))
 
 if prompt := st.chat_input("Ask a question"):
-    if not all([search_client, openai_client, AZURE_OPENAI_CHAT_DEPLOYMENT]):
+    if not all([search_configured or RETRIEVAL_BACKEND == "local", openai_client, AZURE_OPENAI_CHAT_DEPLOYMENT]):
          st.error("Application is not fully configured.")
     else:
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        with st.spinner("Thinking..."):
-            retrieved_docs = search_documents(prompt)
-            response = get_chat_completion(prompt, retrieved_docs)
-
-        st.session_state.messages.append({"role": "assistant", "content": response})
         with st.chat_message("assistant"):
-            st.markdown(response)
\ No newline at end of file
+            response, metrics, rendered = answer_query(prompt)
+            if not rendered:
+                st.markdown(response)
+            if metrics:
+                st.caption(format_metrics(metrics))
+
+        st.session_state.messages.append({"role": "assistant", "content": response, "metrics": metrics})
\ No newline at end of file
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timezone
+from azure.core.exceptions import HttpResponseError
+import telemetry
+from searchbackend import SearchBackend
+from vectorformat import encode_vector, vector_values
+
+class AzureSearchBackend(SearchBackend):
+    """SearchBackend over an Azure AI Search index, through the SDK's SearchClient.
+
+    The web UI counterpart of the function app's AzureSearchIndexer: it
+    stores documents in the same shape, so either app can read what the
+    other wrote.
+    """
+
+    SEARCH_FIELDS = ["id", "content", "metadata", "source"]
+    INDEXED_AT_FIELD = "indexed_at"
+
+    def __init__(self, search_client, vector_format: str = "float32", stamp_documents: bool = False):
+        self.search_client = search_client
+        # Query vectors are sent in the format of the index's embedding field
+        self.vector_format = vector_format
+        # As for AzureSearchIndexer: only for indexes with an indexed_at field
+        self.stamp_documents = stamp_documents
+
+    def index_documents(self, chunks, embeddings):
+        indexed_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds") if self.stamp_documents else None
+        documents = []
+        for chunk, embedding in zip(chunks, embeddings):
+            document = dict(chunk, embedding=vector_values(encode_vector(embedding, self.vector_format)))
+            if isinstance(document.get("metadata"), dict):
+                document["metadata"] = json.dumps(document["metadata"])
+            if indexed_at:
+                document[self.INDEXED_AT_FIELD] = indexed_at
+            documents.append(document)
+        with telemetry.span("search.index", documents=len(documents)):
+            return self.__failures(self.search_client.upload_documents(documents))
+
+    def delete_documents(self, keys):
+        with telemetry.span("search.delete", documents=len(keys)):
+            return self.__failures(self.search_client.delete_documents([{"id": key} for key in keys]))
+
+    def get_document_ids(self, source):
+        escaped_source = source.replace("'", "''")
+        results = self.search_client.search(search_text="*", filter=f"source eq '{escaped_source}'", select=["id"])
+        return [document["id"] for document in results]
+
+    def search(self, vector, top_k=3, include_vectors=False):
+        """Like SearchBackend.search; include_vectors also returns each
+        document's "embedding", for deduplicating the results."""
+        vector_query = {
+            "kind": "vector",
+            "vector": vector_values(encode_vector(vector, self.vector_format)),
+            "k": top_k,
+            "fields": "embedding"
+        }
+        select = self.SEARCH_FIELDS + ["embedding"] if include_vectors else self.SEARCH_FIELDS
+        with telemetry.span("search.query", top_k=top_k, backend="azure"):
+            return list(self.search_client.search(search_text=None, vector_queries=[vector_query], select=select, top=top_k))
+
+    def index_version(self):
+        """Returns (document count, latest indexed_at), which changes on every
+        write: the count catches deletes, the stamp uploads that replace
+        documents one for one. Indexes without the field give (count, None)."""
+        count = self.search_client.get_document_count()
+        try:
+            results = self.search_client.search(search_text="*", order_by=[f"{self.INDEXED_AT_FIELD} desc"], select=[self.INDEXED_AT_FIELD], top=1)
+            latest = next(iter(results), {}).get(self.INDEXED_AT_FIELD)
+        except HttpResponseError:
+            latest = None
+        return count, latest
+
+    def __failures(self, results):
+        return {result.key: result.error_message for result in results if not result.succeeded}
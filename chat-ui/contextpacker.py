@@ -0,0 +1,179 @@
+import json
+import logging
+import numpy as np
+
+def document_metadata(doc):
+    metadata = doc.get("metadata") or {}
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except json.JSONDecodeError:
+            metadata = {}
+    return metadata
+
+# Shorter overlaps are kept twice rather than merged on what could be a
+# coincidental match
+MIN_OVERLAP_CHARS = 16
+
+def merge_overlap(first, second):
+    """Joins two consecutive chunks, keeping the text they share only once.
+
+    Chunks are cut from the page text at token offsets and stripped, so the
+    overlap is a suffix of the first chunk and a prefix of the second; the
+    longest one is kept once.
+    """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) == MIN_OVERLAP_CHARS:
+        # The overlap is never longer than the second chunk
+        start = first.find(probe, max(0, len(first) - len(second)))
+        while start >= 0:
+            if second.startswith(first[start:]):
+                return first + second[len(first) - start:]
+            start = first.find(probe, start + 1)
+    return first + " " + second
+
+class ContextPacker:
+    """Turns search results into the passages sent to the chat model.
+
+    Keeps the results whose scores stay close to the best one, drops near
+    duplicates by embedding similarity (MMR), merges consecutive chunks of
+    the same page into one passage without their overlap, and packs as many
+    passages as the token budget holds, skipping those that would overrun it.
+    """
+
+    TOKEN_BUDGET = 3000
+    MIN_K = 1
+    MAX_K = 8
+    # A drop of more than SCORE_GAP between neighbouring scores, or of more
+    # than MAX_SCORE_SPREAD below the best, ends the list of useful results
+    SCORE_GAP = 0.05
+    MAX_SCORE_SPREAD = 0.15
+    # Relevance against novelty in MMR ordering
+    MMR_LAMBDA = 0.7
+    DUPLICATE_SIMILARITY = 0.97
+    PASSAGE_TEMPLATE = "Source Page: {page}\nContent: {content}"
+
+    def __init__(self, count_tokens=None, token_budget=None):
+        # Should be the tokenizer the chunks were cut with, so budgets line
+        # up with CHUNK_SIZE; falls back to a rough estimate
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4 + 1)
+        self.token_budget = token_budget or self.TOKEN_BUDGET
+
+    def pack(self, docs):
+        """Returns passages as dicts with content, source, pages, ids and score, best first."""
+        docs = self.select_adaptive_k(sorted(docs, key=lambda doc: doc.get("@search.score", 0.0), reverse=True))
+        docs = self.remove_near_duplicates(docs)
+        passages = self.merge_adjacent(docs)
+        return self.fit_budget(passages)
+
+    def select_adaptive_k(self, docs):
+        if not docs:
+            return docs
+        scores = [doc.get("@search.score", 0.0) for doc in docs]
+        k = 1
+        while k < min(len(docs), self.MAX_K):
+            if k >= self.MIN_K and (scores[k - 1] - scores[k] > self.SCORE_GAP or scores[0] - scores[k] > self.MAX_SCORE_SPREAD):
+                break
+            k += 1
+        return docs[:k]
+
+    def remove_near_duplicates(self, docs):
+        """Orders docs by maximal marginal relevance and drops near duplicates.
+
+        Needs each doc's "embedding"; docs are returned as they are when any
+        is missing.
+        """
+        if len(docs) < 2 or any(doc.get("embedding") is None for doc in docs):
+            return docs
+        vectors = np.asarray([doc["embedding"] for doc in docs], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+        scores = np.asarray([doc.get("@search.score", 0.0) for doc in docs], dtype=np.float32)
+
+        selected = [0]
+        remaining = list(range(1, len(docs)))
+        while remaining:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            keep = redundancy < self.DUPLICATE_SIMILARITY
+            if not keep.all():
+                logging.debug(f"Dropping {int((~keep).sum())} near-duplicate chunks")
+            remaining = [i for i, kept in zip(remaining, keep) if kept]
+            redundancy = redundancy[keep]
+            if not remaining:
+                break
+            mmr = self.MMR_LAMBDA * scores[remaining] - (1 - self.MMR_LAMBDA) * redundancy
+            best = remaining[int(np.argmax(mmr))]
+            selected.append(best)
+            remaining.remove(best)
+        return [docs[i] for i in selected]
+
+    def merge_adjacent(self, docs):
+        """Folds consecutive chunks of the same page into one passage, placed
+        at the rank of its best chunk."""
+        passages = []
+        by_page = {}
+        for doc in docs:
+            metadata = document_metadata(doc)
+            page_key = (doc.get("source"), metadata.get("source_page"))
+            passage = {
+                "content": doc.get("content", ""),
+                "source": doc.get("source"),
+                "page": metadata.get("source_page", "N/A"),
+                "ids": [doc.get("id")],
+                "score": doc.get("@search.score", 0.0),
+                "chunks": [(metadata.get("chunk_index"), doc.get("content", ""))]
+            }
+            if metadata.get("chunk_index") is None or page_key not in by_page:
+                passages.append(passage)
+                if metadata.get("chunk_index") is not None:
+                    by_page[page_key] = passage
+                continue
+            existing = by_page[page_key]
+            existing["chunks"].append(passage["chunks"][0])
+            existing["ids"].extend(passage["ids"])
+
+        for passage in passages:
+            chunks = sorted(passage.pop("chunks"), key=lambda chunk: chunk[0] if chunk[0] is not None else -1)
+            parts = []
+            content, last_index = chunks[0][1], chunks[0][0]
+            for index, text in chunks[1:]:
+                if last_index is not None and index == last_index + 1:
+                    content = merge_overlap(content, text)
+                else:
+                    parts.append(content)
+                    content = text
+                last_index = index
+            parts.append(content)
+            passage["content"] = "\n...\n".join(parts)
+        return passages
+
+    def fit_budget(self, passages):
+        """Keeps passages in rank order while they fit the token budget,
+        skipping any that would overrun it."""
+        packed = []
+        remaining = self.token_budget
+        for passage in passages:
+            tokens = self.count_tokens(self.format_passage(passage))
+            if tokens <= remaining:
+                packed.append(passage)
+                remaining -= tokens
+            elif not packed:
+                # Even the best passage is too long: send as much of it as fits
+                packed.append(self.__truncate(passage, remaining))
+                break
+        return packed
+
+    def format_passage(self, passage):
+        return self.PASSAGE_TEMPLATE.format(page=passage["page"], content=passage["content"])
+
+    def __truncate(self, passage, budget):
+        content = passage["content"]
+        low, high = 0, len(content)
+        # Token counts grow with text length, so bisect on characters
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(self.format_passage(dict(passage, content=content[:middle]))) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return dict(passage, content=content[:low])
@@ -0,0 +1,253 @@
+# Copy of function-app/src/localvectorindex.py; the web UI is deployed on its own and
+# cannot import from the function app package. tests/test_copies.py fails when the two drift apart.
+import json
+import logging
+import os
+import threading
+import numpy as np
+import telemetry
+from searchbackend import SearchBackend
+
+class LocalVectorIndex(SearchBackend):
+    """In-process vector index: one contiguous float32 matrix of unit-length
+    embeddings searched with a single matrix-vector product.
+
+    With ivf_lists set, corpora of IVF_MIN_DOCUMENTS or more are partitioned
+    by k-means into that many lists on flush() and a query only scores the
+    rows of its nprobe closest lists. With a path, the index is kept on disk as .npy
+    files that are memory-mapped on load, so opening a large index costs
+    no reads until it is searched.
+    """
+
+    INITIAL_CAPACITY = 1024
+    # Below this, scoring every row is faster than probing partitions
+    IVF_MIN_DOCUMENTS = 20000
+    IVF_TRAIN_ITERATIONS = 10
+    IVF_TRAIN_SAMPLES_PER_LIST = 64
+    DEFAULT_NPROBE = 8
+    # Rows scored per step when assigning rows to lists, bounds scratch memory
+    ASSIGN_BLOCK_ROWS = 8192
+
+    VECTORS_FILE = "vectors.npy"
+    DOCUMENTS_FILE = "documents.json"
+    CENTROIDS_FILE = "centroids.npy"
+    ASSIGNMENTS_FILE = "assignments.npy"
+
+    def __init__(self, path: str = None, ivf_lists: int = None, nprobe: int = None):
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe or self.DEFAULT_NPROBE
+        self.lock = threading.RLock()
+        self.vectors = None
+        self.assignments = None
+        self.centroids = None
+        self.trained_count = 0
+        self.count = 0
+        self.documents = []
+        self.positions = {}
+        self.version = 0
+        self.dirty = False
+        if path and os.path.exists(os.path.join(path, self.DOCUMENTS_FILE)):
+            self.__load()
+
+    def __len__(self):
+        with self.lock:
+            return self.count
+
+    @property
+    def dimensions(self):
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    def index_documents(self, chunks, embeddings):
+        failed = {}
+        with self.lock:
+            for chunk, embedding in zip(chunks, embeddings):
+                vector = self.__unit(embedding)
+                if self.vectors is not None and vector.shape[0] != self.dimensions:
+                    failed[chunk["id"]] = f"Expected {self.dimensions} dimensions, got {vector.shape[0]}"
+                    continue
+                row = self.positions.get(chunk["id"])
+                if row is None:
+                    row = self.count
+                    self.__reserve(row + 1, vector.shape[0])
+                    self.positions[chunk["id"]] = row
+                    self.documents.append(None)
+                    self.count += 1
+                else:
+                    self.__reserve(self.count, vector.shape[0])
+                self.vectors[row] = vector
+                self.documents[row] = {
+                    "id": chunk["id"],
+                    "source": chunk.get("source"),
+                    "content": chunk.get("content"),
+                    "metadata": chunk.get("metadata")
+                }
+                if self.centroids is not None:
+                    self.assignments[row] = int(np.argmax(self.centroids @ vector))
+            self.__changed()
+        for key, error in failed.items():
+            logging.error(f"Failed to index document {key}: {error}")
+        return failed
+
+    def delete_documents(self, keys):
+        with self.lock:
+            for key in keys:
+                row = self.positions.pop(key, None)
+                if row is None:
+                    continue
+                self.__reserve(self.count, self.dimensions)
+                # Move the last row into the gap so the matrix stays contiguous
+                last = self.count - 1
+                if row != last:
+                    self.vectors[row] = self.vectors[last]
+                    self.assignments[row] = self.assignments[last]
+                    self.documents[row] = self.documents[last]
+                    self.positions[self.documents[row]["id"]] = row
+                self.documents.pop()
+                self.count -= 1
+            self.__changed()
+        return {}
+
+    def get_document_ids(self, source):
+        with self.lock:
+            return [document["id"] for document in self.documents if document.get("source") == source]
+
+    def search(self, vector, top_k=3, nprobe=None, include_vectors=False):
+        with telemetry.span("search.query", top_k=top_k, backend="local"):
+            return self.__search(vector, top_k, nprobe, include_vectors)
+
+    def __search(self, vector, top_k, nprobe, include_vectors):
+        query = self.__unit(vector)
+        with self.lock:
+            if not self.count:
+                return []
+            rows = None
+            # Searches only read: lists are trained by flush(), and until
+            # then every row is scored
+            if self.ivf_lists and self.centroids is not None and self.count >= self.IVF_MIN_DOCUMENTS:
+                probes = np.argsort(self.centroids @ query)[-(nprobe or self.nprobe):]
+                rows = np.flatnonzero(np.isin(self.assignments[:self.count], probes))
+                scores = self.vectors[rows] @ query
+            else:
+                scores = self.vectors[:self.count] @ query
+            k = min(top_k, len(scores))
+            if not k:
+                return []
+            best = np.argpartition(scores, -k)[-k:]
+            best = best[np.argsort(scores[best])[::-1]]
+            results = []
+            for i in best:
+                row = rows[i] if rows is not None else i
+                document = dict(self.documents[row])
+                document["@search.score"] = float(scores[i])
+                if include_vectors:
+                    document["embedding"] = self.vectors[row].tolist()
+                results.append(document)
+            return results
+
+    def train_ivf(self):
+        """Partitions the current rows into ivf_lists lists with spherical k-means."""
+        with self.lock:
+            lists = min(self.ivf_lists, self.count)
+            rng = np.random.default_rng(0)
+            sample_size = min(self.count, lists * self.IVF_TRAIN_SAMPLES_PER_LIST)
+            sample = self.vectors[np.sort(rng.choice(self.count, sample_size, replace=False))]
+            centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+            for _ in range(self.IVF_TRAIN_ITERATIONS):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for j in range(lists):
+                    members = sample[labels == j]
+                    if len(members):
+                        centroids[j] = members.sum(axis=0)
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            self.__reserve(self.count, self.dimensions)
+            for start in range(0, self.count, self.ASSIGN_BLOCK_ROWS):
+                stop = min(start + self.ASSIGN_BLOCK_ROWS, self.count)
+                self.assignments[start:stop] = np.argmax(self.vectors[start:stop] @ centroids.T, axis=1)
+            self.centroids = centroids
+            self.trained_count = self.count
+            self.dirty = True
+            logging.info(f"Partitioned {self.count} vectors into {lists} lists")
+
+    def flush(self):
+        """Trains the IVF lists once the index has doubled since they were
+        last trained, then writes pending changes to path. The writer pays
+        for training, so no query waits on it."""
+        with self.lock:
+            if self.__needs_training():
+                self.train_ivf()
+            if self.path and self.dirty:
+                self.save(self.path)
+
+    def save(self, path):
+        """Writes the index to a directory; the document list is written last
+        so a reader never sees documents without their vectors."""
+        with self.lock:
+            os.makedirs(path, exist_ok=True)
+            vectors = self.vectors[:self.count] if self.vectors is not None else np.empty((0, 0), dtype=np.float32)
+            self.__write_array(path, self.VECTORS_FILE, vectors)
+            if self.centroids is not None:
+                self.__write_array(path, self.CENTROIDS_FILE, self.centroids)
+                self.__write_array(path, self.ASSIGNMENTS_FILE, self.assignments[:self.count])
+            manifest = {
+                "count": self.count,
+                "ivf_lists": self.ivf_lists,
+                "trained_count": self.trained_count if self.centroids is not None else 0,
+                "documents": self.documents
+            }
+            temp_path = os.path.join(path, self.DOCUMENTS_FILE + ".tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, os.path.join(path, self.DOCUMENTS_FILE))
+            if path == self.path:
+                self.dirty = False
+
+    def __load(self):
+        with open(os.path.join(self.path, self.DOCUMENTS_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.count = manifest["count"]
+        self.documents = manifest["documents"]
+        self.positions = {document["id"]: row for row, document in enumerate(self.documents)}
+        self.ivf_lists = self.ivf_lists or manifest.get("ivf_lists")
+        if self.count:
+            self.vectors = np.load(os.path.join(self.path, self.VECTORS_FILE), mmap_mode="r")
+        if manifest.get("trained_count"):
+            self.centroids = np.load(os.path.join(self.path, self.CENTROIDS_FILE))
+            self.assignments = np.load(os.path.join(self.path, self.ASSIGNMENTS_FILE), mmap_mode="r")
+            self.trained_count = manifest["trained_count"]
+        elif self.count:
+            self.assignments = np.zeros(self.count, dtype=np.int32)
+
+    def __write_array(self, path, name, array):
+        temp_path = os.path.join(path, name + ".tmp.npy")
+        np.save(temp_path, np.ascontiguousarray(array))
+        os.replace(temp_path, os.path.join(path, name))
+
+    def __reserve(self, rows, dimensions):
+        """Makes the matrices writable with room for rows, growing by doubling."""
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        writable = self.vectors is not None and not isinstance(self.vectors, np.memmap)
+        if writable and rows <= capacity:
+            return
+        new_capacity = max(rows, self.INITIAL_CAPACITY, 2 * capacity if rows > capacity else capacity)
+        vectors = np.empty((new_capacity, dimensions), dtype=np.float32)
+        assignments = np.zeros(new_capacity, dtype=np.int32)
+        if self.count:
+            vectors[:self.count] = self.vectors[:self.count]
+            assignments[:self.count] = self.assignments[:self.count]
+        self.vectors = vectors
+        self.assignments = assignments
+
+    def __needs_training(self):
+        if not self.ivf_lists or self.count < self.IVF_MIN_DOCUMENTS:
+            return False
+        return self.centroids is None or self.count >= 2 * self.trained_count
+
+    def __changed(self):
+        self.version += 1
+        self.dirty = True
+
+    def __unit(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
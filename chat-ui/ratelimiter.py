@@ -0,0 +1,262 @@
+# Copy of function-app/src/ratelimiter.py; the web UI is deployed on its own and
+# cannot import from the function app package. tests/test_copies.py fails when the two drift apart.
+import asyncio
+import logging
+import threading
+import time
+import telemetry
+
+_shared_limiters = {}
+_shared_limiters_lock = threading.Lock()
+
+def is_throttled(error):
+    """True for 429 responses, whichever client raised them."""
+    return getattr(error, "status_code", None) == 429
+
+def is_transient(error):
+    """True for server-side failures that are worth repeating as they are."""
+    return getattr(error, "status_code", None) in (408, 500, 502, 503, 504)
+
+def retry_after_seconds(error):
+    """Reads the server's requested delay from a throttled response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class _TokenBucket:
+
+    def __init__(self, per_minute, burst_seconds, now):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        # A request larger than the whole bucket goes through once the bucket
+        # is full, otherwise it could never be sent
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+class RateLimiter:
+    """Client-side scheduler for one Azure OpenAI deployment.
+
+    Keeps calls under the deployment's tokens-per-minute and
+    requests-per-minute quotas with two token buckets, pauses every caller
+    when the service answers 429 with Retry-After, and adapts how many calls
+    may be in flight at once: the limit grows by one per round of successful
+    calls and halves on throttling (AIMD). Safe to share between threads and
+    asyncio tasks.
+    """
+
+    INITIAL_CONCURRENCY = 4
+    MIN_CONCURRENCY = 1
+    MAX_CONCURRENCY = 32
+    # Azure enforces quotas over short windows, so only this many seconds of
+    # quota may be spent in a single burst
+    BURST_SECONDS = 10
+    MAX_RETRIES = 6
+    DEFAULT_RETRY_AFTER_SECONDS = 1.0
+    TRANSIENT_BACKOFF_SECONDS = 0.5
+    # How often a caller waiting for a free slot checks again when it is
+    # not woken by release() (asyncio callers are never woken)
+    SLOT_POLL_SECONDS = 0.05
+
+    def __init__(
+            self,
+            tokens_per_minute: int = None,
+            requests_per_minute: int = None,
+            max_concurrency: int = None,
+            clock = time.monotonic,
+            name: str = None
+        ):
+        # Names the deployment in metrics
+        self.name = name or "default"
+        self.clock = clock
+        now = clock()
+        self.tokens = _TokenBucket(tokens_per_minute, self.BURST_SECONDS, now) if tokens_per_minute else None
+        self.requests = _TokenBucket(requests_per_minute, self.BURST_SECONDS, now) if requests_per_minute else None
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self.concurrency = float(min(self.INITIAL_CONCURRENCY, self.max_concurrency))
+        self.in_flight = 0
+        self.blocked_until = now
+        self.last_decrease = now
+        self.throttled_count = 0
+        self.condition = threading.Condition()
+
+    def try_acquire(self, tokens=0):
+        """Takes capacity for one call without blocking.
+
+        Returns (permit, 0) when the call may go ahead, else (None, seconds
+        to wait before trying again).
+        """
+        with self.condition:
+            now = self.clock()
+            wait = self.blocked_until - now
+            if wait > 0:
+                return None, wait
+            if self.in_flight >= int(self.concurrency):
+                return None, self.SLOT_POLL_SECONDS
+            for bucket in (self.tokens, self.requests):
+                if bucket is not None:
+                    bucket.refill(now)
+            wait = max(
+                self.tokens.wait_for(tokens) if self.tokens else 0.0,
+                self.requests.wait_for(1) if self.requests else 0.0
+            )
+            if wait > 0:
+                return None, wait
+            if self.tokens:
+                self.tokens.level -= tokens
+            if self.requests:
+                self.requests.level -= 1
+            self.in_flight += 1
+            return (tokens, now), 0.0
+
+    def acquire(self, tokens=0):
+        with self.condition:
+            while True:
+                permit, wait = self.try_acquire(tokens)
+                if permit is not None:
+                    return permit
+                self.condition.wait(wait)
+
+    async def acquire_async(self, tokens=0):
+        while True:
+            permit, wait = self.try_acquire(tokens)
+            if permit is not None:
+                return permit
+            await asyncio.sleep(wait)
+
+    def release(self, permit, succeeded=True, throttled=False, retry_after=None, tokens_used=None):
+        tokens, started = permit
+        with self.condition:
+            now = self.clock()
+            self.in_flight -= 1
+            if tokens_used is not None and self.tokens is not None:
+                # Settle the estimate against what the service actually counted
+                self.tokens.level -= tokens_used - tokens
+            if throttled:
+                self.throttled_count += 1
+                self.blocked_until = max(self.blocked_until, now + (retry_after or self.DEFAULT_RETRY_AFTER_SECONDS))
+                # Calls that started before the last cut were already in
+                # flight when it happened and must not cut the limit again
+                if started >= self.last_decrease:
+                    self.concurrency = max(float(self.MIN_CONCURRENCY), self.concurrency / 2)
+                    self.last_decrease = now
+                    logging.warning(f"Throttled by Azure OpenAI, concurrency lowered to {int(self.concurrency)}")
+            elif succeeded:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            self.condition.notify_all()
+
+    def call(self, request, tokens=0):
+        """Runs request() under the limiter, retrying throttled and transient failures.
+
+        Other errors are raised straight away; a call still failing after
+        MAX_RETRIES attempts raises the last error.
+        """
+        permit, response = self.__send(request, tokens)
+        self.release(permit, tokens_used=self.__tokens_used(response))
+        return response
+
+    def stream(self, request, tokens=0):
+        """Counterpart of call() for streamed responses: request() returns an
+        iterable of chunks, which are yielded as they arrive.
+
+        The call holds its slot until the stream is exhausted or closed, and
+        the estimate is settled against the usage reported by the last chunk
+        that has one (chat completions send it when created with
+        stream_options={"include_usage": True}). Only opening the stream is
+        retried.
+        """
+        permit, response = self.__send(request, tokens)
+        tokens_used = None
+        succeeded = False
+        try:
+            for chunk in response:
+                tokens_used = self.__tokens_used(chunk) or tokens_used
+                yield chunk
+            succeeded = True
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+            self.release(permit, succeeded=succeeded, tokens_used=tokens_used)
+
+    def __send(self, request, tokens):
+        # Returns the permit still held, with the response
+        for attempt in range(self.MAX_RETRIES + 1):
+            waited = time.perf_counter()
+            permit = self.acquire(tokens)
+            telemetry.record(telemetry.RATE_LIMIT_WAIT, time.perf_counter() - waited, limiter=self.name)
+            try:
+                response = request()
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.release(permit, succeeded=False, throttled=throttled, retry_after=retry_after_seconds(e))
+                if throttled:
+                    telemetry.count(telemetry.THROTTLES, limiter=self.name)
+                if not (throttled or is_transient(e)) or attempt == self.MAX_RETRIES:
+                    raise
+                telemetry.count(telemetry.RETRIES, limiter=self.name)
+                if not throttled:
+                    time.sleep(self.TRANSIENT_BACKOFF_SECONDS * 2 ** attempt)
+                continue
+            return permit, response
+
+    async def call_async(self, request, tokens=0):
+        """Awaitable counterpart of call(); request() returns an awaitable."""
+        for attempt in range(self.MAX_RETRIES + 1):
+            waited = time.perf_counter()
+            permit = await self.acquire_async(tokens)
+            telemetry.record(telemetry.RATE_LIMIT_WAIT, time.perf_counter() - waited, limiter=self.name)
+            try:
+                response = await request()
+            except BaseException as e:
+                throttled = is_throttled(e)
+                self.release(permit, succeeded=False, throttled=throttled, retry_after=retry_after_seconds(e))
+                if throttled:
+                    telemetry.count(telemetry.THROTTLES, limiter=self.name)
+                if not (throttled or is_transient(e)) or attempt == self.MAX_RETRIES:
+                    raise
+                telemetry.count(telemetry.RETRIES, limiter=self.name)
+                if not throttled:
+                    await asyncio.sleep(self.TRANSIENT_BACKOFF_SECONDS * 2 ** attempt)
+                continue
+            self.release(permit, tokens_used=self.__tokens_used(response))
+            return response
+
+    def stats(self):
+        with self.condition:
+            return {
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled_count
+            }
+
+    def __tokens_used(self, response):
+        usage = getattr(response, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        return total if isinstance(total, int) else None
+
+def get_rate_limiter(name, tokens_per_minute=None, requests_per_minute=None, max_concurrency=None):
+    """Returns the process-wide limiter for a deployment, creating it on first use.
+
+    Every caller that talks to the same deployment must go through the same
+    limiter, otherwise each would spend the whole quota on its own.
+    """
+    with _shared_limiters_lock:
+        if name not in _shared_limiters:
+            _shared_limiters[name] = RateLimiter(tokens_per_minute, requests_per_minute, max_concurrency, name=name)
+        return _shared_limiters[name]
@@ -0,0 +1,33 @@
+# Copy of function-app/src/searchbackend.py; the web UI is deployed on its own and
+# cannot import from the function app package. tests/test_copies.py fails when the two drift apart.
+from abc import ABC, abstractmethod
+
+class SearchBackend(ABC):
+    """What the ingestion pipeline and the chat UI need from a vector index.
+
+    Documents are chunk records as produced by PDFProcessor (id, source,
+    content, metadata) plus their embedding.
+    """
+
+    @abstractmethod
+    def index_documents(self, chunks, embeddings):
+        """Adds or replaces documents. Returns {key: error} for documents that could not be indexed."""
+
+    @abstractmethod
+    def delete_documents(self, keys):
+        """Removes documents by key. Returns failures like index_documents."""
+
+    @abstractmethod
+    def get_document_ids(self, source):
+        """Returns the keys of every indexed chunk of the given source document."""
+
+    @abstractmethod
+    def search(self, vector, top_k=3):
+        """Returns the top_k documents closest to vector, best first.
+
+        Each result carries id, content, metadata and its similarity under
+        "@search.score".
+        """
+
+    def flush(self):
+        """Makes every change durable; a no-op for backends that persist on write."""
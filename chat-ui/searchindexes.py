@@ -0,0 +1,129 @@
+# Copy of function-app/src/searchindexes.py; the web UI is deployed on its own and
+# cannot import from the function app package. tests/test_copies.py fails when the two drift apart.
+"""Index and alias administration for Azure AI Search.
+
+The apps name an alias (AZURE_SEARCH_INDEX_NAME) rather than a concrete
+index, so the index behind it can be rebuilt next to the live one and
+swapped in with a single request. Each index records the embedding
+deployment its vectors came from as the azureOpenAI vectorizer of its
+embedding field; resolve() hands back both, so a reader never embeds a
+query with one model and searches vectors of another.
+
+Indexes created from infra/modules/ai_search also have an indexed_at
+field, which the indexers stamp on every document they write; the latest
+stamp tells readers when the index last changed.
+"""
+import copy
+import requests
+
+EMBEDDING_FIELD = "embedding"
+INDEXED_AT_FIELD = "indexed_at"
+
+def has_field(definition, name):
+    return any(field["name"] == name for field in definition.get("fields", []))
+
+def embedding_deployment(definition):
+    """Returns the deployment recorded on the embedding field's vectorizer, or None."""
+    vector_search = definition.get("vectorSearch") or {}
+    field = next((field for field in definition.get("fields", []) if field["name"] == EMBEDDING_FIELD), None)
+    if field is None:
+        return None
+    profile = next((profile for profile in vector_search.get("profiles", []) if profile["name"] == field.get("vectorSearchProfile")), None)
+    if profile is None or not profile.get("vectorizer"):
+        return None
+    for vectorizer in vector_search.get("vectorizers") or []:
+        if vectorizer["name"] == profile["vectorizer"] and vectorizer.get("kind") == "azureOpenAI":
+            return vectorizer.get("azureOpenAIParameters", {}).get("deploymentId")
+    return None
+
+def versioned_definition(definition, name, deployment=None, resource_uri=None, model_name=None, dimensions=None):
+    """Copies an index definition under a new name, optionally for the
+    embeddings of another deployment (and model, and vector size)."""
+    definition = copy.deepcopy(definition)
+    for key in [key for key in definition if key.startswith("@odata.")]:
+        del definition[key]
+    definition["name"] = name
+    field = next(field for field in definition["fields"] if field["name"] == EMBEDDING_FIELD)
+    if dimensions:
+        field["dimensions"] = dimensions
+    if deployment:
+        # The index has one vector field, so its vectorizer is the only one
+        vector_search = definition.setdefault("vectorSearch", {})
+        profile = next(profile for profile in vector_search["profiles"] if profile["name"] == field["vectorSearchProfile"])
+        profile["vectorizer"] = f"{name}-vectorizer"
+        vector_search["vectorizers"] = [{
+            "name": profile["vectorizer"],
+            "kind": "azureOpenAI",
+            "azureOpenAIParameters": {
+                "resourceUri": resource_uri,
+                "deploymentId": deployment,
+                "modelName": model_name or deployment
+            }
+        }]
+    return definition
+
+class SearchIndexAdmin:
+    API_VERSION = "2024-07-01"
+    # Aliases are only in the preview API versions
+    ALIAS_API_VERSION = "2024-05-01-preview"
+
+    def __init__(self, search_api_url: str, search_api_key: str, session: requests.Session = None, timeout=(5, 60)):
+        self.search_api_url = search_api_url
+        self.search_api_key = search_api_key
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def __request(self, method, path, api_version=None, json=None, headers=None):
+        return self.session.request(
+            method,
+            f"{self.search_api_url}/{path}?api-version={api_version or self.API_VERSION}",
+            headers={"Content-Type": "application/json", "api-key": self.search_api_key, **(headers or {})},
+            json=json,
+            timeout=self.timeout
+        )
+
+    def get_index(self, name):
+        """Returns the definition of an index, or None."""
+        response = self.__request("GET", f"indexes/{name}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def create_index(self, definition):
+        """Creates an index; an existing one of the same name is never replaced."""
+        response = self.__request("PUT", f"indexes/{definition['name']}", json=definition, headers={"If-None-Match": "*"})
+        if response.status_code == 412:
+            raise ValueError(f"Index {definition['name']} already exists")
+        response.raise_for_status()
+
+    def count_documents(self, name):
+        response = self.__request("GET", f"indexes/{name}/docs/$count")
+        response.raise_for_status()
+        return int(response.text.lstrip("\ufeff"))
+
+    def get_alias(self, name):
+        """Returns the index an alias points to, or None if there is no such alias."""
+        response = self.__request("GET", f"aliases/{name}", self.ALIAS_API_VERSION)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["indexes"][0]
+
+    def set_alias(self, name, index_name):
+        """Points an alias at an index, creating it if need be. Requests
+        through the alias go to the new index from then on."""
+        response = self.__request("PUT", f"aliases/{name}", self.ALIAS_API_VERSION, json={"name": name, "indexes": [index_name]})
+        response.raise_for_status()
+
+    def describe(self, name):
+        """Returns (index name, definition) for an alias or index name; the
+        definition is None when there is no such index."""
+        index_name = self.get_alias(name) or name
+        return index_name, self.get_index(index_name)
+
+    def resolve(self, name):
+        """Returns (index name, embedding deployment) for an alias or index
+        name; the deployment is None when the index does not record one."""
+        index_name, definition = self.describe(name)
+        return index_name, definition and embedding_deployment(definition)
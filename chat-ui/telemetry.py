@@ -0,0 +1,265 @@
+# Copy of function-app/src/telemetry.py; the web UI is deployed on its own and
+# cannot import from the function app package. tests/test_copies.py fails when the two drift apart.
+"""Spans and metrics for the ingestion and query paths.
+
+Instrumented code calls span(), record() and count() from this module.
+Until configure() installs a backend every call is a no-op that costs a
+function call, so instrumentation can stay in hot paths. configure() takes:
+
+- "none": the default, records nothing
+- "opentelemetry": sends spans and metrics to the global OpenTelemetry
+  tracer and meter providers (needs opentelemetry-api; exporting is up to
+  whatever SDK or distro the host has configured)
+- "memory": keeps everything in process, see InMemoryTelemetry
+
+Every span also records its duration in the "rag.stage.duration" histogram
+with the span name as the "stage" attribute, so stage latencies can be
+compared from metrics alone.
+"""
+import logging
+import threading
+import time
+
+try:
+    from opentelemetry import metrics as otel_metrics
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_metrics = otel_trace = None
+
+STAGE_DURATION = "rag.stage.duration"
+BATCH_SIZE = "rag.batch.size"
+PAYLOAD_SIZE = "rag.payload.size"
+RETRIES = "rag.retries"
+THROTTLES = "rag.throttles"
+RATE_LIMIT_WAIT = "rag.ratelimit.wait"
+TIME_TO_FIRST_TOKEN = "rag.chat.time_to_first_token"
+
+UNITS = {
+    STAGE_DURATION: "s",
+    BATCH_SIZE: "{item}",
+    PAYLOAD_SIZE: "By",
+    RETRIES: "{retry}",
+    THROTTLES: "{response}",
+    RATE_LIMIT_WAIT: "s",
+    TIME_TO_FIRST_TOKEN: "s",
+}
+
+class _NoopSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Telemetry:
+    """Records nothing; base class of the real backends."""
+
+    def span(self, name, attributes=None):
+        return _NOOP_SPAN
+
+    def record(self, name, value, attributes=None):
+        pass
+
+    def count(self, name, value=1, attributes=None):
+        pass
+
+class _TimedSpan:
+
+    def __init__(self, telemetry, name, attributes, span=None):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.span = span
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.span is not None:
+            self.span.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started
+        if exc_info[0] is not None:
+            self.attributes["error"] = exc_info[0].__name__
+        self.telemetry.end_span(self, duration, exc_info[0] is not None)
+        if self.span is not None:
+            return self.span.__exit__(*exc_info)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+        if self.span is not None:
+            self.span.set_attribute(key, value)
+
+class OpenTelemetry(Telemetry):
+    """Forwards to the global OpenTelemetry providers."""
+
+    def __init__(self, tracer_provider=None, meter_provider=None):
+        if otel_trace is None:
+            raise RuntimeError("opentelemetry-api is not installed")
+        self.tracer = otel_trace.get_tracer(__name__, tracer_provider=tracer_provider)
+        self.meter = otel_metrics.get_meter(__name__, meter_provider=meter_provider)
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def span(self, name, attributes=None):
+        otel_span = self.tracer.start_as_current_span(name, attributes=attributes)
+        return _TimedSpan(self, name, attributes, _OtelSpan(otel_span))
+
+    def end_span(self, span, duration, failed):
+        self.record(STAGE_DURATION, duration, {"stage": span.name, "error": failed})
+
+    def record(self, name, value, attributes=None):
+        self.__instrument(self.histograms, name, self.meter.create_histogram).record(value, attributes)
+
+    def count(self, name, value=1, attributes=None):
+        self.__instrument(self.counters, name, self.meter.create_counter).add(value, attributes)
+
+    def __instrument(self, instruments, name, create):
+        instrument = instruments.get(name)
+        if instrument is None:
+            with self.lock:
+                instrument = instruments.get(name)
+                if instrument is None:
+                    instrument = instruments[name] = create(name, unit=UNITS.get(name, ""))
+        return instrument
+
+class _OtelSpan:
+    # Enters start_as_current_span's context manager and keeps the span it yields
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.span = None
+
+    def __enter__(self):
+        self.span = self.manager.__enter__()
+        return self.span
+
+    def __exit__(self, *exc_info):
+        return self.manager.__exit__(*exc_info)
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+class InMemoryTelemetry(Telemetry):
+    """Keeps spans and metric values in process, for tests, benchmarks and
+    one-off sizing runs. Holds at most MAX_VALUES values per metric."""
+
+    MAX_VALUES = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.histograms = {}
+        self.counters = {}
+
+    def span(self, name, attributes=None):
+        return _TimedSpan(self, name, attributes)
+
+    def end_span(self, span, duration, failed):
+        with self.lock:
+            if len(self.spans) < self.MAX_VALUES:
+                self.spans.append((span.name, duration, span.attributes))
+        self.record(STAGE_DURATION, duration, {"stage": span.name})
+
+    def record(self, name, value, attributes=None):
+        key = (name, tuple(sorted((attributes or {}).items())))
+        with self.lock:
+            values = self.histograms.setdefault(key, [])
+            if len(values) < self.MAX_VALUES:
+                values.append(value)
+
+    def count(self, name, value=1, attributes=None):
+        key = (name, tuple(sorted((attributes or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def values(self, name, **attributes):
+        """Every value recorded for a histogram whose attributes include the given ones."""
+        with self.lock:
+            return [
+                value
+                for (metric, labels), values in self.histograms.items()
+                if metric == name and attributes.items() <= dict(labels).items()
+                for value in values
+            ]
+
+    def total(self, name, **attributes):
+        """Sum of a counter over every attribute set that includes the given ones."""
+        with self.lock:
+            return sum(
+                value
+                for (metric, labels), value in self.counters.items()
+                if metric == name and attributes.items() <= dict(labels).items()
+            )
+
+    def summary(self):
+        """{stage: {count, total, p50, p95, max}} of the recorded span durations in seconds."""
+        with self.lock:
+            durations = {}
+            for name, duration, _ in self.spans:
+                durations.setdefault(name, []).append(duration)
+        summary = {}
+        for name, values in durations.items():
+            values.sort()
+            summary[name] = {
+                "count": len(values),
+                "total": sum(values),
+                "p50": values[int(0.5 * (len(values) - 1))],
+                "p95": values[int(0.95 * (len(values) - 1))],
+                "max": values[-1]
+            }
+        return summary
+
+_telemetry = Telemetry()
+
+def configure(exporter="none"):
+    """Installs the backend for the whole process and returns it."""
+    global _telemetry
+    exporter = (exporter or "none").lower()
+    if exporter == "none":
+        _telemetry = Telemetry()
+    elif exporter == "opentelemetry":
+        _telemetry = OpenTelemetry()
+    elif exporter == "memory":
+        _telemetry = InMemoryTelemetry()
+    else:
+        raise ValueError(f"Unknown telemetry exporter {exporter!r}, expected none, opentelemetry or memory")
+    logging.info(f"Telemetry exporter: {exporter}")
+    return _telemetry
+
+def configure_or_disable(exporter="none"):
+    """configure() for app startup: an unknown exporter or a failing backend
+    is logged and telemetry stays off, rather than the app failing to load."""
+    try:
+        return configure(exporter)
+    except Exception as e:
+        logging.error(f"Telemetry exporter {exporter!r} unavailable, telemetry is disabled: {e}")
+        return configure("none")
+
+def set_telemetry(telemetry):
+    global _telemetry
+    _telemetry = telemetry
+
+def get_telemetry():
+    return _telemetry
+
+def span(name, **attributes):
+    """Context manager timing one stage; yields an object with set_attribute()."""
+    return _telemetry.span(name, attributes)
+
+def record(name, value, **attributes):
+    """Adds a value to a histogram (latency, batch size, payload bytes)."""
+    _telemetry.record(name, value, attributes)
+
+def count(name, value=1, **attributes):
+    """Adds to a counter (retries, throttled responses)."""
+    _telemetry.count(name, value, attributes)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The web UI's modules import each other as top-level modules, as they do
+# when Streamlit runs app.py from the chat-ui directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,140 @@
+import threading
+import time
+import pytest
+from answercache import AnswerCache, SingleFlight, normalize_query
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def make_cache(**kwargs):
+    clock = FakeClock()
+    return AnswerCache(clock=clock, **kwargs), clock
+
+def test_lookup_serves_similar_queries_only():
+    cache, clock = make_cache(similarity_threshold=0.95)
+    cache.put([1.0, 0.0], ["doc-1"], "answer")
+
+    # cos = 0.995 and 0.707
+    assert cache.lookup([1.0, 0.1])["answer"] == "answer"
+    assert cache.lookup([1.0, 1.0]) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+def test_lookup_returns_the_closest_entry():
+    cache, clock = make_cache(similarity_threshold=0.9)
+    cache.put([1.0, 0.0], ["doc-1"], "first")
+    cache.put([0.0, 1.0], ["doc-2"], "second")
+
+    entry = cache.lookup([0.1, 1.0])
+
+    assert entry["answer"] == "second"
+    assert entry["chunk_ids"] == ["doc-2"]
+
+def test_entries_expire():
+    cache, clock = make_cache()
+    cache.put([1.0, 0.0], ["doc-1"], "answer")
+
+    clock.now += AnswerCache.MAX_AGE_SECONDS
+    assert cache.lookup([1.0, 0.0]) is not None
+    clock.now += 1
+    assert cache.lookup([1.0, 0.0]) is None
+
+def test_oldest_entry_is_evicted_when_full():
+    cache, clock = make_cache(max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.put(vector, [f"doc-{i}"], f"answer-{i}")
+
+    assert len(cache) == 2
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0, 0.0])["answer"] == "answer-1"
+    assert cache.lookup([0.0, 0.0, 1.0])["answer"] == "answer-2"
+
+def test_index_change_drops_every_entry():
+    cache, clock = make_cache()
+    versions = iter(["v1", "v1", "v2"])
+    get_version = lambda: next(versions)
+    cache.check_index_version(get_version)
+    cache.put([1.0, 0.0], ["doc-1"], "answer")
+
+    clock.now += AnswerCache.INDEX_CHECK_SECONDS
+    cache.check_index_version(get_version)
+    assert len(cache) == 1
+    clock.now += AnswerCache.INDEX_CHECK_SECONDS
+    cache.check_index_version(get_version)
+    assert len(cache) == 0
+
+def test_index_version_is_checked_at_most_once_per_interval():
+    cache, clock = make_cache()
+    calls = []
+    get_version = lambda: calls.append(clock.now) or "v1"
+
+    cache.check_index_version(get_version)
+    clock.now += AnswerCache.INDEX_CHECK_SECONDS - 1
+    cache.check_index_version(get_version)
+    clock.now += 1
+    cache.check_index_version(get_version)
+
+    assert len(calls) == 2
+
+def test_failed_index_check_keeps_the_cache():
+    cache, clock = make_cache()
+    cache.check_index_version(lambda: "v1")
+    cache.put([1.0, 0.0], ["doc-1"], "answer")
+
+    def unavailable():
+        raise ConnectionError("search service unavailable")
+
+    clock.now += AnswerCache.INDEX_CHECK_SECONDS
+    cache.check_index_version(unavailable)
+
+    assert len(cache) == 1
+
+class CountingDict(dict):
+    # Counts lookups, to tell when every caller has reached SingleFlight.do
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get(self, key, default=None):
+        self.lookups += 1
+        return super().get(key, default)
+
+def test_single_flight_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    single_flight.calls = CountingDict()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        # Finish only once the other callers have found this call under the key
+        while single_flight.calls.lookups < 4:
+            time.sleep(0.01)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do("key", compute))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+    assert single_flight.calls == {}
+
+def test_single_flight_shares_errors_and_forgets_the_call():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        single_flight.do("key", fail)
+
+    assert single_flight.do("key", lambda: "retried") == "retried"
+
+def test_normalize_query():
+    assert normalize_query("  What is   RAG?\n") == normalize_query("what is rag?")
@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import pytest
+from azure.core.exceptions import HttpResponseError
+from azuresearchbackend import AzureSearchBackend
+
+@pytest.fixture
+def client():
+    return MagicMock()
+
+def test_search_sends_one_vector_query(client):
+    client.search.return_value = iter([{"id": "a", "@search.score": 0.9}])
+
+    results = AzureSearchBackend(client).search([0.5, 0.25], top_k=5)
+
+    assert results == [{"id": "a", "@search.score": 0.9}]
+    kwargs = client.search.call_args.kwargs
+    assert kwargs["search_text"] is None
+    assert kwargs["vector_queries"] == [{"kind": "vector", "vector": [0.5, 0.25], "k": 5, "fields": "embedding"}]
+    assert "embedding" not in kwargs["select"]
+
+def test_search_can_return_embeddings_in_the_index_format(client):
+    client.search.return_value = iter([])
+
+    AzureSearchBackend(client, "int8").search([0.5, -1.0], include_vectors=True)
+
+    kwargs = client.search.call_args.kwargs
+    assert kwargs["vector_queries"][0]["vector"] == [64, -127]
+    assert "embedding" in kwargs["select"]
+
+def test_index_documents_reports_failures(client):
+    client.upload_documents.return_value = [
+        SimpleNamespace(key="a", succeeded=True, error_message=None),
+        SimpleNamespace(key="b", succeeded=False, error_message="too large")
+    ]
+    chunks = [{"id": "a", "metadata": {"source_page": 1}}, {"id": "b", "metadata": "{}"}]
+
+    failed = AzureSearchBackend(client).index_documents(chunks, [[1.0], [0.5]])
+
+    assert failed == {"b": "too large"}
+    documents = client.upload_documents.call_args.args[0]
+    assert documents[0] == {"id": "a", "metadata": json.dumps({"source_page": 1}), "embedding": [1.0]}
+
+def test_get_document_ids_escapes_the_source(client):
+    client.search.return_value = iter([{"id": "a"}, {"id": "b"}])
+
+    assert AzureSearchBackend(client).get_document_ids("it's.pdf") == ["a", "b"]
+    assert client.search.call_args.kwargs["filter"] == "source eq 'it''s.pdf'"
+
+def test_index_documents_stamps_indexed_at(client):
+    client.upload_documents.return_value = []
+
+    AzureSearchBackend(client, stamp_documents=True).index_documents([{"id": "a"}, {"id": "b"}], [[1.0], [0.5]])
+
+    documents = client.upload_documents.call_args.args[0]
+    assert documents[0]["indexed_at"] and documents[0]["indexed_at"] == documents[1]["indexed_at"]
+
+def test_index_version_changes_when_documents_are_replaced(client):
+    client.get_document_count.return_value = 2
+    client.search.side_effect = [iter([{"indexed_at": "2026-10-18T09:00:00.000Z"}]), iter([{"indexed_at": "2026-10-18T10:00:00.000Z"}])]
+    backend = AzureSearchBackend(client)
+
+    before = backend.index_version()
+
+    assert backend.index_version() != before
+    assert before == (2, "2026-10-18T09:00:00.000Z")
+    assert client.search.call_args.kwargs["order_by"] == ["indexed_at desc"]
+
+def test_index_version_of_an_index_without_indexed_at(client):
+    client.get_document_count.return_value = 2
+    client.search.side_effect = HttpResponseError("Invalid expression: Could not find a property named 'indexed_at'")
+
+    assert AzureSearchBackend(client).index_version() == (2, None)
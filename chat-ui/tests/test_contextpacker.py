@@ -0,0 +1,118 @@
+import json
+import re
+from contextpacker import ContextPacker, merge_overlap
+
+def count_words(text):
+    return len(text.split())
+
+def make_packer(token_budget=None):
+    return ContextPacker(count_words, token_budget)
+
+def doc(doc_id, score, content="text", embedding=None, page=1, chunk_index=None, source="a.pdf"):
+    return {
+        "id": doc_id,
+        "@search.score": score,
+        "content": content,
+        "embedding": embedding,
+        "source": source,
+        "metadata": json.dumps({"source_page": page, "chunk_index": chunk_index})
+    }
+
+def chunk_text(text, size, overlap):
+    # Cuts text the way PDFProcessor does: at token offsets, GPT-2 style
+    # tokens carrying their leading whitespace, each chunk stripped
+    offsets = [match.span() for match in re.finditer(r"\s*\S+", text)]
+    chunks = []
+    start = 0
+    while start < len(offsets):
+        end = min(start + size, len(offsets))
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]].strip())
+        start += size - overlap
+    return chunks
+
+def test_adaptive_k_stops_at_a_score_gap():
+    docs = [doc(str(i), score) for i, score in enumerate([0.90, 0.88, 0.86, 0.70, 0.69])]
+
+    assert [d["id"] for d in make_packer().select_adaptive_k(docs)] == ["0", "1", "2"]
+
+def test_adaptive_k_stops_at_the_score_spread():
+    # No single gap is large, but the fifth is too far below the best
+    docs = [doc(str(i), 0.90 - 0.04 * i) for i in range(6)]
+
+    assert len(make_packer().select_adaptive_k(docs)) == 4
+
+def test_adaptive_k_is_capped():
+    docs = [doc(str(i), 0.9) for i in range(ContextPacker.MAX_K + 4)]
+
+    assert len(make_packer().select_adaptive_k(docs)) == ContextPacker.MAX_K
+    assert make_packer().select_adaptive_k([]) == []
+
+def test_near_duplicates_are_dropped_and_novel_docs_ranked_first():
+    docs = [
+        doc("best", 0.90, embedding=[1.0, 0.0, 0.0]),
+        doc("duplicate", 0.89, embedding=[1.0, 0.01, 0.0]),
+        doc("similar", 0.88, embedding=[0.7, 0.7, 0.0]),
+        doc("novel", 0.87, embedding=[0.0, 0.0, 1.0])
+    ]
+
+    assert [d["id"] for d in make_packer().remove_near_duplicates(docs)] == ["best", "novel", "similar"]
+
+def test_near_duplicates_need_embeddings():
+    docs = [doc("1", 0.9, embedding=[1.0, 0.0]), doc("2", 0.8)]
+
+    assert make_packer().remove_near_duplicates(docs) == docs
+
+def test_merge_overlap_of_stripped_chunks():
+    text = "  ".join(f"Sentence {i} of the page, with a number\n{i * 7}." for i in range(40))
+    chunks = chunk_text(text, size=60, overlap=12)
+    assert len(chunks) > 2
+
+    merged = chunks[0]
+    for chunk in chunks[1:]:
+        merged = merge_overlap(merged, chunk)
+
+    assert merged == text.strip()
+
+def test_merge_overlap_keeps_the_longest_overlap():
+    first = "one two three. one two three. one two three."
+    second = "one two three. one two three. four"
+
+    assert merge_overlap(first, second) == "one two three. one two three. one two three. four"
+
+def test_merge_overlap_without_overlap_joins_the_chunks():
+    assert merge_overlap("first chunk of text here", "second chunk of text here") == "first chunk of text here second chunk of text here"
+    # Too short to tell apart from a coincidence
+    assert merge_overlap("ends with a word", "a word starts") == "ends with a word a word starts"
+
+def test_pack_merges_consecutive_chunks_of_a_page():
+    docs = [
+        doc("p1-c1", 0.90, "first half of the page shared text", chunk_index=1),
+        doc("p1-c0", 0.89, "start of the page, first half of the page", chunk_index=0),
+        doc("p2-c0", 0.88, "another page", page=2, chunk_index=0)
+    ]
+
+    passages = make_packer().pack(docs)
+
+    assert [passage["ids"] for passage in passages] == [["p1-c1", "p1-c0"], ["p2-c0"]]
+    assert passages[0]["content"] == "start of the page, first half of the page shared text"
+
+def test_fit_budget_skips_passages_that_do_not_fit():
+    packer = make_packer(token_budget=20)
+    passages = [
+        {"page": 1, "content": "word " * 10},
+        {"page": 2, "content": "word " * 10},
+        {"page": 3, "content": "word " * 2}
+    ]
+
+    # Each passage costs its words plus four for the template
+    assert [passage["page"] for passage in packer.fit_budget(passages)] == [1, 3]
+
+def test_fit_budget_truncates_a_best_passage_that_is_too_long():
+    packer = make_packer(token_budget=10)
+    passages = [{"page": 1, "content": " ".join(f"w{i}" for i in range(50))}, {"page": 2, "content": "short"}]
+
+    packed = packer.fit_budget(passages)
+
+    assert len(packed) == 1
+    assert count_words(packer.format_passage(packed[0])) == 10
+    assert packed[0]["content"].startswith("w0 w1")
@@ -0,0 +1,33 @@
+import glob
+import os
+import re
+import pytest
+
+CHAT_UI_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTION_APP_SRC = os.path.join(os.path.dirname(CHAT_UI_PATH), "function-app", "src")
+HEADER = re.compile(r"\A# Copy of function-app/src/(\w+\.py);[^\n]*\n#[^\n]*\n")
+
+def copied_modules():
+    for path in sorted(glob.glob(os.path.join(CHAT_UI_PATH, "*.py"))):
+        with open(path, encoding="utf-8") as f:
+            match = HEADER.match(f.read())
+        if match:
+            yield os.path.basename(path), match.group(1)
+
+def as_copied(source):
+    # The only changes a copy may make: modules of the web UI are imported
+    # as top-level modules instead of relative to the src package
+    source = re.sub(r"^from \. import (\w+)$", r"import \1", source, flags=re.MULTILINE)
+    return re.sub(r"^from \.(\w+) import ", r"from \1 import ", source, flags=re.MULTILINE)
+
+def test_copies_are_found():
+    assert len(list(copied_modules())) >= 7
+
+@pytest.mark.parametrize("name, original", list(copied_modules()))
+def test_copy_matches_the_function_app_module(name, original):
+    with open(os.path.join(CHAT_UI_PATH, name), encoding="utf-8") as f:
+        copy = HEADER.sub("", f.read(), count=1)
+    with open(os.path.join(FUNCTION_APP_SRC, original), encoding="utf-8") as f:
+        source = f.read()
+
+    assert copy == as_copied(source), f"chat-ui/{name} has drifted from function-app/src/{original}; copy the change over"
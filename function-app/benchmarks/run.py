@@ -0,0 +1,311 @@
+"""Ingestion and query benchmarks against local stand-ins of the Azure services.
+
+Runs the real PdfIndexingService (threaded and async engines) and the chat
+UI's query path over synthetic PDFs, with the Azure OpenAI and Azure AI
+Search endpoints served by benchmarks.standins, and compares the numbers
+with benchmarks/baselines.json. Exits with status 1 when a metric is worse
+than its baseline by more than the tolerance.
+
+    cd function-app
+    python -m benchmarks.run [--quick] [--update-baselines]
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from src.pdfprocessor import PDFProcessor
+from src.embeddingservice import EmbeddingService
+from src.asyncembeddingservice import AsyncEmbeddingService
+from src.azuresearchindexer import AzureSearchIndexer, vector_query
+from src.asyncazuresearchindexer import AsyncAzureSearchIndexer
+from src.localvectorindex import LocalVectorIndex
+from src.pdfindexingservice import PdfIndexingService
+from src.asyncpdfindexingservice import AsyncPdfIndexingService
+from src.ratelimiter import RateLimiter
+from src.httptransport import create_session
+from src import telemetry
+from .standins import StandInConfig, start_openai, start_search
+from .syntheticpdf import PAGE_COUNTS, WORDS, make_pdf
+
+CHAT_UI_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chat-ui")
+sys.path.insert(0, CHAT_UI_PATH)
+from contextpacker import ContextPacker  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+OPENAI_API_VERSION = "2023-05-15"
+EMBEDDING_DEPLOYMENT = "text-embedding-ada-002"
+CHAT_DEPLOYMENT = "gpt-35-turbo"
+API_KEY = "benchmark"
+# Same settings as chat-ui/app.py
+RETRIEVAL_CANDIDATES = 10
+SYSTEM_MESSAGE = "Answer the user's query using *only* the provided context documents. If the context doesn't contain the answer, state that.\n\nContext Documents:\n---\n"
+
+def load_tokenizer():
+    """The GPT-2 tokenizer when it is in the local Hugging Face cache,
+    otherwise a byte-level BPE trained on the synthetic vocabulary, so a run
+    never touches the network. Returns the tokenizer and its name."""
+    from transformers import GPT2TokenizerFast, PreTrainedTokenizerFast
+    try:
+        tokenizer = GPT2TokenizerFast.from_pretrained("gpt2", local_files_only=True)
+        # Some transformers versions hand back an empty vocabulary instead
+        # of raising when the files are missing
+        if tokenizer.encode("benchmark"):
+            return tokenizer, "gpt2"
+    except OSError:
+        pass
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=2000, initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False)
+    rng = random.Random(0)
+    backend.train_from_iterator((" ".join(rng.choice(WORDS) for _ in range(50)) for _ in range(200)), trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=backend), "byte-level-bpe"
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
+
+def openai_client(url):
+    # max_retries=0 as in production: the rate limiter does the retrying
+    return AzureOpenAI(api_version=OPENAI_API_VERSION, azure_endpoint=url, api_key=API_KEY, max_retries=0)
+
+def ingest_threaded(tokenizer, pdf_bytes, blob_name, openai_url, search_url):
+    service = PdfIndexingService(
+        pdf_processor=PDFProcessor(tokenizer),
+        embedding_service=EmbeddingService(openai_client(openai_url), tokenizer, rate_limiter=RateLimiter()),
+        search_indexer=AzureSearchIndexer(search_url, API_KEY, session=create_session()),
+        logger=logging.getLogger("benchmarks")
+    )
+    try:
+        started = time.perf_counter()
+        service.process_and_index_pdf(io.BytesIO(pdf_bytes), blob_name)
+        return time.perf_counter() - started
+    finally:
+        service.pdf_processor.close()
+
+def ingest_async(tokenizer, pdf_bytes, blob_name, openai_url, search_url):
+    async def run():
+        client = AsyncAzureOpenAI(api_version=OPENAI_API_VERSION, azure_endpoint=openai_url, api_key=API_KEY, max_retries=0)
+        search_indexer = AsyncAzureSearchIndexer(search_url, API_KEY)
+        service = AsyncPdfIndexingService(
+            pdf_processor=PDFProcessor(tokenizer),
+            embedding_service=AsyncEmbeddingService(client, tokenizer, rate_limiter=RateLimiter()),
+            search_indexer=search_indexer,
+            logger=logging.getLogger("benchmarks")
+        )
+        try:
+            started = time.perf_counter()
+            await service.process_and_index_pdf(io.BytesIO(pdf_bytes), blob_name)
+            return time.perf_counter() - started
+        finally:
+            service.pdf_processor.close()
+            await search_indexer.close()
+            await client.close()
+    return asyncio.run(run())
+
+INGESTION_ENGINES = {"threaded": ingest_threaded, "async": ingest_async}
+
+def bench_ingestion(tokenizer, pdfs, openai, search):
+    """chunks/sec and docs/sec per engine, over every synthetic PDF."""
+    metrics = {}
+    for engine, ingest in INGESTION_ENGINES.items():
+        total_chunks = 0
+        total_seconds = 0.0
+        for pages, pdf_bytes in pdfs.items():
+            with search.lock:
+                search.documents.clear()
+            blob_name = f"benchmark/{engine}-{pages}.pdf"
+            seconds = ingest(tokenizer, pdf_bytes, blob_name, openai.url, search.url)
+            chunks = len(search.documents)
+            metrics[f"ingest_{engine}_{pages}p_chunks_per_sec"] = chunks / seconds
+            total_chunks += chunks
+            total_seconds += seconds
+            print(f"  {engine:8} {pages:4} pages: {chunks:5} chunks in {seconds:7.3f}s")
+        metrics[f"ingest_{engine}_chunks_per_sec"] = total_chunks / total_seconds
+        metrics[f"ingest_{engine}_docs_per_sec"] = len(pdfs) / total_seconds
+    return metrics
+
+def make_queries(count, seed=1):
+    rng = random.Random(seed)
+    return [f"What does the document say about {rng.choice(WORDS)} and {rng.choice(WORDS)} {rng.choice(WORDS)}?" for _ in range(count)]
+
+class QueryPath:
+    """chat-ui/app.py's answer path without Streamlit: embed the question,
+    retrieve candidates, pack them with ContextPacker and stream the answer."""
+
+    def __init__(self, openai_url, search_url, tokenizer, local_index=None):
+        self.client = openai_client(openai_url)
+        self.embedding_limiter = RateLimiter()
+        self.chat_limiter = RateLimiter()
+        self.search_url = search_url
+        self.session = create_session()
+        self.local_index = local_index
+        self.packer = ContextPacker(lambda text: len(tokenizer.encode(text)))
+
+    def search(self, vector):
+        if self.local_index is not None:
+            return self.local_index.search(vector, RETRIEVAL_CANDIDATES, include_vectors=True)
+        body = dict(vector_query(vector, RETRIEVAL_CANDIDATES), select="id,content,metadata,source,embedding")
+        response = self.session.post(
+            AzureSearchIndexer.DOCS_SEARCH_URL.format(self.search_url, AzureSearchIndexer.INDEX_NAME, AzureSearchIndexer.API_VERSION),
+            headers={"Content-Type": "application/json", "api-key": API_KEY},
+            data=json.dumps(body)
+        )
+        response.raise_for_status()
+        return response.json()["value"]
+
+    def answer(self, query):
+        """Returns (seconds to first token, total seconds)."""
+        started = time.perf_counter()
+        vector = self.embedding_limiter.call(
+            lambda: self.client.embeddings.create(input=[query], model=EMBEDDING_DEPLOYMENT),
+            tokens=len(query) // 4 + 1
+        ).data[0].embedding
+        passages = self.packer.pack(self.search(vector))
+        context = "\n---\n".join(self.packer.format_passage(passage) for passage in passages)
+        messages = [{"role": "system", "content": SYSTEM_MESSAGE + context}, {"role": "user", "content": query}]
+        stream = self.chat_limiter.stream(
+            lambda: self.client.chat.completions.create(
+                model=CHAT_DEPLOYMENT, messages=messages, stream=True, stream_options={"include_usage": True}
+            ),
+            tokens=sum(len(message["content"]) // 4 + 1 for message in messages)
+        )
+        first_token = None
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content and first_token is None:
+                first_token = time.perf_counter() - started
+        return first_token, time.perf_counter() - started
+
+def load_local_index(search):
+    index = LocalVectorIndex()
+    with search.lock:
+        documents = list(search.documents.values())
+    index.index_documents(documents, [document["embedding"] for document in documents])
+    return index
+
+def bench_queries(tokenizer, corpus_pdf, query_count, openai, search):
+    """p50/p95/p99 latency of the query path for each retrieval backend."""
+    with search.lock:
+        search.documents.clear()
+    ingest_threaded(tokenizer, corpus_pdf, "benchmark/corpus.pdf", openai.url, search.url)
+    print(f"  corpus: {len(search.documents)} chunks")
+    metrics = {}
+    queries = make_queries(query_count)
+    for backend, local_index in (("azure", None), ("local", load_local_index(search))):
+        path = QueryPath(openai.url, search.url, tokenizer, local_index)
+        for query in queries[:5]:
+            path.answer(query)
+        timings = [path.answer(query) for query in queries]
+        first_tokens = [first for first, _ in timings if first is not None]
+        totals = [total for _, total in timings]
+        for q in (50, 95, 99):
+            metrics[f"query_{backend}_p{q}_ms"] = percentile(totals, q) * 1000
+            metrics[f"query_{backend}_ttft_p{q}_ms"] = percentile(first_tokens, q) * 1000
+        print(f"  {backend:8} p50 {metrics[f'query_{backend}_p50_ms']:7.1f}ms  p95 {metrics[f'query_{backend}_p95_ms']:7.1f}ms  p99 {metrics[f'query_{backend}_p99_ms']:7.1f}ms")
+    return metrics
+
+def is_regression(name, value, baseline, tolerance):
+    # Throughputs must not drop, latencies must not grow
+    if name.endswith("_per_sec"):
+        return value < baseline * (1 - tolerance)
+    if name.endswith("_ms"):
+        return value > baseline * (1 + tolerance)
+    return False
+
+def compare(metrics, baselines, tolerance):
+    """Prints each metric against its baseline; returns the names of regressed metrics."""
+    regressions = []
+    print(f"\n{'metric':40} {'value':>10} {'baseline':>10} {'change':>8}")
+    for name, value in sorted(metrics.items()):
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:40} {value:10.2f} {'-':>10} {'':>8}")
+            continue
+        flag = ""
+        if is_regression(name, value, baseline, tolerance):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {value:10.2f} {baseline:10.2f} {(value - baseline) / baseline:+8.1%}{flag}")
+    return regressions
+
+def print_stages(recorder):
+    print(f"\n{'stage':24} {'count':>7} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, stage in sorted(recorder.summary().items()):
+        print(f"{name:24} {stage['count']:7} {stage['total']:9.3f} {stage['p50'] * 1000:8.2f} {stage['p95'] * 1000:8.2f} {stage['max'] * 1000:8.2f}")
+    print(f"retries {recorder.total(telemetry.RETRIES)}, throttled responses {recorder.total(telemetry.THROTTLES)}")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="smaller PDFs and fewer queries")
+    parser.add_argument("--update-baselines", action="store_true", help="store this run's numbers as the baselines")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative change before a metric counts as regressed")
+    parser.add_argument("--openai-latency-ms", type=float, default=20.0, help="stand-in latency per OpenAI request, and to the first streamed token")
+    parser.add_argument("--search-latency-ms", type=float, default=10.0, help="stand-in latency per Search request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of OpenAI requests answered with 429")
+    parser.add_argument("--stages", action="store_true", help="record spans and print where the time went per stage")
+    parser.add_argument("--output", help="also write the metrics to this JSON file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    mode = "quick" if args.quick else "full"
+    tokenizer, tokenizer_name = load_tokenizer()
+    # Stage timings cost a little, so they are left out of the baseline numbers unless asked for
+    recorder = telemetry.configure("memory" if args.stages else "none")
+    openai_config = StandInConfig(latency_seconds=args.openai_latency_ms / 1000, per_item_seconds=0.001, throttle_rate=args.throttle_rate)
+    search_config = StandInConfig(latency_seconds=args.search_latency_ms / 1000, per_item_seconds=0.0001)
+    page_counts = PAGE_COUNTS[:2] if args.quick else PAGE_COUNTS
+    pdfs = {pages: make_pdf(pages) for pages in page_counts}
+
+    with start_openai(openai_config) as openai, start_search(search_config) as search:
+        print(f"Ingestion ({mode}, tokenizer {tokenizer_name})")
+        metrics = bench_ingestion(tokenizer, pdfs, openai, search)
+        print("Query path")
+        metrics.update(bench_queries(tokenizer, make_pdf(20 if args.quick else 50), 50 if args.quick else 200, openai, search))
+        print(f"OpenAI stand-in: {openai.requests} requests, {openai.throttled} throttled")
+    if args.stages:
+        print_stages(recorder)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as f:
+            baselines = json.load(f)
+    regressions = compare(metrics, baselines.get(mode, {}).get("metrics", {}), args.tolerance)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+    if args.update_baselines:
+        baselines[mode] = {
+            "environment": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "tokenizer": tokenizer_name,
+                "openai_latency_ms": args.openai_latency_ms,
+                "search_latency_ms": args.search_latency_ms,
+                "throttle_rate": args.throttle_rate
+            },
+            "metrics": {name: round(value, 3) for name, value in sorted(metrics.items())}
+        }
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaselines for {mode} runs written to {BASELINES_PATH}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Local stand-ins for the Azure services the pipeline talks to.
+
+Each stand-in is a small HTTP server speaking just enough of the real wire
+protocol for the unmodified clients (openai's AzureOpenAI, AzureSearchIndexer)
+to run against it, with configurable latency and throttling so benchmarks
+exercise the same batching, retry and rate-limiting code as production.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import numpy as np
+
+@dataclass
+class StandInConfig:
+    # Fixed delay per request plus a delay per item (text, document or token)
+    latency_seconds: float = 0.0
+    per_item_seconds: float = 0.0
+    # Share of requests answered with 429 and a Retry-After of retry_after_seconds
+    throttle_rate: float = 0.0
+    retry_after_seconds: float = 0.05
+    seed: int = 0
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once
+    request_queue_size = 128
+
+class StandIn:
+    """Runs a handler class on an ephemeral localhost port in a background thread."""
+
+    def __init__(self, handler, config: StandInConfig = None):
+        self.config = config or StandInConfig()
+        self.random = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        handler_class = type(handler.__name__, (handler,), {"standin": self})
+        self.server = _StandInServer(("127.0.0.1", 0), handler_class)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self if self.thread.is_alive() else self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def should_throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.config.throttle_rate and self.random.random() < self.config.throttle_rate:
+                self.throttled += 1
+                return True
+            return False
+
+    def delay(self, items):
+        seconds = self.config.latency_seconds + self.config.per_item_seconds * items
+        if seconds > 0:
+            time.sleep(seconds)
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    standin = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body or b"{}")
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_throttled(self):
+        retry_after = self.standin.config.retry_after_seconds
+        self.send_json(
+            429,
+            {"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+            {"retry-after-ms": str(int(retry_after * 1000)), "retry-after": str(max(1, round(retry_after)))}
+        )
+
+def fake_embedding(text, dimensions):
+    """Deterministic unit vector for a text, so identical texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class OpenAIHandler(_JsonHandler):
+    """Azure OpenAI embeddings and chat completions, streaming included."""
+
+    DIMENSIONS = 1536
+    ANSWER = ("Based on the provided context documents, the answer is described on the "
+              "referenced pages; see the quoted passages for the details you asked about.")
+    ROUTE = re.compile(r"^/openai/deployments/([^/]+)/(embeddings|chat/completions)$")
+
+    def do_POST(self):
+        match = self.ROUTE.match(urlparse(self.path).path)
+        body = self.read_json()
+        if not match:
+            self.send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        if self.standin.should_throttle():
+            self.send_throttled()
+            return
+        deployment, operation = match.groups()
+        if operation == "embeddings":
+            self.embeddings(deployment, body)
+        else:
+            self.chat(deployment, body)
+
+    def embeddings(self, deployment, body):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.standin.delay(len(texts))
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text, self.DIMENSIONS)
+            if body.get("encoding_format") == "base64":
+                value = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                value = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": value})
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        self.send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": deployment,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def chat(self, deployment, body):
+        words = self.ANSWER.split(" ")
+        prompt_tokens = sum(len(message.get("content", "")) // 4 + 1 for message in body.get("messages", []))
+        completion = {
+            "id": "chatcmpl-standin",
+            "created": int(time.time()),
+            "model": deployment
+        }
+        # Latency before the first token; per_item_seconds is the gap between tokens
+        time.sleep(self.standin.config.latency_seconds)
+        if not body.get("stream"):
+            time.sleep(self.standin.config.per_item_seconds * len(words))
+            self.send_json(200, dict(completion, object="chat.completion", choices=[{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.ANSWER},
+                "finish_reason": "stop"
+            }], usage={"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.standin.config.per_item_seconds)
+            chunk = dict(completion, object="chat.completion.chunk", choices=[{
+                "index": 0,
+                "delta": {"role": "assistant", "content": word} if not i else {"content": " " + word},
+                "finish_reason": None
+            }])
+            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = dict(completion, object="chat.completion.chunk", choices=[], usage={
+                "prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)
+            })
+            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+class SearchHandler(_JsonHandler):
+    """Azure AI Search /docs/index and /docs/search over an in-memory index."""
+
+    ROUTE = re.compile(r"^/indexes/([^/]+)/docs/(index|search)$")
+    INDEX_ROUTE = re.compile(r"^/indexes/([^/]+)(/docs/\$count)?$")
+    SOURCE_FILTER = re.compile(r"^source eq '((?:[^']|'')*)'$")
+
+    def do_POST(self):
+        match = self.ROUTE.match(urlparse(self.path).path)
+        body = self.read_json()
+        if not match:
+            self.send_json(404, {"error": {"code": "404", "message": "Index not found"}})
+            return
+        if self.standin.should_throttle():
+            self.send_throttled()
+            return
+        if match.group(2) == "index":
+            self.index(body)
+        else:
+            self.search(body)
+
+    def do_GET(self):
+        # Whatever index is asked for is the in-memory one; there are no aliases
+        match = self.INDEX_ROUTE.match(urlparse(self.path).path)
+        if not match:
+            self.send_json(404, {"error": {"code": "404", "message": "Not found"}})
+        elif match.group(2):
+            with self.standin.lock:
+                self.send_json(200, len(self.standin.documents))
+        else:
+            self.send_json(200, {"name": match.group(1), "fields": [{"name": "id", "key": True}, {"name": "embedding"}]})
+
+    def index(self, body):
+        documents = body.get("value", [])
+        self.standin.delay(len(documents))
+        results = []
+        with self.standin.lock:
+            for document in documents:
+                key = document["id"]
+                if document.get("@search.action") == "delete":
+                    self.standin.documents.pop(key, None)
+                else:
+                    self.standin.documents[key] = {k: v for k, v in document.items() if k != "@search.action"}
+                results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 200 if document.get("@search.action") == "delete" else 201})
+        self.send_json(200, {"value": results})
+
+    def search(self, body):
+        self.standin.delay(1)
+        with self.standin.lock:
+            documents = list(self.standin.documents.values())
+        match = self.SOURCE_FILTER.match(body.get("filter") or "")
+        if match:
+            source = match.group(1).replace("''", "'")
+            documents = [document for document in documents if document.get("source") == source]
+        queries = body.get("vectorQueries") or []
+        if queries and documents:
+            query = np.asarray(queries[0]["vector"], dtype=np.float32)
+            matrix = np.asarray([document["embedding"] for document in documents], dtype=np.float32)
+            scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+            order = np.argsort(scores)[::-1][:queries[0].get("k", 3)]
+            documents = [dict(documents[i], **{"@search.score": float(scores[i])}) for i in order]
+        skip = body.get("skip", 0)
+        documents = documents[skip:skip + body.get("top", 50)]
+        fields = [field.strip() for field in (body.get("select") or "").split(",") if field.strip()]
+        if fields:
+            documents = [{k: v for k, v in document.items() if k in fields or k == "@search.score"} for document in documents]
+        self.send_json(200, {"value": documents})
+
+def start_openai(config: StandInConfig = None):
+    return StandIn(OpenAIHandler, config).start()
+
+def start_search(config: StandInConfig = None):
+    standin = StandIn(SearchHandler, config)
+    standin.documents = {}
+    return standin.start()
@@ -0,0 +1,104 @@
+"""Cold start benchmark for the function app.
+
+Each measurement runs in a fresh interpreter, like a new Functions worker:
+importing function_app (what every invocation pays), building the blob
+storage service (the extra cost of GET /blobs) and building the ingestion
+services (the extra cost of the first blob trigger). Importing transformers
+is timed alongside for reference, since that is what loading the tokenizer
+used to cost. Compares with the "startup" entry of benchmarks/baselines.json.
+
+    python -m benchmarks.startup [--runs N] [--update-baselines]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from src.tokenizer import DEFAULT_TOKENIZER_PATH
+from .run import BASELINES_PATH, compare, load_tokenizer
+from .standins import start_search
+
+FUNCTION_APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each script prints the seconds spent after the interpreter came up
+SCRIPTS = {
+    "startup_import_ms": "import function_app",
+    "startup_blob_service_ms": "import function_app; function_app.get_blob_storage_service()",
+    "startup_ingestion_ms": "import function_app; function_app.get_indexing_services()",
+    "startup_transformers_import_ms": "from transformers import GPT2TokenizerFast",
+}
+
+def environment(tokenizer_path, cache_dir, search_url):
+    env = dict(os.environ)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9",
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        # Answers the index lookup the blob trigger makes on initialization
+        "AZURE_SEARCH_API_URL": search_url,
+        "AZURE_SEARCH_API_KEY": "benchmark",
+        "UPLOAD_STORAGE_CONNECTION_STRING": "UseDevelopmentStorage=true",
+        "UPLOAD_BLOB_PATH": "pdfs/{name}",
+        "EMBEDDING_CACHE_PATH": os.path.join(cache_dir, "embedding-cache.sqlite"),
+        "TOKENIZER_PATH": tokenizer_path,
+    })
+    return env
+
+def time_script(script, env):
+    code = f"import time; started = time.perf_counter(); {script}; print(time.perf_counter() - started)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=FUNCTION_APP_PATH, env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement; the median is reported")
+    parser.add_argument("--update-baselines", action="store_true", help="store this run's numbers as the baselines")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative change before a metric counts as regressed")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as cache_dir, start_search() as search:
+        tokenizer_path = DEFAULT_TOKENIZER_PATH
+        tokenizer_name = "gpt2"
+        if not os.path.exists(tokenizer_path):
+            # Not exported here: time the same load with a stand-in file
+            tokenizer, tokenizer_name = load_tokenizer()
+            tokenizer_path = os.path.join(cache_dir, "tokenizer.json")
+            tokenizer.backend_tokenizer.save(tokenizer_path)
+        env = environment(tokenizer_path, cache_dir, search.url)
+        metrics = {}
+        for name, script in SCRIPTS.items():
+            seconds = [time_script(script, env) for _ in range(args.runs)]
+            metrics[name] = float(np.median(seconds)) * 1000
+            print(f"{name}: {', '.join(f'{s * 1000:.0f}' for s in seconds)}")
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as f:
+            baselines = json.load(f)
+    regressions = compare(metrics, baselines.get("startup", {}).get("metrics", {}), args.tolerance)
+
+    if args.update_baselines:
+        baselines["startup"] = {
+            "environment": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "tokenizer": tokenizer_name,
+                "runs": args.runs
+            },
+            "metrics": {name: round(value, 3) for name, value in sorted(metrics.items())}
+        }
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nStartup baselines written to {BASELINES_PATH}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""Deterministic synthetic PDFs for benchmarks."""
+import random
+import fitz
+
+WORDS = (
+    "index embedding vector search chunk document page token overlap retrieval "
+    "context answer query model latency throughput batch service storage function "
+    "pipeline storage azure openai cosine similarity partition semantic relevance "
+    "score passage source metadata upload blob cache throttle quota request"
+).split()
+
+# Sizes (pages) the benchmarks run with; quick runs use the first two
+PAGE_COUNTS = [5, 20, 50, 200]
+WORDS_PER_PAGE = 600
+
+def make_pdf(pages, words_per_page=WORDS_PER_PAGE, seed=0):
+    """Returns the bytes of a PDF with pages of pseudo-random prose.
+
+    The same arguments always produce the same text, so chunk ids, and
+    with them embedding cache hits, are stable from run to run.
+    """
+    rng = random.Random(f"{seed}-{pages}")
+    doc = fitz.open()
+    try:
+        for page_number in range(pages):
+            page = doc.new_page()
+            words = [rng.choice(WORDS) for _ in range(words_per_page)]
+            text = f"Page {page_number + 1}. " + " ".join(words)
+            page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=9)
+        return doc.tobytes()
+    finally:
+        doc.close()
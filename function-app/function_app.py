@@ -1,105 +1,335 @@
 import azure.functions as func
+# Importing the HTTP streams extension switches every HTTP route of the app
+# to its Request and Response types, so all routes below use them. It cannot
+# be enabled for one route only, and importing fastapi costs about 450 ms of
+# each cold start; the alternative, get_body(), holds a whole upload of up
+# to the 100 MB request limit in worker memory, twice while it is uploaded.
+from azurefunctions.extensions.http.fastapi import JSONResponse, Request, Response
+import asyncio
+import hashlib
 import logging
 import os
 import json
-from azure.storage.blob import BlobServiceClient
-from src.blobstorageservice import BlobStorageService
-import io
-from src.pdfprocessor import PDFProcessor
-from src.embeddingservice import EmbeddingService
-from src.azuresearchindexer import AzureSearchIndexer
-from src.pdfindexingservice import PdfIndexingService
-from openai import AzureOpenAI
-from transformers import GPT2TokenizerFast
+import re
+import tempfile
+import threading
+import time
+from typing import List
+from src import telemetry
+from src.spooledpdf import SpooledPdf
 
 app = func.FunctionApp()
 
-try:
+# Dependencies are built on first use, each on its own, so a cold start
+# only pays for what the invoked function needs: GET /blobs never loads
+# the tokenizer or the OpenAI SDK, and a broken ingestion setting does not
+# take the blob endpoints down with it.
+UPLOAD_CONTAINER_NAME = os.environ.get("UPLOAD_BLOB_PATH", "").split("/")[0]
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "embedding-cache.sqlite"))
+# "threaded" (default) or "async"
+INGESTION_ENGINE = os.environ.get("INGESTION_ENGINE", "threaded").lower()
+# "azure" (default) or "local" for the in-process index at LOCAL_INDEX_PATH
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "azure").lower()
+# Index alias (or index) the Azure backend writes to, by default the alias
+# infra creates; it is resolved once per worker to the index behind it and
+# the embedding deployment that index records (see src.indexmigration)
+AZURE_SEARCH_INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX_NAME", "rag")
+# Used when the index does not record a deployment
+EMBEDDING_DEPLOYMENT = os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", os.path.join(tempfile.gettempdir(), "rag-index"))
+LOCAL_INDEX_IVF_LISTS = int(os.environ.get("LOCAL_INDEX_IVF_LISTS", "0")) or None
+# Embedding field type of the index (float32, float16 or int8); unset
+# keeps embeddings as plain lists of floats in flight
+VECTOR_FORMAT = os.environ.get("VECTOR_FORMAT") or None
+AZURE_SEARCH_GZIP_REQUESTS = os.environ.get("AZURE_SEARCH_GZIP_REQUESTS", "false").lower() == "true"
+# Quota of the embedding deployment; unset means no client-side cap
+EMBEDDING_TPM = int(os.environ.get("AZURE_OPENAI_EMBEDDING_TPM", "0")) or None
+EMBEDDING_RPM = int(os.environ.get("AZURE_OPENAI_EMBEDDING_RPM", "0")) or None
+# Uploads are staged in blocks of this size, this many at a time; unset
+# keeps the BlobStorageService defaults
+UPLOAD_BLOCK_SIZE = int(os.environ.get("UPLOAD_BLOCK_SIZE_BYTES", "0")) or None
+UPLOAD_MAX_CONCURRENCY = int(os.environ.get("UPLOAD_MAX_CONCURRENCY", "0")) or None
+# Where each blob's ingestion progress is kept so a retried trigger resumes
+# it: "blob" (default, a container in the upload storage account), "local"
+# (a directory) or "none"
+INGESTION_CHECKPOINTS = os.environ.get("INGESTION_CHECKPOINTS", "blob").lower()
+INGESTION_CHECKPOINT_CONTAINER = os.environ.get("INGESTION_CHECKPOINT_CONTAINER", "ingestion-checkpoints")
+INGESTION_CHECKPOINT_PATH = os.environ.get("INGESTION_CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "ingestion-checkpoints"))
+# Most names GET /blobs returns per page; the storage service's own maximum
+MAX_BLOB_LIST_LIMIT = 5000
+# Queue that POST /backfill fills and BackfillPdfFunction drains
+BACKFILL_QUEUE_NAME = "pdf-backfill"
+# Larger PDFs are spooled to a temporary file instead of held in memory;
+# unset keeps SpooledPdf.MAX_IN_MEMORY_BYTES
+PDF_MAX_IN_MEMORY_BYTES = int(os.environ.get("PDF_MAX_IN_MEMORY_BYTES", "0")) or None
+# "none" (default) or "opentelemetry" to send per-stage spans and metrics
+# to the OpenTelemetry providers configured for the host
+telemetry.configure_or_disable(os.environ.get("TELEMETRY_EXPORTER", "none"))
+
+_blob_storage_service = None
+_blob_storage_service_lock = threading.Lock()
+_indexing_services = None
+_indexing_services_lock = threading.Lock()
+
+def get_blob_storage_service():
+    global _blob_storage_service
+    with _blob_storage_service_lock:
+        if _blob_storage_service is None:
+            from azure.storage.blob import BlobServiceClient
+            from src.blobstorageservice import BlobStorageService
+            blob_service_client = BlobServiceClient.from_connection_string(os.environ["UPLOAD_STORAGE_CONNECTION_STRING"])
+            _blob_storage_service = BlobStorageService(blob_service_client, UPLOAD_BLOCK_SIZE, UPLOAD_MAX_CONCURRENCY)
+            logging.info("Blob storage service initialized.")
+        return _blob_storage_service
+
+def get_indexing_services():
+    """Returns (indexing_service, async_indexing_service); the second is None
+    unless INGESTION_ENGINE is "async"."""
+    global _indexing_services
+    with _indexing_services_lock:
+        if _indexing_services is None:
+            _indexing_services = _create_indexing_services()
+            logging.info("Ingestion dependencies initialized.")
+        return _indexing_services
+
+def _create_indexing_services():
+    from openai import AzureOpenAI, AsyncAzureOpenAI
+    from src.tokenizer import load_tokenizer
+    from src.pdfprocessor import PDFProcessor
+    from src.embeddingservice import EmbeddingService
+    from src.embeddingcache import EmbeddingCache
+    from src.ratelimiter import get_rate_limiter
+    from src.pdfindexingservice import PdfIndexingService
+
     AZURE_OPENAI_ENDPOINT = os.environ["AZURE_OPENAI_ENDPOINT"]
-    AZURE_SEARCH_API_URL = os.environ["AZURE_SEARCH_API_URL"]
-    AZURE_SEARCH_API_KEY = os.environ["AZURE_SEARCH_API_KEY"]
-    UPLOAD_STORAGE_CONNECTION_STRING = os.environ["UPLOAD_STORAGE_CONNECTION_STRING"]
-  
-    UPLOAD_CONTAINER_NAME = os.environ["UPLOAD_BLOB_PATH"].split("/")[0]
-    tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
+    tokenizer = load_tokenizer()
+    # Throttled calls are retried by the rate limiter, which shares what it
+    # learns from 429s with every caller; the SDK's own retries would hide them
     openai_client = AzureOpenAI(
         api_version="2023-05-15",
-        azure_endpoint=AZURE_OPENAI_ENDPOINT
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        max_retries=0
     )
+    embedding_deployment = EMBEDDING_DEPLOYMENT
+    if SEARCH_BACKEND == "local":
+        from src.localvectorindex import LocalVectorIndex
+        search_backend = LocalVectorIndex(LOCAL_INDEX_PATH, ivf_lists=LOCAL_INDEX_IVF_LISTS)
+    else:
+        from src.azuresearchindexer import AzureSearchIndexer
+        from src.httptransport import get_shared_session
+        from src.searchindexes import INDEXED_AT_FIELD, SearchIndexAdmin, embedding_deployment as index_deployment, has_field
+        # Pinned to the index the alias points to now, so the documents are
+        # embedded with the model that index was built for
+        index_name, definition = SearchIndexAdmin(
+            os.environ["AZURE_SEARCH_API_URL"], os.environ["AZURE_SEARCH_API_KEY"], get_shared_session()
+        ).describe(AZURE_SEARCH_INDEX_NAME)
+        embedding_deployment = (definition and index_deployment(definition)) or EMBEDDING_DEPLOYMENT
+        logging.info(f"Indexing into {index_name} with {embedding_deployment} embeddings")
+        # The chat UI drops its cached answers when the latest indexed_at
+        # changes; indexes created before the field was added go without it
+        search_backend = AzureSearchIndexer(
+            search_api_url = os.environ["AZURE_SEARCH_API_URL"],
+            search_api_key = os.environ["AZURE_SEARCH_API_KEY"],
+            compress = AZURE_SEARCH_GZIP_REQUESTS,
+            index_name = index_name,
+            stamp_documents = bool(definition) and has_field(definition, INDEXED_AT_FIELD)
+        )
+    embedding_rate_limiter = get_rate_limiter(embedding_deployment, EMBEDDING_TPM, EMBEDDING_RPM)
+    checkpoint_store = _create_checkpoint_store()
     indexing_service = PdfIndexingService(
         pdf_processor = PDFProcessor(tokenizer),
-        embedding_service = EmbeddingService(openai_client),
-        search_indexer = AzureSearchIndexer(
-            search_api_url = AZURE_SEARCH_API_URL,
-            search_api_key = AZURE_SEARCH_API_KEY
-        ),
-        logger=logging
+        embedding_service = EmbeddingService(openai_client, tokenizer, EmbeddingCache(EMBEDDING_CACHE_PATH), embedding_rate_limiter, VECTOR_FORMAT, embedding_deployment),
+        search_indexer = search_backend,
+        logger=logging,
+        checkpoint_store = checkpoint_store
     )
+    async_indexing_service = None
+    # The local index is in-process and has no async variant
+    if INGESTION_ENGINE == "async" and SEARCH_BACKEND != "local":
+        from src.asyncembeddingservice import AsyncEmbeddingService
+        from src.asyncazuresearchindexer import AsyncAzureSearchIndexer
+        from src.asyncpdfindexingservice import AsyncPdfIndexingService
+        async_indexing_service = AsyncPdfIndexingService(
+            pdf_processor = indexing_service.pdf_processor,
+            embedding_service = AsyncEmbeddingService(
+                AsyncAzureOpenAI(api_version="2023-05-15", azure_endpoint=AZURE_OPENAI_ENDPOINT, max_retries=0),
+                tokenizer,
+                indexing_service.embedding_service.cache,
+                rate_limiter = embedding_rate_limiter,
+                vector_format = VECTOR_FORMAT,
+                model = embedding_deployment
+            ),
+            search_indexer = AsyncAzureSearchIndexer(
+                search_api_url = os.environ["AZURE_SEARCH_API_URL"],
+                search_api_key = os.environ["AZURE_SEARCH_API_KEY"],
+                compress = AZURE_SEARCH_GZIP_REQUESTS,
+                index_name = search_backend.index_name,
+                stamp_documents = search_backend.stamp_documents
+            ),
+            logger=logging,
+            checkpoint_store = checkpoint_store
+        )
+    return indexing_service, async_indexing_service
 
-    blob_service_client = BlobServiceClient.from_connection_string(UPLOAD_STORAGE_CONNECTION_STRING)
-    blob_storage_service = BlobStorageService(blob_service_client) 
-    dependencies_initialized = True
+def _create_checkpoint_store():
+    if INGESTION_CHECKPOINTS == "none":
+        return None
+    if INGESTION_CHECKPOINTS == "local":
+        from src.ingestioncheckpoint import LocalCheckpointStore
+        return LocalCheckpointStore(INGESTION_CHECKPOINT_PATH)
+    from azure.storage.blob import BlobServiceClient
+    from src.ingestioncheckpoint import BlobCheckpointStore
+    blob_service_client = BlobServiceClient.from_connection_string(os.environ["UPLOAD_STORAGE_CONNECTION_STRING"])
+    return BlobCheckpointStore(blob_service_client.get_container_client(INGESTION_CHECKPOINT_CONTAINER))
 
-    logging.info("Core dependencies initialized successfully.")
-except Exception as e:
-    logging.critical(f"Failed to initialize core dependencies: {e}", exc_info=True)
-    dependencies_initialized = False
+def _blob_storage_or_none():
+    try:
+        return get_blob_storage_service()
+    except Exception as e:
+        logging.critical(f"Failed to initialize blob storage: {e}", exc_info=True)
+        return None
 
 
 @app.blob_trigger(arg_name="myblob", path="%UPLOAD_BLOB_PATH%", connection="UPLOAD_STORAGE_CONNECTION_STRING") 
-def IndexPdfFunction(myblob: func.InputStream):
+async def IndexPdfFunction(myblob: func.InputStream):
     logging.info(f"Python blob trigger function processed blob"
                 f"Name: {myblob.name}"
                 f"Blob Size: {myblob.length} bytes")
 
     if myblob.name.endswith(".pdf"):
-
-        indexing_service.process_and_index_pdf(io.BytesIO(myblob.read()), myblob.name)
-
+        # A retry of the same blob version resumes from its checkpoint
+        etag = (myblob.blob_properties or {}).get("ETag")
+        await _index_pdf(myblob, myblob.length, myblob.name, etag)
         logging.info(f"Successfully completed trigger processing for blob: {myblob.name}")
     else:
         logging.error(f"Blob is not a PDF file: {myblob.name}")
-        
+
+async def index_stored_blob(blob_path, version=None):
+    """Indexes a PDF already in storage, as the blob trigger would.
+
+    blob_path is "container/name". A version (the backfill run id) is added
+    to the blob's ETag for the checkpoint, so a backfill re-indexes
+    documents the trigger already completed, and a rerun of the same
+    backfill still skips the ones it finished.
+    """
+    container_name, blob_name = blob_path.split("/", 1)
+    blob_storage_service = await asyncio.to_thread(get_blob_storage_service)
+    downloader = await asyncio.to_thread(blob_storage_service.download_blob, container_name, blob_name)
+    etag = downloader.properties.etag
+    if version:
+        etag = f"{etag}/{version}"
+    await _index_pdf(downloader, downloader.size, blob_path, etag)
+
+async def _index_pdf(stream, length, source, etag):
+    # Built off the event loop: the first call loads the tokenizer and SDKs
+    indexing_service, async_indexing_service = await asyncio.to_thread(get_indexing_services)
+    # Handed to the PDF processor as is, or through a temporary file for
+    # large blobs, instead of being copied into a BytesIO
+    with await asyncio.to_thread(SpooledPdf.spool, stream, length, PDF_MAX_IN_MEMORY_BYTES) as pdf:
+        if async_indexing_service is not None:
+            await async_indexing_service.process_and_index_pdf(pdf, source, etag)
+        else:
+            # Keep the worker's event loop free while the threaded pipeline runs
+            await asyncio.to_thread(indexing_service.process_and_index_pdf, pdf, source, etag)
+
+@app.route(route="backfill", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@app.queue_output(arg_name="messages", queue_name=BACKFILL_QUEUE_NAME, connection="UPLOAD_STORAGE_CONNECTION_STRING")
+async def start_backfill(req: Request, messages: func.Out[List[str]]) -> JSONResponse:
+    """Queues every PDF in the upload container (or under ?prefix=) for
+    re-indexing by BackfillPdfFunction. ?run_id= names the run; queueing
+    the same run again skips the documents it already completed."""
+    blob_storage_service = await asyncio.to_thread(_blob_storage_or_none)
+    if blob_storage_service is None:
+        return JSONResponse({"error":"Service not ready"}, status_code=503)
+
+    prefix = req.query_params.get('prefix')
+    run_id = req.query_params.get('run_id') or time.strftime("%Y%m%dT%H%M%S")
+    try:
+        blob_paths = await asyncio.to_thread(lambda: list(blob_storage_service.iter_blob_names(UPLOAD_CONTAINER_NAME, prefix)))
+    except Exception as e:
+        logging.error(f"Error listing blobs for backfill: {e}", exc_info=True)
+        return JSONResponse({"error": "Failed to list blobs"}, status_code=500)
+    queued = [json.dumps({"blob": blob_path, "version": run_id}) for blob_path in blob_paths if blob_path.endswith(".pdf")]
+    messages.set(queued)
+    logging.info(f"Backfill {run_id} queued {len(queued)} documents")
+    return JSONResponse({"run_id": run_id, "queued": len(queued)}, status_code=202)
+
+# How many documents each instance works on at once is set by the queue
+# batchSize and newBatchThreshold in host.json
+@app.queue_trigger(arg_name="msg", queue_name=BACKFILL_QUEUE_NAME, connection="UPLOAD_STORAGE_CONNECTION_STRING")
+async def BackfillPdfFunction(msg: func.QueueMessage):
+    message = msg.get_json()
+    await index_stored_blob(message["blob"], message.get("version"))
+    logging.info(f"Backfilled blob: {message['blob']}")
+
+def _etag_matches(if_none_match, etag):
+    """True when an If-None-Match header lists etag, or is "*".
+
+    Tags are compared exactly, so a weak W/ tag never matches the strong
+    one GET /blobs sends.
+    """
+    if not if_none_match:
+        return False
+    tags = re.findall(r'\*|(?:W/)?"[^"]*"', if_none_match)
+    return "*" in tags or etag in tags
+
 @app.route(route="blobs", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
-def list_blobs(req: func.HttpRequest) -> func.HttpResponse:
+async def list_blobs(req: Request) -> Response:
     logging.info('GET /blobs request received.')
-    if not dependencies_initialized:
-        return func.HttpResponse(json.dumps({"error":"Service not ready"}), status_code=503, mimetype="application/json")
+    blob_storage_service = await asyncio.to_thread(_blob_storage_or_none)
+    if blob_storage_service is None:
+        return JSONResponse({"error":"Service not ready"}, status_code=503)
 
-    prefix = req.params.get('prefix')
+    prefix = req.query_params.get('prefix')
+    # With a limit, or the continuation_token of the previous response, one
+    # page is listed instead of the whole container
+    continuation_token = req.query_params.get('continuation_token')
+    limit = req.query_params.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_BLOB_LIST_LIMIT:
+            return JSONResponse({"error": f"limit must be between 1 and {MAX_BLOB_LIST_LIMIT}"}, status_code=400)
+        limit = int(limit)
 
     try:
-        blob_data = blob_storage_service.list_blob_names(UPLOAD_CONTAINER_NAME, prefix)
-        return func.HttpResponse(json.dumps(blob_data), mimetype="application/json")
+        blob_data = await asyncio.to_thread(blob_storage_service.list_blob_names, UPLOAD_CONTAINER_NAME, prefix, limit, continuation_token)
+        body = json.dumps(blob_data)
+        # Clients that send back the ETag of an unchanged listing get a 304
+        # without the body
+        etag = f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(req.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, headers=headers, media_type="application/json")
     except Exception as e:
         logging.error(f"Error listing blobs: {e}", exc_info=True)
-        return func.HttpResponse(json.dumps({"error": "Failed to list blobs"}), status_code=500, mimetype="application/json")
+        return JSONResponse({"error": "Failed to list blobs"}, status_code=500)
 
 @app.route(route="blobs", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
-def upload_blob(req: func.HttpRequest) -> func.HttpResponse:
-    if not dependencies_initialized:
-        return func.HttpResponse(json.dumps({"error":"Service not ready"}), status_code=503, mimetype="application/json")
+async def upload_blob(req: Request) -> JSONResponse:
+    # A streamed request (HTTP streams): the body is staged to storage block
+    # by block as it arrives instead of being buffered whole in the worker
+    blob_storage_service = await asyncio.to_thread(_blob_storage_or_none)
+    if blob_storage_service is None:
+        return JSONResponse({"error":"Service not ready"}, status_code=503)
 
     # Get blob path from header instead of route parameter
     blob_path = req.headers.get("x-blob-path")
     if not blob_path:
-         return func.HttpResponse(json.dumps({"error": "Blob path missing in headers"}), status_code=400, mimetype="application/json")
+         return JSONResponse({"error": "Blob path missing in headers"}, status_code=400)
 
     try:
-        file_content = req.get_body()
-        if not file_content:
-             return func.HttpResponse(json.dumps({"error": "Request body is empty"}), status_code=400, mimetype="application/json")
-
-        upload_result = blob_storage_service.upload_blob(
+        upload_result = await blob_storage_service.upload_blob_stream(
             container_name=UPLOAD_CONTAINER_NAME,
             blob_name=blob_path,
-            file_content=file_content,
-            overwrite=True 
+            chunks=req.stream(),
+            overwrite=True
         )
+        if upload_result.get("empty"):
+             return JSONResponse({"error": "Request body is empty"}, status_code=400)
 
         status_code = 201 if upload_result.get("success") else 500
-        return func.HttpResponse(json.dumps(upload_result), status_code=status_code, mimetype="application/json")
+        return JSONResponse(upload_result, status_code=status_code)
 
     except Exception as e:
         logging.error(f"Upload Error ({UPLOAD_CONTAINER_NAME}/{blob_path}): {e}", exc_info=True)
-        return func.HttpResponse(json.dumps({"error": "An unexpected error occurred"}), status_code=500, mimetype="application/json")
+        return JSONResponse({"error": "An unexpected error occurred"}, status_code=500)
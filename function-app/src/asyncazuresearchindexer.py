@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import json
+import logging
+import aiohttp
+from . import telemetry
+from .azuresearchindexer import (
+    AzureSearchIndexer,
+    batch_payload,
+    document_ids_query,
+    encode_documents,
+    indexed_at_now,
+    pack_documents,
+    prepare_document,
+    split_item_results
+)
+
+class AsyncAzureSearchIndexer:
+    """Asyncio counterpart of AzureSearchIndexer built on aiohttp.
+
+    Uses the same batching limits and retry rules; every batch of a call is
+    uploaded concurrently, with at most max_concurrency requests in flight.
+    """
+
+    INDEX_NAME = AzureSearchIndexer.INDEX_NAME
+    API_VERSION = AzureSearchIndexer.API_VERSION
+    SEARCH_API_ULR = AzureSearchIndexer.SEARCH_API_ULR
+    DOCS_SEARCH_URL = AzureSearchIndexer.DOCS_SEARCH_URL
+    SEARCH_PAGE_SIZE = AzureSearchIndexer.SEARCH_PAGE_SIZE
+    MAX_BATCH_DOCUMENTS = AzureSearchIndexer.MAX_BATCH_DOCUMENTS
+    MAX_BATCH_BYTES = AzureSearchIndexer.MAX_BATCH_BYTES
+    MAX_RETRIES = AzureSearchIndexer.MAX_RETRIES
+    RETRY_BACKOFF_SECONDS = AzureSearchIndexer.RETRY_BACKOFF_SECONDS
+    RETRYABLE_ITEM_STATUS_CODES = AzureSearchIndexer.RETRYABLE_ITEM_STATUS_CODES
+    RETRYABLE_STATUS_CODES = AzureSearchIndexer.RETRYABLE_STATUS_CODES
+    COMPRESS_MIN_BYTES = AzureSearchIndexer.COMPRESS_MIN_BYTES
+    MAX_CONCURRENCY = 8
+
+    def __init__(
+            self,
+            search_api_url: str,
+            search_api_key: str,
+            session: aiohttp.ClientSession = None,
+            timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(sock_connect=5, sock_read=60),
+            compress: bool = False,
+            max_concurrency: int = None,
+            index_name: str = None,
+            stamp_documents: bool = False
+        ):
+        self.search_api_url = search_api_url
+        # A concrete index, as for AzureSearchIndexer, and so is stamp_documents
+        self.index_name = index_name or self.INDEX_NAME
+        self.stamp_documents = stamp_documents
+        self.search_api_key = search_api_key
+        self.session = session
+        self.timeout = timeout
+        self.compress = compress
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def __get_session(self):
+        # aiohttp sessions must be created inside a running event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60),
+                timeout=self.timeout
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def __post(self, url, data, operation):
+        headers = {
+            "Content-Type": "application/json",
+            "api-key": self.search_api_key
+        }
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.compress and len(data) >= self.COMPRESS_MIN_BYTES:
+            data = gzip.compress(data, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        telemetry.record(telemetry.PAYLOAD_SIZE, len(data), operation=operation, compressed="Content-Encoding" in headers)
+        async with self.semaphore:
+            async with self.__get_session().post(url, headers=headers, data=data) as response:
+                return response.status, await response.text()
+
+    def __index_url(self):
+        return self.SEARCH_API_ULR.format(self.search_api_url, self.index_name, self.API_VERSION)
+
+    async def index_documents(self, chunks, embeddings):
+        """Uploads chunks; returns {key: error} for documents that could not be indexed."""
+        indexed_at = indexed_at_now() if self.stamp_documents else None
+        with telemetry.span("search.index", documents=len(chunks)):
+            return await self.__submit_documents([
+                prepare_document(chunk, embedding, indexed_at)
+                for chunk, embedding in zip(chunks, embeddings)
+            ])
+
+    async def delete_documents(self, keys):
+        with telemetry.span("search.delete", documents=len(keys)):
+            return await self.__submit_documents([
+                {"@search.action": "delete", "id": key}
+                for key in keys
+            ])
+
+    async def get_document_ids(self, source):
+        ids = []
+        while True:
+            status, text = await self.__post(
+                self.DOCS_SEARCH_URL.format(self.search_api_url, self.index_name, self.API_VERSION),
+                json.dumps(document_ids_query(source, self.SEARCH_PAGE_SIZE, len(ids))),
+                "search.ids"
+            )
+            if status >= 400:
+                raise RuntimeError(f"Document id lookup for {source} failed with status {status}: {text}")
+            page = [document["id"] for document in json.loads(text).get("value", [])]
+            ids.extend(page)
+            if len(page) < self.SEARCH_PAGE_SIZE:
+                return ids
+
+    async def __submit_documents(self, documents):
+        batches = list(pack_documents(encode_documents(documents), self.MAX_BATCH_DOCUMENTS, self.MAX_BATCH_BYTES))
+        for batch in batches:
+            telemetry.record(telemetry.BATCH_SIZE, len(batch), stage="search.upload")
+        failed = {}
+        for batch_failures in await asyncio.gather(*(self.__upload_batch(batch) for batch in batches)):
+            failed.update(batch_failures)
+        return failed
+
+    async def __upload_batch(self, batch):
+        pending = dict(batch)
+        failed = {}
+        last_errors = {}
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                telemetry.count(telemetry.RETRIES, operation="search.index")
+                await asyncio.sleep(self.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            try:
+                status, text = await self.__post(self.__index_url(), batch_payload(pending.values()), "search.index")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Index request for {len(pending)} documents failed (attempt {attempt + 1}): {e}")
+                last_errors = {key: str(e) for key in pending}
+                continue
+
+            logging.info(f"Indexed batch of {len(pending)} documents, status code: {status}")
+            if status in self.RETRYABLE_STATUS_CODES:
+                if status == 429:
+                    telemetry.count(telemetry.THROTTLES, operation="search.index")
+                last_errors = {key: text for key in pending}
+                continue
+            if status not in (200, 207):
+                failed.update({key: text for key in pending})
+                pending = {}
+                break
+
+            retry, last_errors, item_failures = split_item_results(
+                json.loads(text).get("value", []), pending, self.RETRYABLE_ITEM_STATUS_CODES
+            )
+            failed.update(item_failures)
+            pending = retry
+            if not pending:
+                break
+            logging.info(f"Re-submitting {len(pending)} documents")
+
+        failed.update({key: last_errors.get(key) for key in pending})
+        for key, error in failed.items():
+            logging.error(f"Failed to index document {key}: {error}")
+        return failed
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from openai import AsyncAzureOpenAI
+from . import telemetry
+from .embeddingcache import EmbeddingCache
+from .embeddingservice import EmbeddingService, pack_batches
+from .ratelimiter import RateLimiter, is_throttled
+from .vectorformat import check_vector_format, decode_embedding, encode_vector
+
+class AsyncEmbeddingService:
+    """Asyncio counterpart of EmbeddingService.
+
+    Batches are packed the same way, but all of them are sent concurrently,
+    with at most max_concurrency requests in flight.
+    """
+
+    MAX_BATCH_SIZE = EmbeddingService.MAX_BATCH_SIZE
+    MAX_BATCH_TOKENS = EmbeddingService.MAX_BATCH_TOKENS
+    MAX_CONCURRENCY = 16
+    MODEL = EmbeddingService.MODEL
+
+    def __init__(
+            self,
+            azureOpenAI : AsyncAzureOpenAI,
+            tokenizer = None,
+            cache : EmbeddingCache = None,
+            max_concurrency : int = None,
+            rate_limiter : RateLimiter = None,
+            vector_format : str = None,
+            model : str = None
+        ):
+        self.azureOpenAI = azureOpenAI
+        self.model = model or self.MODEL
+        self.tokenizer = tokenizer
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        # None keeps embeddings as lists of floats; a format from
+        # vectorformat.VECTOR_FORMATS returns NumPy arrays of that type
+        self.vector_format = vector_format and check_vector_format(vector_format)
+        self.semaphore = asyncio.Semaphore(max_concurrency or self.MAX_CONCURRENCY)
+
+    def __request_options(self):
+        # Raw float32 bytes instead of a JSON list of numbers to parse
+        return {"encoding_format": "base64"} if self.vector_format else {}
+
+    def __to_format(self, embeddings):
+        if not self.vector_format:
+            return embeddings
+        return [None if embedding is None else encode_vector(embedding, self.vector_format) for embedding in embeddings]
+
+    def count_tokens(self, text):
+        if self.tokenizer is None:
+            return len(text) // 4 + 1
+        return len(self.tokenizer.encode(text))
+
+    async def get_embedding(self, text, model=None):
+        return (await self.get_embeddings([text], model))[0]
+
+    async def get_embeddings(self, texts, model=None):
+        """Returns one embedding per text in input order, None where embedding failed."""
+        model = model or self.model
+        with telemetry.span("embedding.embed", texts=len(texts)) as span:
+            if self.cache is None:
+                return self.__to_format(await self.__embed_all(texts, model))
+
+            # SQLite reads and writes block, so they run off the event loop
+            # while other batches and uploads keep going
+            embeddings = await asyncio.to_thread(self.cache.get_many, model, texts)
+            missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+            span.set_attribute("cache_misses", len(missing))
+            if missing:
+                fresh = await self.__embed_all(missing, model)
+                await asyncio.to_thread(self.cache.put_many, model, missing, fresh)
+                fresh_by_text = dict(zip(missing, fresh))
+                embeddings = [
+                    embedding if embedding is not None else fresh_by_text[text]
+                    for text, embedding in zip(texts, embeddings)
+                ]
+            return self.__to_format(embeddings)
+
+    async def __embed_all(self, texts, model):
+        embeddings = [None] * len(texts)
+        batches = pack_batches(texts, self.count_tokens, self.MAX_BATCH_SIZE, self.MAX_BATCH_TOKENS)
+        await asyncio.gather(*(self.__embed_batch(texts, batch, model, embeddings) for batch in batches))
+        return embeddings
+
+    async def __create(self, inputs, model):
+        telemetry.record(telemetry.BATCH_SIZE, len(inputs), stage="embedding.request")
+        with telemetry.span("embedding.request", texts=len(inputs)):
+            if self.rate_limiter is None:
+                return await self.azureOpenAI.embeddings.create(input=inputs, model=model, **self.__request_options())
+            return await self.rate_limiter.call_async(
+                lambda: self.azureOpenAI.embeddings.create(input=inputs, model=model, **self.__request_options()),
+                tokens=sum(self.count_tokens(text) for text in inputs)
+            )
+
+    async def __embed_batch(self, texts, indices, model, embeddings):
+        try:
+            async with self.semaphore:
+                response = await self.__create([texts[i] for i in indices], model)
+        except Exception as e:
+            if len(indices) == 1 or is_throttled(e):
+                logging.error(f"Failed to embed {len(indices)} text(s) starting at position {indices[0]}: {e}")
+                return
+            logging.warning(f"Embedding batch of {len(indices)} texts failed, splitting and retrying: {e}")
+            middle = len(indices) // 2
+            await asyncio.gather(
+                self.__embed_batch(texts, indices[:middle], model, embeddings),
+                self.__embed_batch(texts, indices[middle:], model, embeddings)
+            )
+            return
+
+        for item in response.data:
+            embeddings[indices[item.index]] = decode_embedding(item.embedding) if self.vector_format else item.embedding
@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .pdfprocessor import PDFProcessor
+from .asyncembeddingservice import AsyncEmbeddingService
+from .asyncazuresearchindexer import AsyncAzureSearchIndexer
+from .ingestioncheckpoint import CheckpointStore, IngestionProgress, IN_PROGRESS, FAILED, COMPLETED
+from . import telemetry
+
+class AsyncPdfIndexingService:
+    """Asyncio variant of PdfIndexingService.
+
+    Extraction and chunking run on one dedicated thread (PyMuPDF documents
+    must stay on a single thread) while every chunk batch is embedded and
+    indexed as its own task, so dozens of embedding and index calls can be
+    in flight from a single worker.
+    """
+
+    EMBED_BATCH_SIZE = 16
+    # Chunk batches being embedded or indexed at once; bounds memory the
+    # same way MAX_CHUNKS_IN_FLIGHT does for the threaded pipeline
+    MAX_BATCHES_IN_FLIGHT = 16
+
+    def __init__(
+        self,
+        pdf_processor: PDFProcessor,
+        embedding_service: AsyncEmbeddingService,
+        search_indexer: AsyncAzureSearchIndexer,
+        logger: logging.Logger = logging.getLogger(__name__),
+        checkpoint_store: CheckpointStore = None
+    ):
+        self.pdf_processor = pdf_processor
+        self.embedding_service = embedding_service
+        self.search_indexer = search_indexer
+        self.logger = logger
+        self.checkpoint_store = checkpoint_store
+
+    async def process_and_index_pdf(self, pdf_stream: io.BytesIO, blob_name: str, etag: str = None):
+        """See PdfIndexingService.process_and_index_pdf."""
+        self.logger.info(f"Starting processing for PDF: {blob_name}")
+        try:
+            # Indexed documents are durable once the service accepts them,
+            # so checkpoints need no flush
+            progress = await asyncio.to_thread(IngestionProgress.load, self.checkpoint_store, blob_name, etag)
+            if progress.completed:
+                self.logger.info(f"{blob_name} is already indexed at this version. Skipping.")
+                return
+            if progress.committed_page:
+                self.logger.info(f"Resuming {blob_name} after page {progress.committed_page}.")
+            with telemetry.span("ingest.pdf", engine="async") as span:
+                try:
+                    stats = await self.__run(pdf_stream, blob_name, progress)
+                except Exception:
+                    await self.__save_progress(progress, FAILED, blob_name)
+                    raise
+                complete = stats["indexed"] == stats["chunks"] - stats["unchanged"]
+                await self.__save_progress(progress, COMPLETED if complete else FAILED, blob_name)
+                for key in ("chunks", "unchanged", "indexed", "deleted"):
+                    span.set_attribute(key, stats[key])
+            if not stats["chunks"]:
+                self.logger.warning(f"No text chunks were extracted from {blob_name}. Skipping indexing.")
+                return
+
+            self.logger.info(f"Extracted {stats['chunks']} chunks from {blob_name}.")
+            self.logger.info(f"Skipped {stats['unchanged']} unchanged chunks from {blob_name}.")
+            self.logger.info(f"Indexed {stats['indexed']} of {stats['chunks'] - stats['unchanged']} new or changed chunks from {blob_name}.")
+            if stats["deleted"]:
+                self.logger.info(f"Deleted {stats['deleted']} stale chunks of {blob_name}.")
+            self.logger.info(f"Successfully processed and initiated indexing for chunks from {blob_name}")
+        except Exception as e:
+            self.logger.error(f"Failed during processing of {blob_name}: {e}", exc_info=True)
+            raise
+
+    async def __save_progress(self, progress, status, blob_name):
+        try:
+            await asyncio.to_thread(progress.save, status)
+        except Exception as e:
+            self.logger.error(f"Failed to save the ingestion checkpoint of {blob_name}: {e}")
+
+    def __next_batch(self, chunk_records):
+        batch = []
+        for chunk in chunk_records:
+            batch.append(chunk)
+            if len(batch) >= self.EMBED_BATCH_SIZE:
+                break
+        return batch
+
+    async def __run(self, pdf_stream, blob_name, progress):
+        existing_ids = set(await self.search_indexer.get_document_ids(blob_name))
+        current_ids = set(progress.committed_ids)
+        stats = {"chunks": 0, "unchanged": 0, "indexed": 0, "deleted": 0}
+        slots = asyncio.Semaphore(self.MAX_BATCHES_IN_FLIGHT)
+        tasks = []
+        loop = asyncio.get_running_loop()
+
+        chunk_records = self.pdf_processor.iter_chunks(pdf_stream, blob_name, progress.first_page)
+        # run_in_executor does not carry the context over like tasks do;
+        # running the generator in a copy keeps its spans in this trace
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-extract") as extractor:
+            try:
+                while batch := await loop.run_in_executor(extractor, context.run, self.__next_batch, chunk_records):
+                    stats["chunks"] += len(batch)
+                    current_ids.update(chunk['id'] for chunk in batch)
+                    changed = [chunk for chunk in batch if chunk['id'] not in existing_ids]
+                    stats["unchanged"] += len(batch) - len(changed)
+                    progress.add_chunks(batch, changed)
+                    if changed:
+                        await slots.acquire()
+                        tasks.append(asyncio.create_task(self.__embed_and_index(changed, blob_name, stats, slots, progress)))
+            except Exception:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                # Close the generator on the thread that has been driving it
+                await loop.run_in_executor(extractor, context.run, chunk_records.close)
+
+        await asyncio.gather(*tasks)
+
+        stale_ids = existing_ids - current_ids
+        if stale_ids:
+            failed = await self.search_indexer.delete_documents(sorted(stale_ids))
+            for chunk_id, error in failed.items():
+                self.logger.error(f"Error deleting stale chunk {chunk_id} of {blob_name}: {error}")
+            stats["deleted"] = len(stale_ids) - len(failed)
+        return stats
+
+    async def __embed_and_index(self, batch, blob_name, stats, slots, progress):
+        try:
+            try:
+                embeddings = await self.embedding_service.get_embeddings([chunk['content'] for chunk in batch])
+            except Exception as e:
+                for chunk in batch:
+                    self.logger.error(f"Error processing chunk {chunk.get('id')} for {blob_name}: {e}", exc_info=True)
+                return
+
+            chunks = []
+            vectors = []
+            for chunk, embedding in zip(batch, embeddings):
+                if embedding is None:
+                    self.logger.error(f"Error processing chunk {chunk.get('id')} for {blob_name}: no embedding was generated")
+                    continue
+                chunks.append(chunk)
+                vectors.append(embedding)
+            if not chunks:
+                return
+
+            try:
+                failed = await self.search_indexer.index_documents(chunks, vectors)
+            except Exception as e:
+                failed = {chunk.get('id'): e for chunk in chunks}
+            for chunk_id, error in failed.items():
+                self.logger.error(f"Error indexing chunk {chunk_id} for {blob_name}: {error}")
+            stats["indexed"] += len(chunks) - len(failed)
+            progress.indexed([chunk for chunk in chunks if chunk.get('id') not in failed])
+            if progress.due():
+                await self.__save_progress(progress, IN_PROGRESS, blob_name)
+        finally:
+            slots.release()
@@ -1,38 +1,256 @@
+import gzip
 import json
+import time
 import requests
 import logging
+from datetime import datetime, timezone
+from . import telemetry
+from .httptransport import DEFAULT_TIMEOUT, get_shared_session
+from .searchbackend import SearchBackend
+from .vectorformat import vector_values
 
-class AzureSearchIndexer:
+def prepare_document(chunk, embedding, indexed_at=None):
+    chunk['embedding'] = vector_values(embedding) if hasattr(embedding, "tolist") else embedding
+    chunk['@search.action'] = "upload"
+    if indexed_at:
+        chunk['indexed_at'] = indexed_at
+    if isinstance(chunk.get("metadata"), dict):
+        chunk["metadata"] = json.dumps(chunk["metadata"])
+    return chunk
+
+def indexed_at_now():
+    """The current time in the Edm.DateTimeOffset format of the indexed_at field."""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+def encode_documents(documents):
+    return [(document["id"], json.dumps(document).encode("utf-8")) for document in documents]
+
+def pack_documents(encoded_documents, max_documents, max_bytes):
+    """Groups (key, JSON bytes) pairs into /docs/index request bodies within both limits."""
+    envelope_bytes = len(b'{"value": []}')
+    batch = []
+    batch_bytes = envelope_bytes
+    for key, document in encoded_documents:
+        document_bytes = len(document) + 1
+        if batch and (len(batch) >= max_documents or batch_bytes + document_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = envelope_bytes
+        batch.append((key, document))
+        batch_bytes += document_bytes
+    if batch:
+        yield batch
+
+def batch_payload(documents):
+    return b'{"value": [' + b",".join(documents) + b"]}"
+
+def split_item_results(results, pending, retryable_status_codes):
+    """Splits the per-document results of a /docs/index response.
+
+    Returns (retry, retry_errors, failed): the pending documents worth
+    re-submitting, their latest errors, and the error message of every
+    document that failed for good.
+    """
+    retry = {}
+    retry_errors = {}
+    failed = {}
+    for result in results:
+        if result.get("status"):
+            continue
+        key = result.get("key")
+        if result.get("statusCode") in retryable_status_codes and key in pending:
+            retry[key] = pending[key]
+            retry_errors[key] = result.get("errorMessage")
+        else:
+            failed[key] = result.get("errorMessage")
+    return retry, retry_errors, failed
+
+def document_ids_query(source, top, skip):
+    escaped_source = source.replace("'", "''")
+    return {
+        "search": "*",
+        "filter": f"source eq '{escaped_source}'",
+        "select": "id",
+        "top": top,
+        "skip": skip
+    }
+
+def vector_query(vector, top_k):
+    return {
+        "vectorQueries": [{"kind": "vector", "vector": vector_values(vector), "k": top_k, "fields": "embedding"}],
+        "select": "id,content,metadata,source",
+        "top": top_k
+    }
+
+class AzureSearchIndexer(SearchBackend):
     INDEX_NAME = "rag-index"
-    API_VERSION = "2023-11-01"
+    # Edm.Half and Edm.SByte vector fields need 2024-07-01 or later
+    API_VERSION = "2024-07-01"
     SEARCH_API_ULR = "{}/indexes/{}/docs/index?api-version={}"
+    DOCS_SEARCH_URL = "{}/indexes/{}/docs/search?api-version={}"
+    SEARCH_PAGE_SIZE = 1000
+
+    # Service limits for a single /docs/index request
+    MAX_BATCH_DOCUMENTS = 1000
+    MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+    MAX_RETRIES = 3
+    RETRY_BACKOFF_SECONDS = 1.0
+    # Per-document status codes worth re-submitting: version conflict,
+    # index temporarily unavailable, service unavailable
+    RETRYABLE_ITEM_STATUS_CODES = {409, 422, 503}
+    RETRYABLE_STATUS_CODES = {429, 503}
+
+    # Bodies smaller than this are not worth compressing
+    COMPRESS_MIN_BYTES = 1024
 
     def __init__(
             self,
             search_api_url: str,
-            search_api_key: str
+            search_api_key: str,
+            session: requests.Session = None,
+            timeout = DEFAULT_TIMEOUT,
+            compress: bool = False,
+            index_name: str = None,
+            stamp_documents: bool = False
         ):
         self.search_api_url = search_api_url
+        # A concrete index, INDEX_NAME by default: the /docs requests use the
+        # GA API version, which does not take aliases, so callers resolve an
+        # alias first (SearchIndexAdmin.resolve)
+        self.index_name = index_name or self.INDEX_NAME
+        # Sets indexed_at on every document written; only for indexes that
+        # have the field, as the service rejects unknown ones
+        self.stamp_documents = stamp_documents
         self.search_api_key = search_api_key
+        self.session = session or get_shared_session()
+        self.timeout = timeout
+        self.compress = compress
+
+    def __headers(self):
+        return {
+            "Content-Type": "application/json",
+            "api-key": self.search_api_key
+        }
+
+    def __post(self, url, data, operation):
+        headers = self.__headers()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.compress and len(data) >= self.COMPRESS_MIN_BYTES:
+            data = gzip.compress(data, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        telemetry.record(telemetry.PAYLOAD_SIZE, len(data), operation=operation, compressed="Content-Encoding" in headers)
+        return self.session.post(url, headers=headers, data=data, timeout=self.timeout)
+
+    def __indexed_at(self):
+        return indexed_at_now() if self.stamp_documents else None
+
+    def __index_url(self):
+        return self.SEARCH_API_ULR.format(self.search_api_url, self.index_name, self.API_VERSION)
 
     def index_document(self, chunk, embedding):
-        chunk['embedding'] = embedding
-        chunk['@search.action'] = "upload"
-        if isinstance(chunk.get("metadata"), dict):
-            chunk["metadata"] = json.dumps(chunk["metadata"]) 
-        
+        chunk = prepare_document(chunk, embedding, self.__indexed_at())
+
         payload = {"value": [chunk]}
         logging.debug(payload)
-        
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.search_api_key 
-        }
-        response = requests.post(
-            self.SEARCH_API_ULR.format(self.search_api_url, self.INDEX_NAME, self.API_VERSION), 
-            headers=headers, 
-            data=json.dumps(payload)
-        )
+
+        response = self.__post(self.__index_url(), json.dumps(payload), "search.index")
 
         logging.info(f"Status Code: {response.status_code}")
-        logging.info(f"Response: {response.text}")
\ No newline at end of file
+        logging.info(f"Response: {response.text}")
+
+    def index_documents(self, chunks, embeddings):
+        """Uploads chunks in as few requests as the service limits allow.
+
+        Documents rejected with a transient per-item status are re-submitted
+        on their own. Returns a dict mapping the key of every document that
+        could not be indexed to its error message.
+        """
+        indexed_at = self.__indexed_at()
+        with telemetry.span("search.index", documents=len(chunks)):
+            return self.__submit_documents([
+                prepare_document(chunk, embedding, indexed_at)
+                for chunk, embedding in zip(chunks, embeddings)
+            ])
+
+    def delete_documents(self, keys):
+        """Removes documents by key. Returns failures like index_documents."""
+        with telemetry.span("search.delete", documents=len(keys)):
+            return self.__submit_documents([
+                {"@search.action": "delete", "id": key}
+                for key in keys
+            ])
+
+    def get_document_ids(self, source):
+        """Returns the keys of every indexed chunk of the given source document."""
+        ids = []
+        while True:
+            response = self.__post(
+                self.DOCS_SEARCH_URL.format(self.search_api_url, self.index_name, self.API_VERSION),
+                json.dumps(document_ids_query(source, self.SEARCH_PAGE_SIZE, len(ids))),
+                "search.ids"
+            )
+            response.raise_for_status()
+            page = [document["id"] for document in response.json().get("value", [])]
+            ids.extend(page)
+            if len(page) < self.SEARCH_PAGE_SIZE:
+                return ids
+
+    def search(self, vector, top_k=3):
+        with telemetry.span("search.query", top_k=top_k, backend="azure"):
+            response = self.__post(
+                self.DOCS_SEARCH_URL.format(self.search_api_url, self.index_name, self.API_VERSION),
+                json.dumps(vector_query(vector, top_k)),
+                "search.query"
+            )
+            response.raise_for_status()
+            return response.json().get("value", [])
+
+    def __submit_documents(self, documents):
+        failed = {}
+        for batch in pack_documents(encode_documents(documents), self.MAX_BATCH_DOCUMENTS, self.MAX_BATCH_BYTES):
+            telemetry.record(telemetry.BATCH_SIZE, len(batch), stage="search.upload")
+            failed.update(self.__upload_batch(batch))
+        return failed
+
+    def __upload_batch(self, batch):
+        pending = dict(batch)
+        failed = {}
+        last_errors = {}
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                telemetry.count(telemetry.RETRIES, operation="search.index")
+                time.sleep(self.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            payload = batch_payload(pending.values())
+            try:
+                response = self.__post(self.__index_url(), payload, "search.index")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Index request for {len(pending)} documents failed (attempt {attempt + 1}): {e}")
+                last_errors = {key: str(e) for key in pending}
+                continue
+
+            logging.info(f"Indexed batch of {len(pending)} documents, status code: {response.status_code}")
+            if response.status_code in self.RETRYABLE_STATUS_CODES:
+                if response.status_code == 429:
+                    telemetry.count(telemetry.THROTTLES, operation="search.index")
+                last_errors = {key: response.text for key in pending}
+                continue
+            if response.status_code not in (200, 207):
+                failed.update({key: response.text for key in pending})
+                pending = {}
+                break
+
+            retry, last_errors, item_failures = split_item_results(
+                response.json().get("value", []), pending, self.RETRYABLE_ITEM_STATUS_CODES
+            )
+            failed.update(item_failures)
+            pending = retry
+            if not pending:
+                break
+            logging.info(f"Re-submitting {len(pending)} documents")
+
+        failed.update({key: last_errors.get(key) for key in pending})
+        for key, error in failed.items():
+            logging.error(f"Failed to index document {key}: {error}")
+        return failed
@@ -0,0 +1,162 @@
+"""Bulk re-indexing of blobs that are already in storage.
+
+run_backfill() feeds blob paths to a pool of worker processes, each with
+its own OpenAI and search clients, and reports progress as it goes. The
+command line entry point backfills the upload container with the
+function app's own settings and services:
+
+    python -m src.backfill [--prefix PREFIX] [--processes N] [--tpm TPM] [--run-id ID]
+
+Each run has an id that becomes part of every document's checkpoint
+version: rerunning with the same --run-id after an interruption skips
+the documents that run completed and resumes the one it was in.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+class BackfillProgress:
+    """Counts documents and logs throughput every REPORT_SECONDS."""
+
+    REPORT_SECONDS = 30
+
+    def __init__(self, logger=logging.getLogger(__name__)):
+        self.logger = logger
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.listed = 0
+        self.listing_done = False
+        self.indexed = 0
+        self.failed = []
+
+    def done(self, blob_path, error=None):
+        if error is None:
+            self.indexed += 1
+        else:
+            self.failed.append(blob_path)
+            self.logger.error(f"Backfill of {blob_path} failed: {error}")
+        if time.monotonic() - self.reported >= self.REPORT_SECONDS:
+            self.report()
+
+    def report(self):
+        self.reported = time.monotonic()
+        elapsed = self.reported - self.started
+        finished = self.indexed + len(self.failed)
+        rate = finished / elapsed * 60 if elapsed else 0.0
+        remaining = f"{self.listed - finished} left" if self.listing_done else f"{self.listed} listed so far"
+        eta = ""
+        if self.listing_done and rate:
+            eta = f", about {(self.listed - finished) / rate:.0f} min to go"
+        self.logger.info(f"Backfill: {self.indexed} indexed, {len(self.failed)} failed, {remaining}; {rate:.1f} docs/min{eta}")
+
+def run_backfill(blob_paths, index_blob, processes=None, initializer=None, initargs=(), progress=None):
+    """Calls index_blob(blob_path) for every path, in processes worker
+    processes, and returns the BackfillProgress.
+
+    index_blob and initializer are pickled to the workers, so they must be
+    top-level functions (or partials of them). At most two documents per
+    process are queued ahead, so paths can come from a listing that is
+    still being paged through. With one process everything runs in the
+    calling process.
+    """
+    processes = processes or os.cpu_count() or 1
+    progress = progress or BackfillProgress()
+    if processes == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for blob_path in blob_paths:
+            progress.listed += 1
+            try:
+                index_blob(blob_path)
+            except Exception as e:
+                progress.done(blob_path, e)
+            else:
+                progress.done(blob_path)
+        progress.listing_done = True
+        progress.report()
+        return progress
+
+    # spawn rather than fork: the caller may have live threads and clients
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"), initializer=initializer, initargs=initargs) as pool:
+        pending = {}
+        for blob_path in blob_paths:
+            progress.listed += 1
+            pending[pool.submit(index_blob, blob_path)] = blob_path
+            if len(pending) >= processes * 2:
+                _collect(pending, progress)
+        progress.listing_done = True
+        while pending:
+            _collect(pending, progress)
+    progress.report()
+    return progress
+
+def _collect(pending, progress):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        blob_path = pending.pop(future)
+        error = future.exception()
+        progress.done(blob_path, error)
+
+# Each worker runs every document on one event loop: the function app
+# keeps its async clients (aiohttp session, semaphores) across documents,
+# and those stay bound to the loop they were first used on
+_worker_loop = None
+
+def _get_worker_loop():
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop
+
+def _init_function_app_worker():
+    _get_worker_loop()
+    import function_app
+    function_app.get_indexing_services()
+
+def _index_with_function_app(blob_path, run_id):
+    import function_app
+    _get_worker_loop().run_until_complete(function_app.index_stored_blob(blob_path, run_id))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--prefix", help="only blobs whose names start with this")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--tpm", type=int, help="embedding tokens per minute for the whole run, shared evenly by the workers")
+    parser.add_argument("--run-id", default=time.strftime("%Y%m%dT%H%M%S"), help="reuse to resume an interrupted run")
+    parser.add_argument("--report-seconds", type=float, default=BackfillProgress.REPORT_SECONDS, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    # The function app reads its settings on import, so each process's share
+    # of the embedding quota is set first; spawned workers inherit it
+    if args.tpm:
+        os.environ["AZURE_OPENAI_EMBEDDING_TPM"] = str(args.tpm // args.processes)
+    import function_app
+    if function_app.SEARCH_BACKEND == "local" and args.processes > 1:
+        # Every process would load the local index and save it whole over
+        # the others' writes
+        parser.error("the local search backend can only be backfilled with --processes 1")
+    blob_storage_service = function_app.get_blob_storage_service()
+    blob_paths = (
+        blob_path
+        for blob_path in blob_storage_service.iter_blob_names(function_app.UPLOAD_CONTAINER_NAME, args.prefix)
+        if blob_path.endswith(".pdf")
+    )
+    progress = BackfillProgress()
+    progress.REPORT_SECONDS = args.report_seconds
+    logging.info(f"Backfill {args.run_id} of {function_app.UPLOAD_CONTAINER_NAME}/{args.prefix or ''} with {args.processes} processes")
+    run_backfill(blob_paths, partial(_index_with_function_app, run_id=args.run_id), args.processes, _init_function_app_worker, progress=progress)
+    if progress.failed:
+        logging.error(f"{len(progress.failed)} documents failed: {', '.join(progress.failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,83 @@
+import asyncio
 import logging
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from azure.core import MatchConditions
 from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
 
 class BlobStorageService:
-    def __init__(self, blob_service_client):
+
+    # Content larger than one block is staged BLOCK_SIZE bytes at a time,
+    # MAX_CONCURRENCY blocks in parallel, then committed as a block list;
+    # at most MAX_CONCURRENCY blocks are held in memory
+    BLOCK_SIZE = 8 * 1024 * 1024
+    MAX_CONCURRENCY = 4
+    # Most names the storage service returns per listing page
+    MAX_PAGE_SIZE = 5000
+
+    def __init__(self, blob_service_client, block_size=None, max_concurrency=None):
         self.blob_service_client = blob_service_client
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
 
-    def list_blob_names(self, container_name, prefix=None):
+    def list_blob_names(self, container_name, prefix=None, limit=None, continuation_token=None):
+        """Lists the whole container, or with a limit or continuation_token one
+        page of it plus the continuation_token of the next page (None on the
+        last one)."""
+        paged = limit is not None or continuation_token is not None
         try:
             container_client = self.blob_service_client.get_container_client(container_name)
             blob_name_list = []
-            blobs = container_client.list_blobs(name_starts_with=prefix)
+            if paged:
+                pages = container_client.list_blobs(name_starts_with=prefix, results_per_page=limit).by_page(continuation_token=continuation_token)
+                blobs = next(pages, [])
+            else:
+                blobs = container_client.list_blobs(name_starts_with=prefix)
             for blob in blobs:
                 full_path = f"{container_name}/{blob.name}"
                 blob_name_list.append({"name": full_path})
+            if paged:
+                # The service marks the last page with an empty marker
+                return {"blobs": blob_name_list, "continuation_token": pages.continuation_token or None}
             return {"blobs": blob_name_list}
         except ResourceNotFoundError:
             logging.warning(f"Container not found: {container_name}")
-            return {"blobs": []}
+            return {"blobs": [], "continuation_token": None} if paged else {"blobs": []}
         except Exception as e:
             logging.error(f"Error listing blob names in {container_name}: {e}")
             raise
 
+    def iter_blob_names(self, container_name, prefix=None, page_size=None):
+        """Yields every blob path (container/name) page by page, so a large
+        container is never listed into memory at once."""
+        continuation_token = None
+        while True:
+            page = self.list_blob_names(container_name, prefix, page_size or self.MAX_PAGE_SIZE, continuation_token)
+            for blob in page["blobs"]:
+                yield blob["name"]
+            continuation_token = page["continuation_token"]
+            if not continuation_token:
+                return
+
+    def download_blob(self, container_name, blob_name):
+        """Opens a blob for reading; the returned downloader has read(),
+        size and properties.etag."""
+        blob_client = self.blob_service_client.get_blob_client(
+            container=container_name, blob=blob_name
+        )
+        return blob_client.download_blob(max_concurrency=self.max_concurrency)
+
     def upload_blob(self, container_name, blob_name, file_content, overwrite=True):
+        """file_content is bytes or a readable binary stream."""
         full_path = f"{container_name}/{blob_name}"
         try:
             blob_client = self.blob_service_client.get_blob_client(
                 container=container_name, blob=blob_name
             )
-            blob_client.upload_blob(file_content, overwrite=overwrite)
+            if isinstance(file_content, bytes) and len(file_content) <= self.block_size:
+                blob_client.upload_blob(file_content, overwrite=overwrite)
+            else:
+                self.__upload_blocks(blob_client, self.__read_blocks(file_content), overwrite)
             logging.info(f"Uploaded blob: {full_path}")
             return {"success": True, "path": full_path, "url": blob_client.url}
         except ResourceExistsError:
@@ -35,4 +85,105 @@ class BlobStorageService:
              return {"success": False, "error": "Blob already exists", "path": full_path}
         except Exception as e:
             logging.error(f"Failed to upload blob {full_path}: {e}")
-            return {"success": False, "error": str(e), "path": full_path}
\ No newline at end of file
+            return {"success": False, "error": str(e), "path": full_path}
+
+    async def upload_blob_stream(self, container_name, blob_name, chunks, overwrite=True):
+        """Uploads from an async iterable of byte chunks, such as a streamed
+        request body, staging each block as soon as it is complete."""
+        full_path = f"{container_name}/{blob_name}"
+        try:
+            blob_client = self.blob_service_client.get_blob_client(
+                container=container_name, blob=blob_name
+            )
+            slots = asyncio.Semaphore(self.max_concurrency)
+            upload_id = uuid.uuid4().hex
+            block_ids = []
+            tasks = []
+            try:
+                async for block in self.__collect_blocks(chunks):
+                    await slots.acquire()
+                    failed = [task for task in tasks if task.done() and task.exception()]
+                    if failed:
+                        slots.release()
+                        break
+                    block_id = self.__block_id(upload_id, len(block_ids))
+                    block_ids.append(block_id)
+                    tasks.append(asyncio.create_task(self.__stage_block_async(blob_client, block_id, block, slots)))
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            if not block_ids:
+                return {"success": False, "error": "Blob content is empty", "empty": True, "path": full_path}
+            await asyncio.to_thread(self.__commit_blocks, blob_client, block_ids, overwrite)
+            logging.info(f"Uploaded blob: {full_path} ({len(block_ids)} blocks)")
+            return {"success": True, "path": full_path, "url": blob_client.url}
+        except ResourceExistsError:
+             logging.warning(f"Blob exists, overwrite=False: {full_path}")
+             return {"success": False, "error": "Blob already exists", "path": full_path}
+        except Exception as e:
+            logging.error(f"Failed to upload blob {full_path}: {e}")
+            return {"success": False, "error": str(e), "path": full_path}
+
+    def __read_blocks(self, file_content):
+        if isinstance(file_content, bytes):
+            for start in range(0, len(file_content), self.block_size):
+                yield file_content[start:start + self.block_size]
+            return
+        while True:
+            block = file_content.read(self.block_size)
+            if not block:
+                return
+            yield block
+
+    async def __collect_blocks(self, chunks):
+        # Request bodies arrive in whatever chunk sizes the transport picks
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= self.block_size:
+                yield bytes(buffer[:self.block_size])
+                del buffer[:self.block_size]
+        if buffer:
+            yield bytes(buffer)
+
+    def __upload_blocks(self, blob_client, blocks, overwrite):
+        upload_id = uuid.uuid4().hex
+        block_ids = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            pending = set()
+            for block in blocks:
+                block_id = self.__block_id(upload_id, len(block_ids))
+                block_ids.append(block_id)
+                pending.add(pool.submit(blob_client.stage_block, block_id, block, length=len(block)))
+                # Read ahead no further than there are uploads in flight
+                if len(pending) >= self.max_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in pending:
+                future.result()
+        self.__commit_blocks(blob_client, block_ids, overwrite)
+
+    async def __stage_block_async(self, blob_client, block_id, block, slots):
+        try:
+            await asyncio.to_thread(blob_client.stage_block, block_id, block, length=len(block))
+        finally:
+            slots.release()
+
+    def __commit_blocks(self, blob_client, block_ids, overwrite):
+        # Staged blocks only become the blob's content here, in one step;
+        # blocks of a failed upload are never committed and expire on their own
+        if overwrite:
+            blob_client.commit_block_list(block_ids)
+        else:
+            blob_client.commit_block_list(block_ids, etag="*", match_condition=MatchConditions.IfMissing)
+
+    @staticmethod
+    def __block_id(upload_id, index):
+        # Every block id of a blob must have the same length; the SDK
+        # base64-encodes it. The per-upload prefix keeps two concurrent
+        # uploads of the same blob from committing each other's blocks.
+        return f"{upload_id}-{index:06d}"
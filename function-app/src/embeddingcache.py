@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+
+class EmbeddingCache:
+    """Content-addressed embedding store backed by a local SQLite file.
+
+    Entries are keyed by hash(model, text) and evicted least recently used
+    first once the cache holds more than max_entries vectors.
+    """
+
+    MAX_ENTRIES = 100_000
+
+    def __init__(self, path=":memory:", max_entries=None):
+        self.path = path
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        row = self._connection.execute("SELECT MAX(last_used) FROM embeddings").fetchone()
+        self._clock = row[0] or 0
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [text], [embedding])
+
+    def get_many(self, model, texts):
+        """Returns the cached embedding for each text, or None on a miss."""
+        keys = [self.make_key(model, text) for text in texts]
+        with self._lock:
+            found = {}
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._clock += 1
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, key) for key in found]
+                )
+                self._connection.commit()
+
+            results = []
+            for key in keys:
+                vector = found.get(key)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(array("f", vector).tolist())
+            return results
+
+    def put_many(self, model, texts, embeddings):
+        rows = [
+            (self.make_key(model, text), self.__to_bytes(embedding))
+            for text, embedding in zip(texts, embeddings)
+            if embedding is not None
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._clock += 1
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, vector, self._clock) for key, vector in rows]
+            )
+            self.__evict()
+            self._connection.commit()
+
+    def __to_bytes(self, embedding):
+        # NumPy arrays convert without a trip through Python floats
+        if hasattr(embedding, "astype"):
+            return embedding.astype("<f4").tobytes()
+        return array("f", embedding).tobytes()
+
+    def __evict(self):
+        count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            logging.debug(f"Evicted {excess} entries from embedding cache {self.path}")
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self)
+        }
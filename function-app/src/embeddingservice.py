@@ -1,16 +1,135 @@
+import logging
 from openai import AzureOpenAI
+from . import telemetry
+from .embeddingcache import EmbeddingCache
+from .ratelimiter import RateLimiter, is_throttled
+from .vectorformat import check_vector_format, decode_embedding, encode_vector
+
+def pack_batches(texts, count_tokens, max_items, max_tokens):
+    """Groups text positions into request-sized batches, keeping input order."""
+    batch = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        yield batch
 
 class EmbeddingService:
+
+    MAX_BATCH_SIZE = 16
+    MAX_BATCH_TOKENS = 8000
+    MODEL = "text-embedding-ada-002"
+
     def __init__(
             self,
-            azureOpenAI : AzureOpenAI
+            azureOpenAI : AzureOpenAI,
+            tokenizer = None,
+            cache : EmbeddingCache = None,
+            rate_limiter : RateLimiter = None,
+            vector_format : str = None,
+            model : str = None
         ):
         self.azureOpenAI = azureOpenAI
+        # Deployment the embeddings are requested from
+        self.model = model or self.MODEL
+        self.tokenizer = tokenizer
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        # None keeps embeddings as lists of floats; a format from
+        # vectorformat.VECTOR_FORMATS returns NumPy arrays of that type
+        self.vector_format = vector_format and check_vector_format(vector_format)
+
+    def get_embedding(self, text, model=None):
+        model = model or self.model
+        if self.cache is not None:
+            cached = self.cache.get(model, text)
+            if cached is not None:
+                return self.__to_format([cached])[0]
+        response = self.__create([text], model)
+        embedding = response.data[0].embedding
+        if self.vector_format:
+            embedding = decode_embedding(embedding)
+        if self.cache is not None:
+            self.cache.put(model, text, embedding)
+        return self.__to_format([embedding])[0]
+
+    def get_embeddings(self, texts, model=None):
+        """Embeds texts in as few requests as possible.
+
+        Returns one embedding per input text, in input order. Texts that
+        could not be embedded even on their own come back as None.
+        """
+        model = model or self.model
+        with telemetry.span("embedding.embed", texts=len(texts)) as span:
+            if self.cache is None:
+                embeddings = [None] * len(texts)
+                for batch in self.__pack_batches(texts):
+                    self.__embed_batch(texts, batch, model, embeddings)
+                return self.__to_format(embeddings)
+
+            embeddings = self.cache.get_many(model, texts)
+            # Each distinct uncached text is sent once, however often it repeats
+            missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+            span.set_attribute("cache_misses", len(missing))
+            if missing:
+                fresh = [None] * len(missing)
+                for batch in self.__pack_batches(missing):
+                    self.__embed_batch(missing, batch, model, fresh)
+                self.cache.put_many(model, missing, fresh)
+                fresh_by_text = dict(zip(missing, fresh))
+                embeddings = [
+                    embedding if embedding is not None else fresh_by_text[text]
+                    for text, embedding in zip(texts, embeddings)
+                ]
+            return self.__to_format(embeddings)
+
+    def __request_options(self):
+        # Raw float32 bytes instead of a JSON list of numbers to parse
+        return {"encoding_format": "base64"} if self.vector_format else {}
+
+    def __to_format(self, embeddings):
+        if not self.vector_format:
+            return embeddings
+        return [None if embedding is None else encode_vector(embedding, self.vector_format) for embedding in embeddings]
+
+    def count_tokens(self, text):
+        if self.tokenizer is None:
+            # Rough estimate for English text when no tokenizer is available
+            return len(text) // 4 + 1
+        return len(self.tokenizer.encode(text))
+
+    def __pack_batches(self, texts):
+        return pack_batches(texts, self.count_tokens, self.MAX_BATCH_SIZE, self.MAX_BATCH_TOKENS)
+
+    def __create(self, inputs, model):
+        telemetry.record(telemetry.BATCH_SIZE, len(inputs), stage="embedding.request")
+        with telemetry.span("embedding.request", texts=len(inputs)):
+            if self.rate_limiter is None:
+                return self.azureOpenAI.embeddings.create(input=inputs, model=model, **self.__request_options())
+            return self.rate_limiter.call(
+                lambda: self.azureOpenAI.embeddings.create(input=inputs, model=model, **self.__request_options()),
+                tokens=sum(self.count_tokens(text) for text in inputs)
+            )
+
+    def __embed_batch(self, texts, indices, model, embeddings):
+        try:
+            response = self.__create([texts[i] for i in indices], model)
+        except Exception as e:
+            # Splitting a throttled batch only multiplies the throttled calls
+            if len(indices) == 1 or is_throttled(e):
+                logging.error(f"Failed to embed {len(indices)} text(s) starting at position {indices[0]}: {e}")
+                return
+            logging.warning(f"Embedding batch of {len(indices)} texts failed, splitting and retrying: {e}")
+            middle = len(indices) // 2
+            self.__embed_batch(texts, indices[:middle], model, embeddings)
+            self.__embed_batch(texts, indices[middle:], model, embeddings)
+            return
 
-    def get_embedding(self, text, model="text-embedding-ada-002"):
-        response = self.azureOpenAI.embeddings.create(
-            input=[text],
-            model=model
-        )
-        return response.data[0].embedding
-    
\ No newline at end of file
+        for item in response.data:
+            embeddings[indices[item.index]] = decode_embedding(item.embedding) if self.vector_format else item.embedding
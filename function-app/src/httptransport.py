@@ -0,0 +1,32 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 60)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """Builds a keep-alive session with a bounded connection pool.
+
+    Retries are left to the callers, which know which responses are safe
+    to re-submit.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_shared_session():
+    """Returns the process-wide session, so connections and TLS sessions
+    survive across function invocations on the same worker."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
@@ -0,0 +1,121 @@
+"""Moves the search index to a new embedding model without downtime.
+
+The apps read and write through an index alias (AZURE_SEARCH_INDEX_NAME).
+A migration builds a versioned index next to the live one and swaps the
+alias over once it holds every document:
+
+    python -m src.indexmigration create --target rag-index-v2 --deployment text-embedding-3-large --dimensions 3072
+    python -m src.indexmigration backfill --target rag-index-v2 --processes 8 --tpm 240000
+    python -m src.indexmigration verify --target rag-index-v2
+    python -m src.indexmigration swap --target rag-index-v2
+
+While the backfill re-embeds, at the --tpm rate, the chat UI keeps
+querying the live index. The swap is one request; the chat UI follows it
+on its next alias lookup, together with the model the new index records.
+Restart the function app afterwards so new uploads go to the new index,
+then run the backfill once more to pick up documents uploaded meanwhile.
+The old index is left in place: swapping back to it is the rollback.
+
+A deployment that still names its index directly can adopt an alias with
+swap --alias rag --target rag-index, and AZURE_SEARCH_INDEX_NAME=rag.
+"""
+import argparse
+import logging
+import os
+import sys
+from .searchindexes import SearchIndexAdmin, versioned_definition
+
+class IndexMigration:
+
+    def __init__(self, admin: SearchIndexAdmin, alias: str, logger=logging):
+        self.admin = admin
+        self.alias = alias
+        self.logger = logger
+
+    def live_index(self):
+        """The index the alias points to; before an alias exists, the index
+        of that name."""
+        return self.admin.get_alias(self.alias) or self.alias
+
+    def create(self, target, deployment=None, resource_uri=None, model_name=None, dimensions=None):
+        """Creates target as a copy of the live index, for the embeddings of
+        deployment when given."""
+        live_index = self.live_index()
+        definition = self.admin.get_index(live_index)
+        if definition is None:
+            raise ValueError(f"Index {live_index} not found")
+        self.admin.create_index(versioned_definition(definition, target, deployment, resource_uri, model_name, dimensions))
+        self.logger.info(f"Created {target} from {live_index}")
+
+    def verify(self, target, tolerance=0):
+        """Whether target holds as many documents as the live index, give or
+        take tolerance."""
+        live_index = self.live_index()
+        if live_index == target:
+            raise ValueError(f"{self.alias} already points to {target}")
+        live_count = self.admin.count_documents(live_index)
+        target_count = self.admin.count_documents(target)
+        self.logger.info(f"{live_index}: {live_count} documents, {target}: {target_count} documents")
+        return abs(live_count - target_count) <= tolerance
+
+    def swap(self, target):
+        live_index = self.live_index()
+        if live_index == self.alias and self.admin.get_index(self.alias) is not None:
+            raise ValueError(f"{self.alias} is an index, not an alias; choose another alias name with --alias")
+        self.admin.set_alias(self.alias, target)
+        self.logger.info(f"{self.alias} now points to {target} (was {live_index})")
+
+def backfill(target, argv):
+    """Re-embeds every document into target with the function app's
+    backfill; the run id is the index name, so a rerun resumes it."""
+    # Read by function_app on import, here and in the backfill's workers;
+    # the deployment comes from the vectorizer create recorded on target
+    os.environ["AZURE_SEARCH_INDEX_NAME"] = target
+    os.environ["SEARCH_BACKEND"] = "azure"
+    from .backfill import main as backfill_main
+    return backfill_main(argv + ["--run-id", target])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--alias", default=os.environ.get("AZURE_SEARCH_INDEX_NAME", "rag"), help="index alias the apps use (default: AZURE_SEARCH_INDEX_NAME)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="create the new index next to the live one")
+    create.add_argument("--deployment", help="embedding deployment for the new index; default: the live index's")
+    create.add_argument("--model", help="model behind the deployment, if named differently")
+    create.add_argument("--dimensions", type=int, help="embedding size of the new model")
+    commands.add_parser("backfill", help="re-embed every document into the new index; other options go to src.backfill")
+    verify = commands.add_parser("verify", help="compare document counts of the live and the new index")
+    verify.add_argument("--tolerance", type=int, default=0, help="allowed difference in documents")
+    swap = commands.add_parser("swap", help="point the alias at the new index")
+    swap.add_argument("--force", action="store_true", help="swap even if the document counts differ")
+    for command in (create, commands.choices["backfill"], verify, swap):
+        command.add_argument("--target", required=True, help="name of the new index")
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command != "backfill":
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.command == "backfill":
+        return backfill(args.target, rest)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    admin = SearchIndexAdmin(os.environ["AZURE_SEARCH_API_URL"], os.environ["AZURE_SEARCH_API_KEY"])
+    migration = IndexMigration(admin, args.alias)
+    try:
+        if args.command == "create":
+            migration.create(args.target, args.deployment, os.environ.get("AZURE_OPENAI_ENDPOINT"), args.model, args.dimensions)
+        elif args.command == "verify":
+            if not migration.verify(args.target, args.tolerance):
+                logging.error("Document counts differ; run the backfill again")
+                return 1
+        elif args.command == "swap":
+            # A new alias has nothing to compare with
+            if not args.force and admin.get_alias(args.alias) is not None and not migration.verify(args.target):
+                logging.error("Document counts differ; run the backfill again, or swap with --force")
+                return 1
+            migration.swap(args.target)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
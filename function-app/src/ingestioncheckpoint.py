@@ -0,0 +1,187 @@
+"""Durable per-blob ingestion progress, so a retried trigger resumes a
+document instead of starting it over.
+
+A checkpoint is a small JSON object kept per source blob:
+
+- "etag": the blob version it describes; a new upload starts afresh
+- "status": "in_progress", "failed" or "completed"
+- "committed_page": every chunk of this page and the pages before it is
+  in the index
+- "chunk_ids": the ids of those chunks, so stale chunks of an earlier
+  version can still be told apart after a resume
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from abc import ABC, abstractmethod
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+IN_PROGRESS = "in_progress"
+FAILED = "failed"
+COMPLETED = "completed"
+
+class CheckpointStore(ABC):
+
+    @abstractmethod
+    def load(self, source):
+        """Returns the checkpoint of a source blob, or None."""
+
+    @abstractmethod
+    def save(self, source, checkpoint):
+        """Replaces the checkpoint of a source blob."""
+
+class LocalCheckpointStore(CheckpointStore):
+    """One JSON file per source in a directory; for local runs and tests."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __file(self, source):
+        return os.path.join(self.path, hashlib.sha256(source.encode("utf-8")).hexdigest() + ".json")
+
+    def load(self, source):
+        try:
+            with open(self.__file(source), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, source, checkpoint):
+        # Written next to the old file and swapped in, so a crash mid-write
+        # leaves the previous checkpoint rather than a torn one
+        path = self.__file(source)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(path + ".tmp", path)
+
+class BlobCheckpointStore(CheckpointStore):
+    """One JSON blob per source in a container, created on first save."""
+
+    def __init__(self, container_client):
+        self.container_client = container_client
+        self.container_ready = False
+
+    def load(self, source):
+        try:
+            return json.loads(self.container_client.download_blob(f"{source}.json").readall())
+        except ResourceNotFoundError:
+            return None
+
+    def save(self, source, checkpoint):
+        if not self.container_ready:
+            try:
+                self.container_client.create_container()
+            except ResourceExistsError:
+                pass
+            self.container_ready = True
+        self.container_client.upload_blob(f"{source}.json", json.dumps(checkpoint), overwrite=True)
+
+class IngestionProgress:
+    """Tracks which pages of a document are fully indexed while its chunks
+    are embedded and indexed out of order, and writes that high-water mark
+    as the document's checkpoint.
+
+    Chunks are registered in document order. A page is committed once all
+    of its changed chunks are reported indexed and a later page has been
+    registered, since until then more of its chunks may follow. Without a
+    store (or an ETag) nothing is tracked and every run starts at page one.
+    """
+
+    SAVE_INTERVAL_SECONDS = 10
+
+    def __init__(self, store=None, source=None, etag=None, checkpoint=None, flush=None):
+        self.store = store if etag else None
+        self.source = source
+        self.etag = etag
+        # Makes indexed chunks durable before a checkpoint claims them
+        self.flush = flush
+        checkpoint = checkpoint or {}
+        self.completed = checkpoint.get("status") == COMPLETED
+        self.committed_page = checkpoint.get("committed_page", 0)
+        self.committed_ids = list(checkpoint.get("chunk_ids", []))
+        self.pages = deque()
+        self.pending = {}
+        self.page_ids = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.saved_at = time.monotonic()
+
+    @classmethod
+    def load(cls, store, source, etag, flush=None):
+        """Picks up the stored checkpoint when it is for the same blob version."""
+        checkpoint = store.load(source) if store is not None and etag else None
+        if checkpoint is not None and checkpoint.get("etag") != etag:
+            checkpoint = None
+        return cls(store, source, etag, checkpoint, flush)
+
+    @property
+    def first_page(self):
+        return self.committed_page + 1
+
+    def add_chunks(self, chunks, changed):
+        """Registers the next chunks of the document and which of them still
+        have to be indexed."""
+        if self.store is None:
+            return
+        changed_ids = {chunk['id'] for chunk in changed}
+        with self.lock:
+            for chunk in chunks:
+                page_num = chunk['metadata']['source_page']
+                if page_num not in self.pending:
+                    self.pages.append(page_num)
+                    self.pending[page_num] = 0
+                    self.page_ids[page_num] = []
+                self.page_ids[page_num].append(chunk['id'])
+                if chunk['id'] in changed_ids:
+                    self.pending[page_num] += 1
+            self.__advance()
+
+    def indexed(self, chunks):
+        """Reports chunks that made it into the index."""
+        if self.store is None:
+            return
+        with self.lock:
+            for chunk in chunks:
+                self.pending[chunk['metadata']['source_page']] -= 1
+            self.__advance()
+
+    def __advance(self):
+        while len(self.pages) > 1 and self.pending[self.pages[0]] == 0:
+            page_num = self.pages.popleft()
+            del self.pending[page_num]
+            self.committed_ids.extend(self.page_ids.pop(page_num))
+            self.committed_page = page_num
+
+    def due(self):
+        """Whether an in-progress checkpoint should be written now; only one
+        caller per interval is told so."""
+        if self.store is None:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.saved_at < self.SAVE_INTERVAL_SECONDS:
+                return False
+            self.saved_at = now
+            return True
+
+    def save(self, status):
+        if self.store is None:
+            return
+        with self.save_lock:
+            if self.flush is not None and status != COMPLETED:
+                self.flush()
+            with self.lock:
+                checkpoint = {
+                    "etag": self.etag,
+                    "status": status,
+                    "committed_page": self.committed_page,
+                    # A completed document is never resumed
+                    "chunk_ids": [] if status == COMPLETED else list(self.committed_ids),
+                    "updated_at": time.time()
+                }
+            self.store.save(self.source, checkpoint)
+            self.saved_at = time.monotonic()
@@ -1,44 +1,258 @@
+import contextvars
 import io
 import logging
+import queue
+import threading
 from .pdfprocessor import PDFProcessor
 from .embeddingservice import EmbeddingService
-from .azuresearchindexer import AzureSearchIndexer
+from .searchbackend import SearchBackend
+from .ingestioncheckpoint import CheckpointStore, IngestionProgress, IN_PROGRESS, FAILED, COMPLETED
+from . import telemetry
+
+_STAGE_DONE = object()
 
 class PdfIndexingService:
+
+    # Pipeline tuning: worker threads per stage and items held between stages.
+    # Chunking is not tunable: checkpoints rely on pages being chunked in
+    # order, so it always runs on a single thread.
+    EMBED_WORKERS = 4
+    INDEX_WORKERS = 2
+    QUEUE_SIZE = 8
+    EMBED_BATCH_SIZE = 16
+    INDEX_BATCH_SIZE = 200
+    # Memory ceiling: chunks (text plus vector) held between chunking and
+    # indexing. Chunking waits for indexing to catch up once it is reached,
+    # so memory stays flat however many pages the document has.
+    MAX_CHUNKS_IN_FLIGHT = 256
+
     def __init__(
         self,
         pdf_processor: PDFProcessor,
         embedding_service: EmbeddingService,
-        search_indexer: AzureSearchIndexer,
-        logger: logging.Logger = logging.getLogger(__name__)
+        search_indexer: SearchBackend,
+        logger: logging.Logger = logging.getLogger(__name__),
+        checkpoint_store: CheckpointStore = None
     ):
         self.pdf_processor = pdf_processor
         self.embedding_service = embedding_service
         self.search_indexer = search_indexer
         self.logger = logger
+        self.checkpoint_store = checkpoint_store
 
-    def process_and_index_pdf(self, pdf_stream: io.BytesIO, blob_name: str):
+    def process_and_index_pdf(self, pdf_stream: io.BytesIO, blob_name: str, etag: str = None):
+        """Indexes one PDF. With a checkpoint store and the blob's ETag, a
+        retry of the same blob version resumes after the last committed page
+        and a completed one is skipped."""
         self.logger.info(f"Starting processing for PDF: {blob_name}")
         try:
-            chunk_records = self.pdf_processor.process_pdf_to_chunks(pdf_stream)
-            if not chunk_records:
-                self.logger.warning(f"No text chunks were extracted from {blob_name}. Skipping indexing.")
+            progress = IngestionProgress.load(self.checkpoint_store, blob_name, etag, self.search_indexer.flush)
+            if progress.completed:
+                self.logger.info(f"{blob_name} is already indexed at this version. Skipping.")
                 return
-
-            self.logger.info(f"Extracted {len(chunk_records)} chunks from {blob_name}.")
-
-            for i, chunk in enumerate(chunk_records):
-                chunk_id = chunk.get('id', f'chunk_{i}')
-                self.logger.debug(f"Processing chunk {i+1}/{len(chunk_records)} (ID: {chunk_id}) for {blob_name}")
+            if progress.committed_page:
+                self.logger.info(f"Resuming {blob_name} after page {progress.committed_page}.")
+            with telemetry.span("ingest.pdf", engine="threaded") as span:
                 try:
-                    embedding = self.embedding_service.get_embedding(chunk['content'])
-                    self.logger.debug(f"Generated embedding for chunk {chunk_id}")
-                    self.search_indexer.index_document(chunk, embedding)
-                    self.logger.debug(f"Indexed chunk {chunk_id}")
-                except Exception as chunk_error:
-                    self.logger.error(f"Error processing chunk {chunk_id} for {blob_name}: {chunk_error}", exc_info=True)
+                    stats = self.__run_pipeline(pdf_stream, blob_name, progress)
+                except Exception:
+                    self.__save_progress(progress, FAILED, blob_name)
+                    raise
+                # Chunks that failed on their own were logged, not raised;
+                # leave the document open so a re-run picks them up
+                complete = stats["indexed"] == stats["chunks"] - stats["unchanged"]
+                self.__save_progress(progress, COMPLETED if complete else FAILED, blob_name)
+                for key in ("chunks", "unchanged", "indexed", "deleted"):
+                    span.set_attribute(key, stats[key])
+            if not stats["chunks"]:
+                self.logger.warning(f"No text chunks were extracted from {blob_name}. Skipping indexing.")
+                return
 
+            self.logger.info(f"Extracted {stats['chunks']} chunks from {blob_name}.")
+            self.logger.info(f"Skipped {stats['unchanged']} unchanged chunks from {blob_name}.")
+            self.logger.info(f"Indexed {stats['indexed']} of {stats['chunks'] - stats['unchanged']} new or changed chunks from {blob_name}.")
+            if stats["deleted"]:
+                self.logger.info(f"Deleted {stats['deleted']} stale chunks of {blob_name}.")
             self.logger.info(f"Successfully processed and initiated indexing for chunks from {blob_name}")
         except Exception as e:
             self.logger.error(f"Failed during processing of {blob_name}: {e}", exc_info=True)
             raise
+
+    def __save_progress(self, progress, status, blob_name):
+        # Best effort: the pipeline's own error is the one to report
+        try:
+            progress.save(status)
+        except Exception as e:
+            self.logger.error(f"Failed to save the ingestion checkpoint of {blob_name}: {e}")
+
+    def __run_pipeline(self, pdf_stream, blob_name, progress):
+        """Runs extract -> chunk -> embed -> index with every stage in flight at once.
+
+        Extraction runs on the calling thread because PyMuPDF documents
+        cannot be shared across threads; the other stages run on worker
+        threads linked by bounded queues, so a slow stage applies
+        backpressure instead of letting work pile up in memory.
+        """
+        # Chunk ids are derived from content, so anything already indexed
+        # under the same id is unchanged and needs neither embedding nor upload
+        existing_ids = set(self.search_indexer.get_document_ids(blob_name))
+        # Chunks of pages committed by an earlier attempt are current too
+        current_ids = set(progress.committed_ids)
+        stats = {"chunks": 0, "unchanged": 0, "indexed": 0, "deleted": 0, "errors": []}
+        lock = threading.Lock()
+        abort = threading.Event()
+        in_flight = threading.Semaphore(self.MAX_CHUNKS_IN_FLIGHT)
+        page_queue = queue.Queue(self.QUEUE_SIZE)
+        embed_queue = queue.Queue(self.QUEUE_SIZE)
+        index_queue = queue.Queue(self.QUEUE_SIZE)
+
+        stages = [
+            (page_queue, self.__start_workers(1, self.__chunk_worker, page_queue, embed_queue, blob_name, existing_ids, current_ids, stats, lock, abort, in_flight, progress)),
+            (embed_queue, self.__start_workers(self.EMBED_WORKERS, self.__embed_worker, embed_queue, index_queue, blob_name, abort, in_flight)),
+            (index_queue, self.__start_workers(self.INDEX_WORKERS, self.__index_worker, index_queue, blob_name, stats, lock, abort, in_flight, progress)),
+        ]
+        try:
+            for page in self.pdf_processor.extract_pages(pdf_stream, progress.first_page):
+                if abort.is_set():
+                    break
+                page_queue.put(page)
+        except Exception:
+            abort.set()
+            raise
+        finally:
+            # Stages are closed in order so every stage sees all of its input
+            for inbox, workers in stages:
+                for _ in workers:
+                    inbox.put(_STAGE_DONE)
+                for worker in workers:
+                    worker.join()
+
+        if stats["errors"]:
+            raise stats["errors"][0]
+
+        stale_ids = existing_ids - current_ids
+        if stale_ids:
+            failed = self.search_indexer.delete_documents(sorted(stale_ids))
+            for chunk_id, error in failed.items():
+                self.logger.error(f"Error deleting stale chunk {chunk_id} of {blob_name}: {error}")
+            stats["deleted"] = len(stale_ids) - len(failed)
+        self.search_indexer.flush()
+        return stats
+
+    def __start_workers(self, count, target, *args):
+        # Each worker runs in a copy of the caller's context, so the spans
+        # of every stage belong to the document's trace
+        workers = [
+            threading.Thread(target=contextvars.copy_context().run, args=(target, *args), daemon=True)
+            for _ in range(max(1, count))
+        ]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def __chunk_worker(self, page_queue, embed_queue, blob_name, existing_ids, current_ids, stats, lock, abort, in_flight, progress):
+        batch = []
+        finished = False
+        while not finished:
+            page = page_queue.get()
+            if page is _STAGE_DONE:
+                break
+            # Tokenize every page that is already waiting in one batched call
+            pages = [page]
+            while True:
+                try:
+                    page = page_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if page is _STAGE_DONE:
+                    finished = True
+                    break
+                pages.append(page)
+            if abort.is_set():
+                continue
+            try:
+                chunk_records = self.pdf_processor.chunk_pages(pages, blob_name)
+            except Exception as e:
+                with lock:
+                    stats["errors"].append(e)
+                abort.set()
+                continue
+            changed = [chunk for chunk in chunk_records if chunk['id'] not in existing_ids]
+            with lock:
+                stats["chunks"] += len(chunk_records)
+                stats["unchanged"] += len(chunk_records) - len(changed)
+                current_ids.update(chunk['id'] for chunk in chunk_records)
+            progress.add_chunks(chunk_records, changed)
+            for chunk in changed:
+                if not in_flight.acquire(blocking=False):
+                    # Out of budget: hand over the partial batch so the
+                    # stages downstream can drain and free capacity
+                    if batch:
+                        embed_queue.put(batch)
+                        batch = []
+                    in_flight.acquire()
+                batch.append(chunk)
+                if len(batch) >= self.EMBED_BATCH_SIZE:
+                    embed_queue.put(batch)
+                    batch = []
+        if batch and not abort.is_set():
+            embed_queue.put(batch)
+
+    def __embed_worker(self, embed_queue, index_queue, blob_name, abort, in_flight):
+        while (batch := embed_queue.get()) is not _STAGE_DONE:
+            if abort.is_set():
+                in_flight.release(len(batch))
+                continue
+            try:
+                embeddings = self.embedding_service.get_embeddings([chunk['content'] for chunk in batch])
+            except Exception as e:
+                for chunk in batch:
+                    self.logger.error(f"Error processing chunk {chunk.get('id')} for {blob_name}: {e}", exc_info=True)
+                in_flight.release(len(batch))
+                continue
+
+            embedded = []
+            for chunk, embedding in zip(batch, embeddings):
+                if embedding is None:
+                    self.logger.error(f"Error processing chunk {chunk.get('id')} for {blob_name}: no embedding was generated")
+                    in_flight.release()
+                    continue
+                embedded.append((chunk, embedding))
+            self.logger.debug(f"Generated {len(embedded)} embeddings for {blob_name}")
+            if embedded:
+                index_queue.put(embedded)
+
+    def __index_worker(self, index_queue, blob_name, stats, lock, abort, in_flight, progress):
+        finished = False
+        while not finished:
+            item = index_queue.get()
+            if item is _STAGE_DONE:
+                break
+            documents = list(item)
+            # Coalesce whatever else is already waiting into one bulk request
+            while len(documents) < self.INDEX_BATCH_SIZE:
+                try:
+                    item = index_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STAGE_DONE:
+                    finished = True
+                    break
+                documents.extend(item)
+            if abort.is_set():
+                in_flight.release(len(documents))
+                continue
+
+            chunks = [chunk for chunk, _ in documents]
+            try:
+                failed = self.search_indexer.index_documents(chunks, [embedding for _, embedding in documents])
+            except Exception as e:
+                failed = {chunk.get('id'): e for chunk in chunks}
+            for chunk_id, error in failed.items():
+                self.logger.error(f"Error indexing chunk {chunk_id} for {blob_name}: {error}")
+            with lock:
+                stats["indexed"] += len(chunks) - len(failed)
+            progress.indexed([chunk for chunk in chunks if chunk.get('id') not in failed])
+            if progress.due():
+                self.__save_progress(progress, IN_PROGRESS, blob_name)
+            in_flight.release(len(documents))
@@ -1,27 +1,137 @@
-import uuid
+import hashlib
 import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz
-from transformers import GPT2TokenizerFast
+from . import telemetry
+from .spooledpdf import SpooledPdf
+
+def _extract_page_range(pdf_path, start, stop):
+    # Runs in a worker process: PyMuPDF documents cannot be shared, so each
+    # worker opens its own handle and reads only its range of pages
+    doc = fitz.open(pdf_path)
+    try:
+        pages = []
+        for page_index in range(start, stop):
+            text = doc.load_page(page_index).get_text()
+            if text:
+                pages.append((page_index + 1, text.strip()))
+        return pages
+    finally:
+        doc.close()
 
 class PDFProcessor:
 
     CHUNK_SIZE = 500
     CHUNK_OVERLAP = 50
+    # Pages tokenized together in one fast-tokenizer call
+    PAGE_BATCH_SIZE = 32
+    # Documents with at least this many pages are extracted by a process
+    # pool, PAGE_RANGE_SIZE pages per task; 1 process disables the pool
+    EXTRACT_PROCESSES = os.cpu_count() or 1
+    PARALLEL_EXTRACT_MIN_PAGES = 200
+    PAGE_RANGE_SIZE = 50
 
     def __init__(
             self,
-            tokenizer : GPT2TokenizerFast
+            tokenizer
         ):
+        # A tokenizer.SlimTokenizer or a transformers GPT2TokenizerFast
         self.tokenizer = tokenizer
+        self.__pool = None
+        self.__pool_lock = threading.Lock()
 
-    def __extract_text_from_pdf(self, pdf_stream : io.BytesIO):
-        doc = fitz.open(stream=pdf_stream.getvalue(), filetype="pdf")
-        full_text = []
-        for page_num, page in enumerate(doc):
-            text = page.get_text()
-            if text:
-                full_text.append((page_num + 1, text.strip()))
-        return full_text
+    def __get_pool(self):
+        with self.__pool_lock:
+            if self.__pool is None:
+                # spawn rather than fork: the caller may have live threads
+                self.__pool = ProcessPoolExecutor(
+                    max_workers=self.EXTRACT_PROCESSES,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self.__pool
+
+    def close(self):
+        with self.__pool_lock:
+            if self.__pool is not None:
+                self.__pool.shutdown(cancel_futures=True)
+                self.__pool = None
+
+    def extract_pages(self, pdf_stream, first_page=1):
+        """Yields (page number, text) one page at a time, from first_page on.
+
+        pdf_stream is an io.BytesIO, a bytes-like object or a SpooledPdf.
+        The document is opened in place, over a view of the bytes or from
+        the spooled file, rather than from a copy, and only the current
+        page's text is held.
+        """
+        path = buffer = None
+        if isinstance(pdf_stream, SpooledPdf) and pdf_stream.path is not None:
+            path = pdf_stream.path
+            doc = fitz.open(path, filetype="pdf")
+        else:
+            if isinstance(pdf_stream, SpooledPdf):
+                buffer = memoryview(pdf_stream.data)
+            elif isinstance(pdf_stream, io.BytesIO):
+                buffer = pdf_stream.getbuffer()
+            else:
+                buffer = memoryview(pdf_stream)
+            doc = fitz.open(stream=buffer, filetype="pdf")
+        try:
+            if self.EXTRACT_PROCESSES > 1 and doc.page_count - first_page + 1 >= self.PARALLEL_EXTRACT_MIN_PAGES:
+                page_count = doc.page_count
+                doc.close()
+                yield from self.__extract_pages_in_parallel(path, buffer, first_page - 1, page_count)
+            else:
+                for page_num, page in enumerate(doc):
+                    if page_num + 1 < first_page:
+                        continue
+                    with telemetry.span("pdf.extract", pages=1):
+                        text = page.get_text()
+                    if text:
+                        yield (page_num + 1, text.strip())
+        finally:
+            if not doc.is_closed:
+                doc.close()
+            if buffer is not None:
+                buffer.release()
+
+    def __extract_pages_in_parallel(self, path, buffer, first_index, page_count):
+        # Workers open the document from a file so the PDF is written once
+        # rather than pickled into every task; a spooled PDF already is one
+        if path is None:
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+                pdf_file.write(buffer)
+            path = pdf_file.name
+        pool = self.__get_pool()
+        pending = deque()
+        try:
+            for start in range(first_index, page_count, self.PAGE_RANGE_SIZE):
+                stop = min(start + self.PAGE_RANGE_SIZE, page_count)
+                pending.append(pool.submit(_extract_page_range, path, start, stop))
+                # Keep a couple of ranges per worker queued, and yield the
+                # oldest range first so pages come out in order
+                if len(pending) >= self.EXTRACT_PROCESSES * 2:
+                    yield from self.__wait_for_range(pending.popleft())
+            while pending:
+                yield from self.__wait_for_range(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+            if buffer is not None:
+                os.remove(path)
+
+    def __wait_for_range(self, future):
+        # Only the time the caller is kept waiting; the range itself was
+        # extracted in another process
+        with telemetry.span("pdf.extract", parallel=True) as span:
+            pages = future.result()
+            span.set_attribute("pages", len(pages))
+        return pages
 
     def __chunk_text(self, text):
         tokens = self.tokenizer.encode(text)
@@ -35,15 +145,46 @@ class PDFProcessor:
             start += self.CHUNK_SIZE - self.CHUNK_OVERLAP
         return chunks
 
-    def process_pdf_to_chunks(self, pdf_stream : io.BytesIO):
-        page_texts = self.__extract_text_from_pdf(pdf_stream)
-        chunk_records = []
+    def __chunk_texts_by_offsets(self, texts):
+        # One batched encode for all texts; each window is then cut out of
+        # the original text by character offsets instead of being decoded.
+        # The Rust backend is called directly to skip building a BatchEncoding.
+        encodings = self.tokenizer.backend_tokenizer.encode_batch(texts, add_special_tokens=False)
+        all_chunks = []
+        for text, encoding in zip(texts, encodings):
+            offsets = encoding.offsets
+            chunks = []
+            start = 0
+            while start < len(offsets):
+                end = min(start + self.CHUNK_SIZE, len(offsets))
+                chunks.append(text[offsets[start][0]:offsets[end - 1][1]].strip())
+                start += self.CHUNK_SIZE - self.CHUNK_OVERLAP
+            all_chunks.append(chunks)
+        return all_chunks
+
+    def __chunk_texts(self, texts):
+        # Offset mappings are only available from fast (Rust) tokenizers
+        if getattr(self.tokenizer, "is_fast", False) is True:
+            return self.__chunk_texts_by_offsets(texts)
+        return [self.__chunk_text(text) for text in texts]
 
-        for page_num, page_text in page_texts:
-            chunks = self.__chunk_text(page_text)
+    @staticmethod
+    def make_chunk_id(source, page_num, chunk_index, content):
+        # Same source, position and text always give the same index key, so
+        # re-uploading a document overwrites its chunks instead of duplicating them
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{source}|{page_num}|{chunk_index}|{content_hash}".encode("utf-8")).hexdigest()
+
+    def chunk_pages(self, pages, source=""):
+        chunk_records = []
+        telemetry.record(telemetry.BATCH_SIZE, len(pages), stage="pdf.chunk")
+        with telemetry.span("pdf.chunk", pages=len(pages)):
+            page_chunks = self.__chunk_texts([page_text for _, page_text in pages])
+        for (page_num, _), chunks in zip(pages, page_chunks):
             for i, chunk in enumerate(chunks):
                 record = {
-                    "id": str(uuid.uuid4()),
+                    "id": self.make_chunk_id(source, page_num, i, chunk),
+                    "source": source,
                     "content": chunk,
                     "metadata": {
                         "source_page": page_num,
@@ -51,6 +192,18 @@ class PDFProcessor:
                     }
                 }
                 chunk_records.append(record)
-
         return chunk_records
+
+    def iter_chunks(self, pdf_stream : io.BytesIO, source="", first_page=1):
+        pages = []
+        for page in self.extract_pages(pdf_stream, first_page):
+            pages.append(page)
+            if len(pages) >= self.PAGE_BATCH_SIZE:
+                yield from self.chunk_pages(pages, source)
+                pages = []
+        if pages:
+            yield from self.chunk_pages(pages, source)
+
+    def process_pdf_to_chunks(self, pdf_stream : io.BytesIO, source=""):
+        return list(self.iter_chunks(pdf_stream, source))
     
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+class SpooledPdf:
+    """A PDF handed from the blob trigger to PDFProcessor without extra copies.
+
+    Blobs up to MAX_IN_MEMORY_BYTES stay in the bytes object they were read
+    into, which fitz opens in place. Larger ones are streamed READ_SIZE bytes
+    at a time into a temporary file that fitz reads from disk, so a big
+    upload is never held in worker memory whole. Use as a context manager,
+    or call close(), to remove the file.
+    """
+
+    MAX_IN_MEMORY_BYTES = 32 * 1024 * 1024
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, data=None, path=None):
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def spool(cls, stream, length=None, max_in_memory_bytes=None):
+        """Reads a binary stream; length, when known, saves probing the size."""
+        if max_in_memory_bytes is None:
+            max_in_memory_bytes = cls.MAX_IN_MEMORY_BYTES
+        if length is not None and length <= max_in_memory_bytes:
+            # Reading a whole func.InputStream hands back the bytes the
+            # worker already holds rather than a copy
+            return cls(data=stream.read())
+        head = b""
+        if length is None:
+            head = stream.read(max_in_memory_bytes + 1)
+            if len(head) <= max_in_memory_bytes:
+                return cls(data=head)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+            try:
+                pdf_file.write(head)
+                del head
+                while True:
+                    block = stream.read(cls.READ_SIZE)
+                    if not block:
+                        break
+                    pdf_file.write(block)
+            except BaseException:
+                pdf_file.close()
+                os.remove(pdf_file.name)
+                raise
+        return cls(path=pdf_file.name)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if self.path is not None else len(self.data)
+
+    def close(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,52 @@
+import logging
+import os
+import sys
+from tokenizers import Tokenizer
+
+MODEL_NAME = "gpt2"
+# Written by `python -m src.tokenizer` and deployed with the function code,
+# so a cold instance neither downloads the tokenizer nor imports transformers
+DEFAULT_TOKENIZER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "gpt2-tokenizer.json")
+
+class SlimTokenizer:
+    """The part of GPT2TokenizerFast the pipeline uses, on the Rust tokenizer alone.
+
+    Loading tokenizer.json with the tokenizers package takes milliseconds,
+    while importing transformers takes seconds.
+    """
+
+    is_fast = True
+
+    def __init__(self, backend_tokenizer: Tokenizer):
+        self.backend_tokenizer = backend_tokenizer
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(Tokenizer.from_file(path))
+
+    def encode(self, text):
+        return self.backend_tokenizer.encode(text, add_special_tokens=False).ids
+
+    def decode(self, ids):
+        return self.backend_tokenizer.decode(ids)
+
+def load_tokenizer(path=None):
+    """Loads the bundled tokenizer file.
+
+    A missing file is an error rather than a reason to download the
+    tokenizer, which is the cold start cost the file exists to avoid.
+    """
+    path = path or os.environ.get("TOKENIZER_PATH") or DEFAULT_TOKENIZER_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No tokenizer file at {path}; export it with `python -m src.tokenizer` before deploying")
+    return SlimTokenizer.from_file(path)
+
+def export_tokenizer(path=DEFAULT_TOKENIZER_PATH):
+    """Saves the GPT-2 tokenizer as a single tokenizer.json for load_tokenizer()."""
+    from transformers import GPT2TokenizerFast
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    GPT2TokenizerFast.from_pretrained(MODEL_NAME).backend_tokenizer.save(path)
+    logging.info(f"Saved {MODEL_NAME} tokenizer to {path}")
+
+if __name__ == "__main__":
+    export_tokenizer(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TOKENIZER_PATH)
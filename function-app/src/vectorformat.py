@@ -0,0 +1,50 @@
+import base64
+import numpy as np
+
+# Element type of the index's embedding field for each vector format; the
+# schema in infra/modules/ai_search must match the format in use
+VECTOR_FORMATS = {
+    "float32": "Collection(Edm.Single)",
+    "float16": "Collection(Edm.Half)",
+    "int8": "Collection(Edm.SByte)",
+}
+
+_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+def check_vector_format(vector_format):
+    if vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"Unknown vector format {vector_format!r}, expected one of {', '.join(VECTOR_FORMATS)}")
+    return vector_format
+
+def decode_embedding(value):
+    """Reads an embedding as returned by the embeddings API into a float32 array.
+
+    With encoding_format="base64" the service sends the raw little-endian
+    float32 bytes, which are used as they are instead of being parsed into
+    a list of Python floats first.
+    """
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype="<f4")
+    return np.asarray(value, dtype=np.float32)
+
+def encode_vector(embedding, vector_format):
+    """Converts an embedding to the compact representation of vector_format.
+
+    int8 uses symmetric scalar quantization with a scale per vector, which
+    leaves cosine similarity between vectors close to that of the originals.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    if vector_format == "int8":
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        if not peak:
+            return np.zeros(vector.shape, dtype=np.int8)
+        return np.rint(vector * (127 / peak)).astype(np.int8)
+    return vector.astype(_DTYPES[vector_format], copy=False)
+
+def vector_values(vector):
+    """JSON-ready values of a vector, whatever it is stored as."""
+    return vector.tolist() if hasattr(vector, "tolist") else [float(x) for x in vector]
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import aiohttp
+import pytest
+from src.asyncazuresearchindexer import AsyncAzureSearchIndexer
+
+TEST_SEARCH_URL = "https://fake-search-service.search.windows.net"
+TEST_SEARCH_KEY = "dummy-api-key"
+EXPECTED_POST_URL = AsyncAzureSearchIndexer.SEARCH_API_ULR.format(
+    TEST_SEARCH_URL, AsyncAzureSearchIndexer.INDEX_NAME, AsyncAzureSearchIndexer.API_VERSION
+)
+EXPECTED_SEARCH_URL = AsyncAzureSearchIndexer.DOCS_SEARCH_URL.format(
+    TEST_SEARCH_URL, AsyncAzureSearchIndexer.INDEX_NAME, AsyncAzureSearchIndexer.API_VERSION
+)
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self.body if isinstance(self.body, str) else json.dumps(self.body)
+
+class FakeSession:
+    """Stands in for aiohttp.ClientSession, replaying canned responses in order."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.closed = False
+
+    def post(self, url, headers, data):
+        self.requests.append({"url": url, "headers": headers, "body": json.loads(data)})
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(*response)
+
+def make_indexer(responses):
+    indexer = AsyncAzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, session=FakeSession(responses))
+    indexer.RETRY_BACKOFF_SECONDS = 0
+    return indexer
+
+class TestAsyncAzureSearchIndexer:
+
+    def test_index_documents(self):
+        indexer = make_indexer([(200, {"value": []})])
+        chunks = [{"id": "id-1", "content": "one", "metadata": {"source_page": 1}}]
+
+        failed = asyncio.run(indexer.index_documents(chunks, [[0.1]]))
+
+        assert failed == {}
+        request = indexer.session.requests[0]
+        assert request["url"] == EXPECTED_POST_URL
+        assert request["headers"]["api-key"] == TEST_SEARCH_KEY
+        assert request["body"] == {"value": [
+            {"id": "id-1", "content": "one", "metadata": json.dumps({"source_page": 1}), "embedding": [0.1], "@search.action": "upload"}
+        ]}
+
+    def test_index_documents_stamps_indexed_at(self):
+        indexer = make_indexer([(200, {"value": []})])
+        indexer.stamp_documents = True
+
+        asyncio.run(indexer.index_documents([{"id": "id-1", "content": "one"}, {"id": "id-2", "content": "two"}], [[0.1], [0.2]]))
+
+        documents = indexer.session.requests[0]["body"]["value"]
+        assert documents[0]["indexed_at"] and documents[0]["indexed_at"] == documents[1]["indexed_at"]
+
+    def test_index_documents_uploads_batches_concurrently(self):
+        indexer = make_indexer([(200, {"value": []})])
+        indexer.MAX_BATCH_DOCUMENTS = 2
+        chunks = [{"id": f"id-{i}", "content": str(i)} for i in range(5)]
+
+        failed = asyncio.run(indexer.index_documents(chunks, [[0.0]] * 5))
+
+        assert failed == {}
+        sent_ids = sorted(doc["id"] for request in indexer.session.requests for doc in request["body"]["value"])
+        assert len(indexer.session.requests) == 3
+        assert sent_ids == [f"id-{i}" for i in range(5)]
+
+    def test_index_documents_resubmits_retryable_failures(self):
+        indexer = make_indexer([
+            (207, {"value": [
+                {"key": "id-0", "status": False, "errorMessage": "Index unavailable", "statusCode": 422},
+                {"key": "id-1", "status": False, "errorMessage": "Bad field", "statusCode": 400}
+            ]}),
+            (200, {"value": [{"key": "id-0", "status": True, "statusCode": 201}]})
+        ])
+        chunks = [{"id": "id-0", "content": "zero"}, {"id": "id-1", "content": "one"}]
+
+        failed = asyncio.run(indexer.index_documents(chunks, [[0.0]] * 2))
+
+        assert failed == {"id-1": "Bad field"}
+        assert [doc["id"] for doc in indexer.session.requests[1]["body"]["value"]] == ["id-0"]
+
+    def test_index_documents_connection_errors_are_retried(self):
+        indexer = make_indexer([aiohttp.ClientConnectionError("reset"), (200, {"value": []})])
+
+        failed = asyncio.run(indexer.index_documents([{"id": "id-0", "content": "zero"}], [[0.0]]))
+
+        assert failed == {}
+        assert len(indexer.session.requests) == 2
+
+    def test_get_document_ids_and_delete(self):
+        indexer = make_indexer([(200, {"value": [{"id": "a"}, {"id": "b"}]}), (200, {"value": []})])
+
+        async def run():
+            ids = await indexer.get_document_ids("a.pdf")
+            failed = await indexer.delete_documents(ids)
+            return ids, failed
+
+        ids, failed = asyncio.run(run())
+
+        assert ids == ["a", "b"]
+        assert failed == {}
+        assert indexer.session.requests[0]["url"] == EXPECTED_SEARCH_URL
+        assert indexer.session.requests[0]["body"]["filter"] == "source eq 'a.pdf'"
+        assert indexer.session.requests[1]["body"]["value"] == [
+            {"@search.action": "delete", "id": "a"},
+            {"@search.action": "delete", "id": "b"}
+        ]
+
+    def test_get_document_ids_raises_on_error(self):
+        indexer = make_indexer([(500, "Internal error")])
+
+        with pytest.raises(RuntimeError, match="status 500"):
+            asyncio.run(indexer.get_document_ids("a.pdf"))
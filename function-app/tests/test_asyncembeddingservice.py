@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, Mock, call
+import pytest
+from src.asyncembeddingservice import AsyncEmbeddingService
+from src.embeddingcache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+
+def make_batch_response(texts):
+    return Mock(data=[
+        Mock(index=i, embedding=[float(len(text))])
+        for i, text in enumerate(texts)
+    ])
+
+@pytest.fixture
+def mock_async_client():
+    client = MagicMock()
+    client.embeddings.create = AsyncMock(side_effect=lambda input, model: make_batch_response(input))
+    return client
+
+def test_get_embeddings_batches_and_keeps_order(mock_async_client):
+    service = AsyncEmbeddingService(mock_async_client)
+    service.MAX_BATCH_SIZE = 2
+
+    result = asyncio.run(service.get_embeddings(["a", "bb", "ccc"]))
+
+    assert result == [[1.0], [2.0], [3.0]]
+    mock_async_client.embeddings.create.assert_has_awaits([
+        call(input=["a", "bb"], model=MODEL),
+        call(input=["ccc"], model=MODEL)
+    ], any_order=True)
+
+def test_get_embeddings_runs_batches_concurrently_up_to_limit(mock_async_client):
+    active = {"current": 0, "peak": 0}
+
+    async def create(input, model):
+        active["current"] += 1
+        active["peak"] = max(active["peak"], active["current"])
+        await asyncio.sleep(0.01)
+        active["current"] -= 1
+        return make_batch_response(input)
+
+    mock_async_client.embeddings.create = AsyncMock(side_effect=create)
+    service = AsyncEmbeddingService(mock_async_client, max_concurrency=3)
+    service.MAX_BATCH_SIZE = 1
+
+    result = asyncio.run(service.get_embeddings(["x"] * 10))
+
+    assert len(result) == 10
+    assert active["peak"] == 3
+
+def test_get_embeddings_splits_failed_batch(mock_async_client):
+    async def create(input, model):
+        if "bad" in input:
+            raise ValueError("Invalid input")
+        return make_batch_response(input)
+
+    mock_async_client.embeddings.create = AsyncMock(side_effect=create)
+    service = AsyncEmbeddingService(mock_async_client)
+
+    result = asyncio.run(service.get_embeddings(["a", "bad", "ccc", "dddd"]))
+
+    assert result == [[1.0], None, [3.0], [4.0]]
+
+def test_get_embeddings_uses_cache(mock_async_client):
+    cache = EmbeddingCache()
+    cache.put(MODEL, "cached", [9.0])
+    service = AsyncEmbeddingService(mock_async_client, cache=cache)
+
+    result = asyncio.run(service.get_embeddings(["cached", "new", "new"]))
+
+    mock_async_client.embeddings.create.assert_awaited_once_with(input=["new"], model=MODEL)
+    assert result == [[9.0], [3.0], [3.0]]
+
+def test_cache_is_used_off_the_event_loop(mock_async_client):
+    threads = []
+
+    class RecordingCache(EmbeddingCache):
+        def get_many(self, model, texts):
+            threads.append(threading.get_ident())
+            return super().get_many(model, texts)
+
+        def put_many(self, model, texts, embeddings):
+            threads.append(threading.get_ident())
+            return super().put_many(model, texts, embeddings)
+
+    service = AsyncEmbeddingService(mock_async_client, cache=RecordingCache())
+
+    asyncio.run(service.get_embeddings(["new"]))
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
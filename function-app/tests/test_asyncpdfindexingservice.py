@@ -0,0 +1,131 @@
+import asyncio
+import io
+import logging
+from unittest.mock import ANY, AsyncMock, MagicMock, call
+import pytest
+
+from src.pdfprocessor import PDFProcessor
+from src.asyncembeddingservice import AsyncEmbeddingService
+from src.asyncazuresearchindexer import AsyncAzureSearchIndexer
+from src.asyncpdfindexingservice import AsyncPdfIndexingService
+from src.ingestioncheckpoint import LocalCheckpointStore
+
+@pytest.fixture
+def mock_pdf_processor():
+    return MagicMock(spec=PDFProcessor)
+
+@pytest.fixture
+def mock_embedding_service():
+    service = MagicMock(spec=AsyncEmbeddingService)
+    service.get_embeddings = AsyncMock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+    return service
+
+@pytest.fixture
+def mock_search_indexer():
+    indexer = MagicMock(spec=AsyncAzureSearchIndexer)
+    indexer.get_document_ids = AsyncMock(return_value=[])
+    indexer.index_documents = AsyncMock(return_value={})
+    indexer.delete_documents = AsyncMock(return_value={})
+    return indexer
+
+@pytest.fixture
+def mock_logger():
+    return MagicMock(spec=logging.Logger)
+
+@pytest.fixture
+def indexing_service(mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger):
+    return AsyncPdfIndexingService(
+        pdf_processor=mock_pdf_processor,
+        embedding_service=mock_embedding_service,
+        search_indexer=mock_search_indexer,
+        logger=mock_logger
+    )
+
+def make_chunks(count):
+    # iter_chunks is a generator, and the service closes it when done
+    for i in range(count):
+        yield {"id": f"id-{i}", "content": f"content {i}"}
+
+class TestAsyncPdfIndexingService:
+
+    def test_process_and_index_pdf_happy_path(self, indexing_service, mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger):
+        indexing_service.EMBED_BATCH_SIZE = 2
+        mock_pdf_processor.iter_chunks.return_value = make_chunks(3)
+
+        asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf"))
+
+        mock_search_indexer.get_document_ids.assert_awaited_once_with("test.pdf")
+        assert mock_embedding_service.get_embeddings.await_count == 2
+        indexed = [chunk for c in mock_search_indexer.index_documents.await_args_list for chunk in c.args[0]]
+        assert sorted(chunk["id"] for chunk in indexed) == ["id-0", "id-1", "id-2"]
+        mock_search_indexer.delete_documents.assert_not_awaited()
+        mock_logger.info.assert_any_call("Extracted 3 chunks from test.pdf.")
+        mock_logger.info.assert_any_call("Indexed 3 of 3 new or changed chunks from test.pdf.")
+
+    def test_process_and_index_pdf_skips_unchanged_and_deletes_stale(self, indexing_service, mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger):
+        mock_pdf_processor.iter_chunks.return_value = make_chunks(2)
+        mock_search_indexer.get_document_ids.return_value = ["id-0", "old-id"]
+
+        asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf"))
+
+        mock_embedding_service.get_embeddings.assert_awaited_once_with(["content 1"])
+        mock_search_indexer.delete_documents.assert_awaited_once_with(["old-id"])
+        mock_logger.info.assert_any_call("Skipped 1 unchanged chunks from test.pdf.")
+        mock_logger.info.assert_any_call("Deleted 1 stale chunks of test.pdf.")
+
+    def test_process_and_index_pdf_logs_missing_embeddings(self, indexing_service, mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger):
+        mock_pdf_processor.iter_chunks.return_value = make_chunks(2)
+        mock_embedding_service.get_embeddings.side_effect = None
+        mock_embedding_service.get_embeddings.return_value = [None, [0.5]]
+
+        asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf"))
+
+        mock_search_indexer.index_documents.assert_awaited_once_with([{"id": "id-1", "content": "content 1"}], [[0.5]])
+        mock_logger.error.assert_any_call("Error processing chunk id-0 for test.pdf: no embedding was generated")
+
+    def test_process_and_index_pdf_bounds_batches_in_flight(self, indexing_service, mock_pdf_processor, mock_search_indexer):
+        indexing_service.EMBED_BATCH_SIZE = 1
+        indexing_service.MAX_BATCHES_IN_FLIGHT = 2
+        active = {"current": 0, "peak": 0}
+
+        async def index_documents(chunks, embeddings):
+            active["current"] += 1
+            active["peak"] = max(active["peak"], active["current"])
+            await asyncio.sleep(0.01)
+            active["current"] -= 1
+            return {}
+
+        mock_search_indexer.index_documents.side_effect = index_documents
+        mock_pdf_processor.iter_chunks.return_value = make_chunks(6)
+
+        asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf"))
+
+        assert mock_search_indexer.index_documents.await_count == 6
+        assert active["peak"] == 2
+
+    def test_process_and_index_pdf_extraction_error_propagates(self, indexing_service, mock_pdf_processor, mock_search_indexer, mock_logger):
+        def failing_chunks():
+            yield from make_chunks(1)
+            raise RuntimeError("corrupt page")
+
+        mock_pdf_processor.iter_chunks.return_value = failing_chunks()
+
+        with pytest.raises(RuntimeError, match="corrupt page"):
+            asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf"))
+
+        mock_search_indexer.delete_documents.assert_not_awaited()
+        mock_logger.error.assert_called_once()
+
+    def test_process_and_index_pdf_resumes_from_checkpoint(self, mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger, tmp_path):
+        store = LocalCheckpointStore(str(tmp_path))
+        store.save("big.pdf", {"etag": "v1", "status": "failed", "committed_page": 2, "chunk_ids": ["p1", "p2"]})
+        mock_search_indexer.get_document_ids.return_value = ["p1", "p2", "old"]
+        mock_pdf_processor.iter_chunks.return_value = (chunk for chunk in [{"id": "p3", "content": "three", "metadata": {"source_page": 3, "chunk_index": 0}}])
+        indexing_service = AsyncPdfIndexingService(mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger, store)
+
+        asyncio.run(indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "big.pdf", etag="v1"))
+
+        mock_pdf_processor.iter_chunks.assert_called_once_with(ANY, "big.pdf", 3)
+        # Only the chunk no page has produced is stale
+        mock_search_indexer.delete_documents.assert_awaited_once_with(["old"])
+        assert store.load("big.pdf")["status"] == "completed"
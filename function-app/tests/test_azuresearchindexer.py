@@ -1,10 +1,15 @@
+import gzip
 import json
 import logging
+import numpy as np
 import pytest
 import requests 
+from datetime import datetime
 from unittest.mock import ANY 
 
+from src import telemetry
 from src.azuresearchindexer import AzureSearchIndexer
+from src.httptransport import DEFAULT_TIMEOUT
 
 # --- Test Data ---
 
@@ -16,6 +21,9 @@ TEST_API_VERSION = AzureSearchIndexer.API_VERSION
 EXPECTED_POST_URL = AzureSearchIndexer.SEARCH_API_ULR.format(
     TEST_SEARCH_URL, TEST_INDEX_NAME, TEST_API_VERSION
 )
+EXPECTED_SEARCH_URL = AzureSearchIndexer.DOCS_SEARCH_URL.format(
+    TEST_SEARCH_URL, TEST_INDEX_NAME, TEST_API_VERSION
+)
 
 # --- Fixtures ---
 
@@ -141,3 +149,237 @@ class TestAzureSearchIndexer:
         assert f"Status Code: 400" in caplog.text
         assert f"Response: {error_response_text}" in caplog.text
 
+
+    # --- index_documents ---
+
+    def test_index_documents_single_request(self, indexer, requests_mock):
+        chunks = [
+            {"id": "id-1", "content": "one", "metadata": {"source_page": 1}},
+            {"id": "id-2", "content": "two", "metadata": {"source_page": 2}}
+        ]
+        requests_mock.post(
+            EXPECTED_POST_URL,
+            status_code=200,
+            json={"value": [
+                {"key": "id-1", "status": True, "errorMessage": None, "statusCode": 201},
+                {"key": "id-2", "status": True, "errorMessage": None, "statusCode": 201}
+            ]}
+        )
+
+        failed = indexer.index_documents(chunks, [[0.1], [0.2]])
+
+        assert failed == {}
+        assert requests_mock.call_count == 1
+        sent = json.loads(requests_mock.request_history[0].text)
+        assert sent == {"value": [
+            {"id": "id-1", "content": "one", "metadata": json.dumps({"source_page": 1}), "embedding": [0.1], "@search.action": "upload"},
+            {"id": "id-2", "content": "two", "metadata": json.dumps({"source_page": 2}), "embedding": [0.2], "@search.action": "upload"}
+        ]}
+
+    def test_index_documents_accepts_numpy_vectors(self, indexer, requests_mock):
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.index_documents(
+            [{"id": "id-1", "content": "one"}, {"id": "id-2", "content": "two"}],
+            [np.array([0.5, -0.25], dtype=np.float16), np.array([127, -3], dtype=np.int8)]
+        )
+
+        sent = json.loads(requests_mock.request_history[0].text)
+        assert [doc["embedding"] for doc in sent["value"]] == [[0.5, -0.25], [127, -3]]
+
+    def test_index_documents_stamps_indexed_at(self, requests_mock):
+        indexer = AzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, stamp_documents=True)
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.index_documents([{"id": "id-1", "content": "one"}, {"id": "id-2", "content": "two"}], [[0.1], [0.2]])
+
+        stamps = {doc["indexed_at"] for doc in json.loads(requests_mock.request_history[0].text)["value"]}
+        assert len(stamps) == 1
+        assert datetime.fromisoformat(stamps.pop()).tzinfo is not None
+
+    def test_index_documents_without_stamps(self, indexer, requests_mock):
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.index_documents([{"id": "id-1", "content": "one"}], [[0.1]])
+
+        assert "indexed_at" not in json.loads(requests_mock.request_history[0].text)["value"][0]
+
+    def test_index_documents_respects_document_limit(self, indexer, requests_mock):
+        indexer.MAX_BATCH_DOCUMENTS = 2
+        chunks = [{"id": f"id-{i}", "content": str(i)} for i in range(5)]
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        failed = indexer.index_documents(chunks, [[0.0]] * 5)
+
+        assert failed == {}
+        sent_ids = [[doc["id"] for doc in json.loads(request.text)["value"]] for request in requests_mock.request_history]
+        assert sent_ids == [["id-0", "id-1"], ["id-2", "id-3"], ["id-4"]]
+
+    def test_index_documents_respects_byte_limit(self, indexer, requests_mock):
+        chunks = [{"id": f"id-{i}", "content": "x" * 100} for i in range(3)]
+        indexer.MAX_BATCH_BYTES = 300
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.index_documents(chunks, [[0.0]] * 3)
+
+        assert requests_mock.call_count == 3
+        for request in requests_mock.request_history:
+            assert len(request.body) <= 300
+
+    def test_index_documents_resubmits_only_retryable_failures(self, indexer, requests_mock):
+        indexer.RETRY_BACKOFF_SECONDS = 0
+        chunks = [{"id": f"id-{i}", "content": str(i)} for i in range(3)]
+        requests_mock.post(EXPECTED_POST_URL, [
+            {"status_code": 207, "json": {"value": [
+                {"key": "id-0", "status": True, "errorMessage": None, "statusCode": 201},
+                {"key": "id-1", "status": False, "errorMessage": "Index unavailable", "statusCode": 422},
+                {"key": "id-2", "status": False, "errorMessage": "Bad field", "statusCode": 400}
+            ]}},
+            {"status_code": 200, "json": {"value": [
+                {"key": "id-1", "status": True, "errorMessage": None, "statusCode": 201}
+            ]}}
+        ])
+
+        failed = indexer.index_documents(chunks, [[0.0]] * 3)
+
+        assert failed == {"id-2": "Bad field"}
+        assert requests_mock.call_count == 2
+        retried = json.loads(requests_mock.request_history[1].text)["value"]
+        assert [doc["id"] for doc in retried] == ["id-1"]
+
+    def test_index_documents_gives_up_after_max_retries(self, indexer, requests_mock):
+        indexer.RETRY_BACKOFF_SECONDS = 0
+        indexer.MAX_RETRIES = 2
+        requests_mock.post(EXPECTED_POST_URL, status_code=503, text="Service busy")
+
+        failed = indexer.index_documents([{"id": "id-0", "content": "zero"}], [[0.0]])
+
+        assert failed == {"id-0": "Service busy"}
+        assert requests_mock.call_count == 3
+
+    def test_index_documents_records_batches_payloads_and_throttles(self, indexer, requests_mock):
+        indexer.RETRY_BACKOFF_SECONDS = 0
+        requests_mock.post(EXPECTED_POST_URL, [
+            {"status_code": 429, "text": "Too many requests"},
+            {"status_code": 200, "json": {"value": [
+                {"key": "id-0", "status": True, "errorMessage": None, "statusCode": 201}
+            ]}}
+        ])
+        recorder = telemetry.configure("memory")
+        try:
+            indexer.index_documents([{"id": "id-0", "content": "zero"}], [[0.0]])
+        finally:
+            telemetry.configure("none")
+
+        assert recorder.values(telemetry.BATCH_SIZE, stage="search.upload") == [1]
+        assert recorder.values(telemetry.PAYLOAD_SIZE, operation="search.index") == [len(requests_mock.request_history[0].body)] * 2
+        assert recorder.total(telemetry.THROTTLES, operation="search.index") == 1
+        assert recorder.total(telemetry.RETRIES, operation="search.index") == 1
+        assert [name for name, _, _ in recorder.spans] == ["search.index"]
+
+    def test_index_documents_whole_request_error(self, indexer, requests_mock, caplog):
+        requests_mock.post(EXPECTED_POST_URL, status_code=400, text="Invalid payload")
+
+        with caplog.at_level(logging.ERROR):
+            failed = indexer.index_documents([{"id": "id-0", "content": "zero"}], [[0.0]])
+
+        assert failed == {"id-0": "Invalid payload"}
+        assert requests_mock.call_count == 1
+        assert "Failed to index document id-0: Invalid payload" in caplog.text
+
+    # --- delete_documents / get_document_ids ---
+
+    def test_delete_documents(self, indexer, requests_mock):
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        failed = indexer.delete_documents(["id-1", "id-2"])
+
+        assert failed == {}
+        assert json.loads(requests_mock.request_history[0].text) == {"value": [
+            {"@search.action": "delete", "id": "id-1"},
+            {"@search.action": "delete", "id": "id-2"}
+        ]}
+
+    def test_get_document_ids_pages_through_results(self, indexer, requests_mock):
+        indexer.SEARCH_PAGE_SIZE = 2
+        requests_mock.post(EXPECTED_SEARCH_URL, [
+            {"status_code": 200, "json": {"value": [{"id": "a"}, {"id": "b"}]}},
+            {"status_code": 200, "json": {"value": [{"id": "c"}]}}
+        ])
+
+        ids = indexer.get_document_ids("uploads/o'brien.pdf")
+
+        assert ids == ["a", "b", "c"]
+        first, second = [json.loads(request.text) for request in requests_mock.request_history]
+        assert first["filter"] == "source eq 'uploads/o''brien.pdf'"
+        assert first["select"] == "id"
+        assert (first["skip"], second["skip"]) == (0, 2)
+
+    def test_get_document_ids_raises_on_error(self, indexer, requests_mock):
+        requests_mock.post(EXPECTED_SEARCH_URL, status_code=500)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            indexer.get_document_ids("a.pdf")
+
+    def test_search_sends_vector_query(self, indexer, requests_mock):
+        hit = {"id": "a", "content": "text", "metadata": "{}", "source": "a.pdf", "@search.score": 0.9}
+        requests_mock.post(EXPECTED_SEARCH_URL, status_code=200, json={"value": [hit]})
+
+        results = indexer.search([0.1, 0.2], top_k=5)
+
+        assert results == [hit]
+        body = json.loads(requests_mock.request_history[0].text)
+        assert body["vectorQueries"] == [{"kind": "vector", "vector": [0.1, 0.2], "k": 5, "fields": "embedding"}]
+        assert body["top"] == 5
+
+    def test_index_name_selects_the_index(self, requests_mock):
+        indexer = AzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, index_name="rag-index-v2")
+        requests_mock.post(
+            AzureSearchIndexer.DOCS_SEARCH_URL.format(TEST_SEARCH_URL, "rag-index-v2", TEST_API_VERSION),
+            status_code=200, json={"value": []}
+        )
+
+        assert indexer.search([0.1], top_k=1) == []
+
+    # --- transport ---
+
+    def test_requests_reuse_session_with_timeout(self, requests_mock):
+        session = requests.Session()
+        indexer = AzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, session=session, timeout=(1, 2))
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.index_documents([{"id": "id-0", "content": "zero"}], [[0.0]])
+        indexer.delete_documents(["id-0"])
+
+        assert indexer.session is session
+        assert [request.timeout for request in requests_mock.request_history] == [(1, 2), (1, 2)]
+
+    def test_default_timeout(self, indexer, requests_mock):
+        requests_mock.post(EXPECTED_POST_URL, status_code=200)
+
+        indexer.index_document({"id": "id-0", "content": "zero"}, [0.0])
+
+        assert requests_mock.request_history[0].timeout == DEFAULT_TIMEOUT
+
+    def test_compressed_request_body(self, requests_mock):
+        indexer = AzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, compress=True)
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+        chunks = [{"id": "id-0", "content": "x" * 2000}]
+
+        indexer.index_documents(chunks, [[0.5] * 100])
+
+        request = requests_mock.request_history[0]
+        assert request.headers["Content-Encoding"] == "gzip"
+        sent = json.loads(gzip.decompress(request.body))
+        assert sent["value"][0]["content"] == "x" * 2000
+        assert len(request.body) < 2000
+
+    def test_small_bodies_are_not_compressed(self, requests_mock):
+        indexer = AzureSearchIndexer(TEST_SEARCH_URL, TEST_SEARCH_KEY, compress=True)
+        requests_mock.post(EXPECTED_POST_URL, status_code=200, json={"value": []})
+
+        indexer.delete_documents(["id-0"])
+
+        request = requests_mock.request_history[0]
+        assert "Content-Encoding" not in request.headers
+        assert json.loads(request.text)["value"] == [{"@search.action": "delete", "id": "id-0"}]
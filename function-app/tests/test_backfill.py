@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import sys
+from functools import partial
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from src import backfill
+from src.backfill import BackfillProgress, run_backfill
+
+def index_blob(blob_path, calls=None):
+    if blob_path.startswith("bad/"):
+        raise ValueError("not a pdf")
+    if calls is not None:
+        calls.append(blob_path)
+
+def test_runs_inline_with_one_process():
+    calls = []
+    initializer = MagicMock()
+
+    progress = run_backfill(["a.pdf", "bad/b.pdf", "c.pdf"], partial(index_blob, calls=calls), 1, initializer, ("arg",))
+
+    initializer.assert_called_once_with("arg")
+    assert calls == ["a.pdf", "c.pdf"]
+    assert (progress.listed, progress.indexed, progress.failed) == (3, 2, ["bad/b.pdf"])
+
+def test_spreads_documents_over_worker_processes():
+    blob_paths = [f"{i}.pdf" for i in range(6)] + ["bad/x.pdf"]
+
+    progress = run_backfill(iter(blob_paths), index_blob, 2)
+
+    assert (progress.listed, progress.indexed, progress.failed) == (7, 6, ["bad/x.pdf"])
+
+def test_report_logs_rate_and_time_to_go(caplog):
+    progress = BackfillProgress()
+    progress.listed, progress.listing_done = 10, True
+    progress.started -= 60
+
+    with caplog.at_level(logging.INFO):
+        progress.done("a.pdf")
+        progress.done("b.pdf", ValueError("broken"))
+        progress.report()
+
+    assert "Backfill of b.pdf failed: broken" in caplog.text
+    assert "1 indexed, 1 failed, 8 left" in caplog.text
+    assert "about 4 min to go" in caplog.text
+
+def test_documents_of_a_worker_share_one_event_loop(monkeypatch):
+    loops = []
+
+    async def index_stored_blob(blob_path, version):
+        loops.append(asyncio.get_running_loop())
+
+    monkeypatch.setitem(sys.modules, "function_app", SimpleNamespace(index_stored_blob=index_stored_blob))
+
+    backfill._index_with_function_app("a.pdf", "run")
+    backfill._index_with_function_app("b.pdf", "run")
+
+    assert loops[0] is loops[1]
+    assert not loops[0].is_closed()
+
+def fake_function_app(monkeypatch, search_backend="azure"):
+    seen = {}
+
+    def get_blob_storage_service():
+        seen["tpm"] = os.environ.get("AZURE_OPENAI_EMBEDDING_TPM")
+        return MagicMock(**{"iter_blob_names.return_value": []})
+
+    monkeypatch.setitem(sys.modules, "function_app", SimpleNamespace(
+        get_blob_storage_service=get_blob_storage_service,
+        get_indexing_services=MagicMock(),
+        UPLOAD_CONTAINER_NAME="uploads",
+        SEARCH_BACKEND=search_backend
+    ))
+    return seen
+
+def test_tpm_is_set_before_the_function_app_reads_it(monkeypatch):
+    monkeypatch.delenv("AZURE_OPENAI_EMBEDDING_TPM", raising=False)
+    seen = fake_function_app(monkeypatch)
+
+    assert backfill.main(["--processes", "1", "--tpm", "1000"]) == 0
+    assert seen["tpm"] == "1000"
+
+def test_local_index_is_backfilled_by_one_process(monkeypatch):
+    seen = fake_function_app(monkeypatch, search_backend="local")
+
+    with pytest.raises(SystemExit):
+        backfill.main(["--processes", "2"])
+    assert "tpm" not in seen
+
+    assert backfill.main(["--processes", "1"]) == 0
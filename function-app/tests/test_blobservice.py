@@ -1,6 +1,9 @@
+import asyncio
+import io
 import logging
 import pytest
 from unittest.mock import MagicMock, patch, call  
+from azure.core import MatchConditions
 from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
 from azure.storage.blob import BlobProperties 
 
@@ -135,6 +138,85 @@ def test_list_blob_names_other_exception(
     )
 
 
+def test_list_blob_names_paged(
+    blob_storage_service, mock_blob_service_client, mocker
+):
+    """Test listing one page with a limit and continuation token."""
+    container_name = "test-container"
+    mock_container_client = mocker.MagicMock()
+    mock_blob_service_client.get_container_client.return_value = (
+        mock_container_client
+    )
+    mock_blob = mocker.MagicMock(spec=BlobProperties)
+    mock_blob.name = "folder/blob3.txt"
+    mock_pages = mocker.MagicMock()
+    mock_pages.__next__.return_value = iter([mock_blob])
+    mock_pages.continuation_token = "next-marker"
+    mock_container_client.list_blobs.return_value.by_page.return_value = mock_pages
+
+    result = blob_storage_service.list_blob_names(
+        container_name, prefix="folder/", limit=1, continuation_token="marker"
+    )
+
+    assert result == {
+        "blobs": [{"name": f"{container_name}/folder/blob3.txt"}],
+        "continuation_token": "next-marker",
+    }
+    mock_container_client.list_blobs.assert_called_once_with(
+        name_starts_with="folder/", results_per_page=1
+    )
+    mock_container_client.list_blobs.return_value.by_page.assert_called_once_with(
+        continuation_token="marker"
+    )
+
+
+def test_list_blob_names_last_page(
+    blob_storage_service, mock_blob_service_client, mocker
+):
+    """Test the last page has no continuation token."""
+    mock_container_client = mocker.MagicMock()
+    mock_blob_service_client.get_container_client.return_value = (
+        mock_container_client
+    )
+    mock_pages = mocker.MagicMock()
+    mock_pages.__next__.side_effect = StopIteration
+    mock_pages.continuation_token = ""
+    mock_container_client.list_blobs.return_value.by_page.return_value = mock_pages
+
+    result = blob_storage_service.list_blob_names("test-container", limit=10)
+
+    assert result == {"blobs": [], "continuation_token": None}
+
+
+def test_iter_blob_names_follows_continuation_tokens(blob_storage_service, mocker):
+    """Test every page is listed, one after the other."""
+    list_blob_names = mocker.patch.object(
+        blob_storage_service,
+        "list_blob_names",
+        side_effect=[
+            {"blobs": [{"name": "c/a.pdf"}, {"name": "c/b.pdf"}], "continuation_token": "m1"},
+            {"blobs": [{"name": "c/c.pdf"}], "continuation_token": None},
+        ],
+    )
+
+    names = list(blob_storage_service.iter_blob_names("c", prefix="p", page_size=2))
+
+    assert names == ["c/a.pdf", "c/b.pdf", "c/c.pdf"]
+    assert list_blob_names.call_args_list == [call("c", "p", 2, None), call("c", "p", 2, "m1")]
+
+
+def test_download_blob(mock_blob_service_client):
+    """Test the download reads with the service's concurrency."""
+    blob_storage_service = BlobStorageService(mock_blob_service_client, max_concurrency=2)
+    blob_client = mock_blob_service_client.get_blob_client.return_value
+
+    downloader = blob_storage_service.download_blob("c", "folder/a.pdf")
+
+    assert downloader is blob_client.download_blob.return_value
+    mock_blob_service_client.get_blob_client.assert_called_once_with(container="c", blob="folder/a.pdf")
+    blob_client.download_blob.assert_called_once_with(max_concurrency=2)
+
+
 # --- Tests for upload_blob ---
 
 
@@ -269,3 +351,118 @@ def test_upload_blob_general_exception(
         file_content, overwrite=True
     )
     assert f"Failed to upload blob {full_path}: {error_message}" in caplog.text
+
+
+# --- Tests for staged block uploads ---
+
+
+UPLOAD_ID = "0f" * 16
+
+
+def block_id(index):
+    return f"{UPLOAD_ID}-{index:06d}"
+
+
+def make_blocked_service(mock_blob_service_client, mocker):
+    mocker.patch("src.blobstorageservice.uuid").uuid4.return_value.hex = UPLOAD_ID
+    mock_blob_client = mocker.MagicMock()
+    mock_blob_client.url = "http://mockstorage/upload-container/big.pdf"
+    mock_blob_service_client.get_blob_client.return_value = mock_blob_client
+    return BlobStorageService(mock_blob_service_client, block_size=4, max_concurrency=2), mock_blob_client
+
+
+def staged_blocks(mock_blob_client):
+    return sorted((c.args[0], c.args[1]) for c in mock_blob_client.stage_block.call_args_list)
+
+
+def test_upload_blob_stages_large_content_in_blocks(mock_blob_service_client, mocker):
+    """Content larger than a block is staged in parallel and committed in order."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+
+    result = service.upload_blob("upload-container", "big.pdf", b"0123456789")
+
+    assert result["success"] is True
+    mock_blob_client.upload_blob.assert_not_called()
+    assert staged_blocks(mock_blob_client) == [(block_id(0), b"0123"), (block_id(1), b"4567"), (block_id(2), b"89")]
+    mock_blob_client.commit_block_list.assert_called_once_with([block_id(0), block_id(1), block_id(2)])
+
+
+def test_upload_blob_reads_streams_block_by_block(mock_blob_service_client, mocker):
+    """A stream is read one block at a time rather than all at once."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+    stream = io.BytesIO(b"0123456")
+    reads = []
+    original_read = stream.read
+    stream.read = lambda size=-1: reads.append(size) or original_read(size)
+
+    result = service.upload_blob("upload-container", "big.pdf", stream, overwrite=False)
+
+    assert result["success"] is True
+    assert set(reads) == {4}
+    assert staged_blocks(mock_blob_client) == [(block_id(0), b"0123"), (block_id(1), b"456")]
+    mock_blob_client.commit_block_list.assert_called_once_with(
+        [block_id(0), block_id(1)], etag="*", match_condition=MatchConditions.IfMissing
+    )
+
+
+def test_upload_blob_does_not_commit_after_failed_block(mock_blob_service_client, mocker):
+    """A failed block leaves the existing blob untouched."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+    mock_blob_client.stage_block.side_effect = Exception("Connection reset")
+
+    result = service.upload_blob("upload-container", "big.pdf", b"0123456789")
+
+    assert result == {"success": False, "error": "Connection reset", "path": "upload-container/big.pdf"}
+    mock_blob_client.commit_block_list.assert_not_called()
+
+
+def test_uploads_of_the_same_blob_use_distinct_block_ids(mock_blob_service_client, mocker):
+    """Concurrent uploads of one blob never share a block id, so neither can commit the other's blocks."""
+    mock_blob_client = mocker.MagicMock()
+    mock_blob_service_client.get_blob_client.return_value = mock_blob_client
+    service = BlobStorageService(mock_blob_service_client, block_size=4, max_concurrency=2)
+
+    service.upload_blob("upload-container", "big.pdf", b"0123456789")
+    service.upload_blob("upload-container", "big.pdf", b"0123456789")
+
+    first, second = [c.args[0] for c in mock_blob_client.commit_block_list.call_args_list]
+    assert not set(first) & set(second)
+    assert len({len(block) for block in first + second}) == 1
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_upload_blob_stream_regroups_chunks_into_blocks(mock_blob_service_client, mocker):
+    """Streamed chunks of any size are staged as full blocks."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+
+    result = asyncio.run(service.upload_blob_stream("upload-container", "big.pdf", body(b"01", b"23456", b"", b"789")))
+
+    assert result == {"success": True, "path": "upload-container/big.pdf", "url": mock_blob_client.url}
+    assert staged_blocks(mock_blob_client) == [(block_id(0), b"0123"), (block_id(1), b"4567"), (block_id(2), b"89")]
+    mock_blob_client.commit_block_list.assert_called_once_with([block_id(0), block_id(1), block_id(2)])
+
+
+def test_upload_blob_stream_empty_body(mock_blob_service_client, mocker):
+    """An empty body creates no blob."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+
+    result = asyncio.run(service.upload_blob_stream("upload-container", "big.pdf", body(b"")))
+
+    assert result["success"] is False
+    assert result["empty"] is True
+    mock_blob_client.commit_block_list.assert_not_called()
+
+
+def test_upload_blob_stream_failed_block(mock_blob_service_client, mocker):
+    """A failed block stops the upload without committing."""
+    service, mock_blob_client = make_blocked_service(mock_blob_service_client, mocker)
+    mock_blob_client.stage_block.side_effect = Exception("Connection reset")
+
+    result = asyncio.run(service.upload_blob_stream("upload-container", "big.pdf", body(b"0123456789" * 10)))
+
+    assert result == {"success": False, "error": "Connection reset", "path": "upload-container/big.pdf"}
+    mock_blob_client.commit_block_list.assert_not_called()
@@ -0,0 +1,55 @@
+import pytest
+from src.embeddingcache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+
+@pytest.fixture
+def cache():
+    return EmbeddingCache()
+
+def test_miss_then_hit(cache):
+    assert cache.get(MODEL, "hello") is None
+
+    cache.put(MODEL, "hello", [0.5, 0.25])
+
+    assert cache.get(MODEL, "hello") == [0.5, 0.25]
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+def test_key_includes_model(cache):
+    cache.put(MODEL, "hello", [1.0])
+
+    assert cache.get("other-model", "hello") is None
+    assert EmbeddingCache.make_key(MODEL, "hello") != EmbeddingCache.make_key("other-model", "hello")
+
+def test_get_many_preserves_order_and_duplicates(cache):
+    cache.put_many(MODEL, ["a", "b"], [[1.0], [2.0]])
+
+    assert cache.get_many(MODEL, ["b", "missing", "a", "b"]) == [[2.0], None, [1.0], [2.0]]
+    assert cache.hits == 3
+    assert cache.misses == 1
+
+def test_put_many_skips_missing_embeddings(cache):
+    cache.put_many(MODEL, ["a", "b"], [[1.0], None])
+
+    assert len(cache) == 1
+
+def test_evicts_least_recently_used(cache):
+    cache = EmbeddingCache(max_entries=2)
+    cache.put(MODEL, "a", [1.0])
+    cache.put(MODEL, "b", [2.0])
+    cache.get(MODEL, "a")  # "b" is now the least recently used
+
+    cache.put(MODEL, "c", [3.0])
+
+    assert len(cache) == 2
+    assert cache.get(MODEL, "b") is None
+    assert cache.get(MODEL, "a") == [1.0]
+    assert cache.get(MODEL, "c") == [3.0]
+
+def test_persists_to_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache(path).put(MODEL, "hello", [0.5])
+
+    assert EmbeddingCache(path).get(MODEL, "hello") == [0.5]
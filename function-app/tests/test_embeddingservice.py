@@ -1,6 +1,10 @@
-from unittest.mock import Mock, MagicMock, create_autospec
+import base64
+import numpy as np
+from unittest.mock import Mock, MagicMock, call, create_autospec
 import pytest
 from src.embeddingservice import EmbeddingService
+from src.embeddingcache import EmbeddingCache
+from src.ratelimiter import RateLimiter
 from openai import AzureOpenAI
 
 @pytest.fixture
@@ -31,4 +35,162 @@ def test_get_embedding_happy_path(mock_openai_client):
     assert result == [0.1] * 1536
     assert isinstance(result, list)
     assert len(result) == 1536
-    assert all(isinstance(x, float) for x in result)
\ No newline at end of file
+    assert all(isinstance(x, float) for x in result)
+
+def test_get_embedding_uses_the_configured_deployment(mock_openai_client):
+    service = EmbeddingService(mock_openai_client, model="text-embedding-3-large")
+
+    service.get_embedding("sample query")
+
+    mock_openai_client.embeddings.create.assert_called_once_with(
+        input=["sample query"],
+        model="text-embedding-3-large"
+    )
+
+def make_batch_response(texts):
+    return Mock(data=[
+        Mock(index=i, embedding=[float(len(text))])
+        for i, text in enumerate(texts)
+    ])
+
+def test_get_embeddings_packs_by_item_count(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = lambda input, model: make_batch_response(input)
+    service = EmbeddingService(mock_openai_client)
+    service.MAX_BATCH_SIZE = 2
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    result = service.get_embeddings(texts)
+
+    assert mock_openai_client.embeddings.create.call_count == 3
+    mock_openai_client.embeddings.create.assert_has_calls([
+        call(input=["a", "bb"], model="text-embedding-ada-002"),
+        call(input=["ccc", "dddd"], model="text-embedding-ada-002"),
+        call(input=["eeeee"], model="text-embedding-ada-002")
+    ])
+    assert result == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+
+def test_get_embeddings_packs_by_token_budget(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = lambda input, model: make_batch_response(input)
+    tokenizer = Mock()
+    tokenizer.encode.side_effect = lambda text: list(text)
+    service = EmbeddingService(mock_openai_client, tokenizer)
+    service.MAX_BATCH_TOKENS = 5
+    texts = ["aa", "bbb", "cc", "dddddd"]
+
+    result = service.get_embeddings(texts)
+
+    mock_openai_client.embeddings.create.assert_has_calls([
+        call(input=["aa", "bbb"], model="text-embedding-ada-002"),
+        call(input=["cc"], model="text-embedding-ada-002"),
+        call(input=["dddddd"], model="text-embedding-ada-002")
+    ])
+    assert result == [[2.0], [3.0], [2.0], [6.0]]
+
+def test_get_embeddings_keeps_order_when_response_is_unordered(mock_openai_client):
+    mock_openai_client.embeddings.create.return_value = Mock(data=[
+        Mock(index=1, embedding=[0.2]),
+        Mock(index=0, embedding=[0.1])
+    ])
+    service = EmbeddingService(mock_openai_client)
+
+    result = service.get_embeddings(["first", "second"])
+
+    assert result == [[0.1], [0.2]]
+
+def test_get_embeddings_splits_failed_batch(mock_openai_client):
+    def create(input, model):
+        if "bad" in input:
+            raise ValueError("Invalid input")
+        return make_batch_response(input)
+    mock_openai_client.embeddings.create.side_effect = create
+    service = EmbeddingService(mock_openai_client)
+
+    result = service.get_embeddings(["a", "bad", "ccc", "dddd"])
+
+    # [a, bad, ccc, dddd] -> [a, bad] + [ccc, dddd] -> [a] + [bad]
+    assert mock_openai_client.embeddings.create.call_count == 5
+    assert result == [[1.0], None, [3.0], [4.0]]
+
+def test_get_embeddings_empty_input(mock_openai_client):
+    service = EmbeddingService(mock_openai_client)
+
+    assert service.get_embeddings([]) == []
+    mock_openai_client.embeddings.create.assert_not_called()
+
+def test_get_embeddings_uses_cache(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = lambda input, model: make_batch_response(input)
+    cache = EmbeddingCache()
+    cache.put("text-embedding-ada-002", "cached", [9.0])
+    service = EmbeddingService(mock_openai_client, cache=cache)
+
+    result = service.get_embeddings(["cached", "new", "other", "new"])
+
+    # Only distinct uncached texts are sent
+    mock_openai_client.embeddings.create.assert_called_once_with(
+        input=["new", "other"],
+        model="text-embedding-ada-002"
+    )
+    assert result == [[9.0], [3.0], [5.0], [3.0]]
+    assert cache.get("text-embedding-ada-002", "other") == [5.0]
+
+def test_get_embeddings_does_not_cache_failures(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = ValueError("Invalid input")
+    cache = EmbeddingCache()
+    service = EmbeddingService(mock_openai_client, cache=cache)
+
+    assert service.get_embeddings(["bad"]) == [None]
+    assert len(cache) == 0
+
+def test_get_embedding_uses_cache(mock_openai_client):
+    cache = EmbeddingCache()
+    service = EmbeddingService(mock_openai_client, cache=cache)
+
+    first = service.get_embedding("sample query")
+    second = service.get_embedding("sample query")
+
+    mock_openai_client.embeddings.create.assert_called_once()
+    # Vectors are stored as float32, so compare approximately
+    assert second == pytest.approx(first)
+    assert cache.hits == 1
+
+class ThrottledError(Exception):
+    status_code = 429
+
+def test_get_embeddings_goes_through_rate_limiter(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = lambda input, model: make_batch_response(input)
+    limiter = RateLimiter(tokens_per_minute=60000, clock=lambda: 0.0)
+    service = EmbeddingService(mock_openai_client, rate_limiter=limiter)
+
+    result = service.get_embeddings(["a" * 40, "b" * 40])
+
+    assert result == [[40.0], [40.0]]
+    # Two texts of 11 estimated tokens each were charged to the bucket
+    assert limiter.tokens.level == pytest.approx(limiter.tokens.capacity - 22)
+
+def test_get_embeddings_does_not_split_throttled_batch(mock_openai_client):
+    mock_openai_client.embeddings.create.side_effect = ThrottledError("Too Many Requests")
+    limiter = RateLimiter()
+    limiter.MAX_RETRIES = 1
+    limiter.DEFAULT_RETRY_AFTER_SECONDS = 0
+    service = EmbeddingService(mock_openai_client, rate_limiter=limiter)
+
+    assert service.get_embeddings(["a", "b", "c", "d"]) == [None] * 4
+    # One attempt plus one retry, no bisection
+    assert mock_openai_client.embeddings.create.call_count == 2
+
+def test_get_embeddings_compact_format_uses_base64_buffers(mock_openai_client):
+    raw = np.array([0.5, -0.25], dtype="<f4")
+    encoded = base64.b64encode(raw.tobytes()).decode("ascii")
+    mock_openai_client.embeddings.create.side_effect = lambda input, model, encoding_format: Mock(data=[
+        Mock(index=i, embedding=encoded) for i in range(len(input))
+    ])
+    cache = EmbeddingCache()
+    service = EmbeddingService(mock_openai_client, cache=cache, vector_format="float16")
+
+    result = service.get_embeddings(["a", "b"])
+
+    assert mock_openai_client.embeddings.create.call_args.kwargs["encoding_format"] == "base64"
+    assert all(vector.dtype == np.float16 for vector in result)
+    np.testing.assert_array_equal(result[0], [0.5, -0.25])
+    # The cache keeps the full-precision vector
+    assert cache.get("text-embedding-ada-002", "a") == [0.5, -0.25]
@@ -0,0 +1,67 @@
+import pytest
+import function_app
+from src import searchindexes, tokenizer
+
+@pytest.fixture
+def azure_settings(monkeypatch, tmp_path):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://openai.example")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "key")
+    monkeypatch.setenv("AZURE_SEARCH_API_URL", "https://search.example")
+    monkeypatch.setenv("AZURE_SEARCH_API_KEY", "key")
+    monkeypatch.setattr(function_app, "SEARCH_BACKEND", "azure")
+    monkeypatch.setattr(function_app, "INGESTION_ENGINE", "async")
+    monkeypatch.setattr(function_app, "INGESTION_CHECKPOINTS", "none")
+    monkeypatch.setattr(function_app, "EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(tokenizer, "load_tokenizer", lambda: object())
+
+def index_definition(*fields):
+    return {
+        "name": "rag-index-v2",
+        "fields": [{"name": "id"}, {"name": "embedding", "vectorSearchProfile": "profile"}] + [{"name": name} for name in fields],
+        "vectorSearch": {
+            "profiles": [{"name": "profile", "vectorizer": "vectorizer"}],
+            "vectorizers": [{"name": "vectorizer", "kind": "azureOpenAI", "azureOpenAIParameters": {"deploymentId": "text-embedding-3-large"}}]
+        }
+    }
+
+def describe_as(monkeypatch, definition):
+    described = []
+    def describe(admin, name):
+        described.append(name)
+        return definition["name"], definition
+    monkeypatch.setattr(searchindexes.SearchIndexAdmin, "describe", describe)
+    return described
+
+def test_indexers_write_to_the_index_behind_the_alias(azure_settings, monkeypatch):
+    described = describe_as(monkeypatch, index_definition())
+
+    indexing_service, async_indexing_service = function_app._create_indexing_services()
+
+    assert described == [function_app.AZURE_SEARCH_INDEX_NAME]
+    # The /docs requests use the GA API version, which does not take an alias
+    assert indexing_service.search_indexer.index_name == "rag-index-v2"
+    assert async_indexing_service.search_indexer.index_name == "rag-index-v2"
+    assert indexing_service.embedding_service.model == "text-embedding-3-large"
+    # The index has no indexed_at field to stamp
+    assert not indexing_service.search_indexer.stamp_documents
+    assert not async_indexing_service.search_indexer.stamp_documents
+
+def test_indexers_stamp_documents_when_the_index_has_indexed_at(azure_settings, monkeypatch):
+    describe_as(monkeypatch, index_definition(searchindexes.INDEXED_AT_FIELD))
+
+    indexing_service, async_indexing_service = function_app._create_indexing_services()
+
+    assert indexing_service.search_indexer.stamp_documents
+    assert async_indexing_service.search_indexer.stamp_documents
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    (None, False),
+    ('"abc"', True),
+    ('"old", "abc"', True),
+    ('*', True),
+    ('W/"abc"', False),
+    ('"abcd"', False),
+    ('"xabc"', False),
+])
+def test_etag_matches_compares_each_listed_tag(if_none_match, matches):
+    assert function_app._etag_matches(if_none_match, '"abc"') == matches
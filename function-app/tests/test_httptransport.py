@@ -0,0 +1,21 @@
+import requests
+from src import httptransport
+from src.httptransport import create_session, get_shared_session
+
+def test_create_session_mounts_pooled_adapter():
+    session = create_session(pool_connections=2, pool_maxsize=8)
+
+    adapter = session.get_adapter("https://example.search.windows.net")
+    assert isinstance(session, requests.Session)
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 8
+    assert adapter.max_retries.total == 0
+    assert session.get_adapter("http://localhost") is adapter
+
+def test_get_shared_session_returns_same_session(monkeypatch):
+    monkeypatch.setattr(httptransport, "_shared_session", None)
+
+    first = get_shared_session()
+    second = get_shared_session()
+
+    assert first is second
@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import MagicMock
+from src.indexmigration import IndexMigration
+from src.searchindexes import SearchIndexAdmin, embedding_deployment
+
+@pytest.fixture
+def admin():
+    admin = MagicMock(spec=SearchIndexAdmin)
+    admin.get_alias.return_value = "rag-index"
+    return admin
+
+def test_create_copies_the_live_index(admin):
+    admin.get_index.return_value = {
+        "name": "rag-index",
+        "fields": [{"name": "embedding", "dimensions": 1536, "vectorSearchProfile": "p"}],
+        "vectorSearch": {"profiles": [{"name": "p", "algorithm": "a"}]}
+    }
+
+    IndexMigration(admin, "rag").create("rag-index-v2", "text-embedding-3-large", "https://openai.example", dimensions=3072)
+
+    admin.get_index.assert_called_once_with("rag-index")
+    created = admin.create_index.call_args.args[0]
+    assert created["name"] == "rag-index-v2"
+    assert created["fields"][0]["dimensions"] == 3072
+    assert embedding_deployment(created) == "text-embedding-3-large"
+
+@pytest.mark.parametrize("target_count, tolerance, verified", [(10, 0, True), (9, 0, False), (9, 1, True)])
+def test_verify_compares_document_counts(admin, target_count, tolerance, verified):
+    admin.count_documents.side_effect = lambda name: {"rag-index": 10, "rag-index-v2": target_count}[name]
+
+    assert IndexMigration(admin, "rag").verify("rag-index-v2", tolerance) == verified
+
+def test_verify_the_live_index_itself(admin):
+    with pytest.raises(ValueError):
+        IndexMigration(admin, "rag").verify("rag-index")
+
+def test_swap_repoints_the_alias(admin):
+    IndexMigration(admin, "rag").swap("rag-index-v2")
+
+    admin.set_alias.assert_called_once_with("rag", "rag-index-v2")
+
+def test_swap_refuses_to_shadow_an_index(admin):
+    admin.get_alias.return_value = None
+    admin.get_index.return_value = {"name": "rag-index"}
+
+    with pytest.raises(ValueError):
+        IndexMigration(admin, "rag-index").swap("rag-index-v2")
+
+    admin.set_alias.assert_not_called()
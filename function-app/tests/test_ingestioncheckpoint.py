@@ -0,0 +1,105 @@
+import json
+from unittest.mock import MagicMock
+import pytest
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from src.ingestioncheckpoint import (
+    BlobCheckpointStore,
+    IngestionProgress,
+    LocalCheckpointStore,
+    COMPLETED,
+    FAILED,
+    IN_PROGRESS,
+)
+
+def chunk(page, index):
+    return {"id": f"p{page}-{index}", "content": "text", "metadata": {"source_page": page, "chunk_index": index}}
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalCheckpointStore(str(tmp_path / "checkpoints"))
+
+def test_local_store_round_trip(store):
+    assert store.load("pdfs/a.pdf") is None
+
+    store.save("pdfs/a.pdf", {"etag": "1", "status": IN_PROGRESS})
+    store.save("pdfs/a.pdf", {"etag": "1", "status": FAILED})
+
+    assert store.load("pdfs/a.pdf") == {"etag": "1", "status": FAILED}
+    assert store.load("pdfs/b.pdf") is None
+
+def test_blob_store_creates_container_once():
+    container_client = MagicMock()
+    container_client.create_container.side_effect = ResourceExistsError("exists")
+    container_client.download_blob.side_effect = ResourceNotFoundError("missing")
+    blob_store = BlobCheckpointStore(container_client)
+
+    assert blob_store.load("pdfs/a.pdf") is None
+    blob_store.save("pdfs/a.pdf", {"etag": "1"})
+    blob_store.save("pdfs/a.pdf", {"etag": "2"})
+
+    container_client.create_container.assert_called_once_with()
+    container_client.upload_blob.assert_called_with("pdfs/a.pdf.json", json.dumps({"etag": "2"}), overwrite=True)
+
+def test_page_commits_once_indexed_and_a_later_page_is_seen(store):
+    progress = IngestionProgress.load(store, "a.pdf", "etag-1")
+    page1 = [chunk(1, 0), chunk(1, 1)]
+
+    progress.add_chunks(page1, changed=page1)
+    progress.indexed(page1)
+    # More chunks of page 1 may still follow
+    assert progress.committed_page == 0
+
+    progress.add_chunks([chunk(2, 0)], changed=[chunk(2, 0)])
+    assert progress.committed_page == 1
+    assert progress.committed_ids == ["p1-0", "p1-1"]
+
+def test_unindexed_chunk_holds_back_later_pages(store):
+    progress = IngestionProgress.load(store, "a.pdf", "etag-1")
+    chunks = [chunk(1, 0), chunk(2, 0), chunk(3, 0), chunk(4, 0)]
+    # Page 3 was unchanged and needs no indexing
+    progress.add_chunks(chunks, changed=[chunks[0], chunks[1], chunks[3]])
+
+    progress.indexed([chunks[1], chunks[3]])
+    assert progress.committed_page == 0
+
+    progress.indexed([chunks[0]])
+    assert progress.committed_page == 3
+    assert progress.first_page == 4
+
+def test_resumes_only_the_same_blob_version(store):
+    progress = IngestionProgress.load(store, "a.pdf", "etag-1")
+    progress.add_chunks([chunk(1, 0), chunk(2, 0)], changed=[])
+    progress.save(FAILED)
+
+    resumed = IngestionProgress.load(store, "a.pdf", "etag-1")
+    assert (resumed.first_page, resumed.committed_ids, resumed.completed) == (2, ["p1-0"], False)
+    assert IngestionProgress.load(store, "a.pdf", "etag-2").first_page == 1
+
+    resumed.save(COMPLETED)
+    assert IngestionProgress.load(store, "a.pdf", "etag-1").completed
+    assert store.load("a.pdf")["chunk_ids"] == []
+
+def test_flushes_the_index_before_claiming_pages(store):
+    flush = MagicMock()
+    progress = IngestionProgress.load(store, "a.pdf", "etag-1", flush)
+
+    progress.save(IN_PROGRESS)
+
+    flush.assert_called_once_with()
+
+def test_without_store_or_etag_nothing_is_tracked(store):
+    for progress in (IngestionProgress(), IngestionProgress.load(store, "a.pdf", None)):
+        progress.add_chunks([chunk(1, 0), chunk(2, 0)], changed=[])
+        progress.save(FAILED)
+
+        assert progress.first_page == 1
+        assert not progress.due()
+    assert store.load("a.pdf") is None
+
+def test_due_once_per_interval(store):
+    progress = IngestionProgress.load(store, "a.pdf", "etag-1")
+    progress.SAVE_INTERVAL_SECONDS = 0
+
+    assert progress.due()
+    progress.SAVE_INTERVAL_SECONDS = 60
+    assert not progress.due()
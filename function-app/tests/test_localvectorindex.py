@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+from src.localvectorindex import LocalVectorIndex
+
+def make_chunk(chunk_id, source="a.pdf"):
+    return {"id": chunk_id, "source": source, "content": f"content of {chunk_id}", "metadata": {"source_page": 1}}
+
+def random_vectors(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimensions)).astype(np.float32)
+
+def test_search_returns_closest_documents_first():
+    index = LocalVectorIndex()
+    index.index_documents([make_chunk("x"), make_chunk("y"), make_chunk("z")], [[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0]])
+
+    results = index.search([1, 0, 0], top_k=2)
+
+    assert [result["id"] for result in results] == ["x", "z"]
+    assert results[0]["@search.score"] == pytest.approx(1.0)
+    assert results[0]["content"] == "content of x"
+    assert results[0]["metadata"] == {"source_page": 1}
+
+def test_search_can_return_vectors():
+    index = LocalVectorIndex()
+    index.index_documents([make_chunk("x")], [[3, 4]])
+
+    result = index.search([1, 0], top_k=1, include_vectors=True)[0]
+
+    assert result["embedding"] == pytest.approx([0.6, 0.8])
+
+def test_search_empty_index():
+    assert LocalVectorIndex().search([1, 0], top_k=3) == []
+
+def test_index_documents_replaces_existing_key():
+    index = LocalVectorIndex()
+    index.index_documents([make_chunk("x")], [[1, 0]])
+    index.index_documents([make_chunk("x")], [[0, 1]])
+
+    assert len(index) == 1
+    assert index.search([0, 1], top_k=1)[0]["@search.score"] == pytest.approx(1.0)
+
+def test_index_documents_rejects_wrong_dimensions():
+    index = LocalVectorIndex()
+    index.index_documents([make_chunk("x")], [[1, 0]])
+
+    failed = index.index_documents([make_chunk("y")], [[1, 0, 0]])
+
+    assert list(failed) == ["y"]
+    assert len(index) == 1
+
+def test_delete_documents_keeps_matrix_contiguous():
+    index = LocalVectorIndex()
+    vectors = random_vectors(5)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(5)], vectors)
+
+    assert index.delete_documents(["id-1", "missing"]) == {}
+
+    assert len(index) == 4
+    assert "id-1" not in [result["id"] for result in index.search(vectors[1], top_k=4)]
+    # The last row moved into the gap and is still found by its own vector
+    assert index.search(vectors[4], top_k=1)[0]["id"] == "id-4"
+
+def test_get_document_ids_filters_by_source():
+    index = LocalVectorIndex()
+    index.index_documents([make_chunk("x", "a.pdf"), make_chunk("y", "b.pdf")], [[1, 0], [0, 1]])
+
+    assert index.get_document_ids("a.pdf") == ["x"]
+
+def test_matrix_grows_past_initial_capacity():
+    index = LocalVectorIndex()
+    index.INITIAL_CAPACITY = 4
+    vectors = random_vectors(10)
+
+    index.index_documents([make_chunk(f"id-{i}") for i in range(10)], vectors)
+
+    assert len(index) == 10
+    assert index.search(vectors[9], top_k=1)[0]["id"] == "id-9"
+
+def test_ivf_search_finds_nearest_neighbours():
+    index = LocalVectorIndex(ivf_lists=8, nprobe=8)
+    index.IVF_MIN_DOCUMENTS = 100
+    vectors = random_vectors(400)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(400)], vectors)
+    index.flush()
+
+    # Probing every list is exact
+    results = index.search(vectors[123], top_k=3)
+
+    assert index.centroids is not None
+    assert results[0]["id"] == "id-123"
+    assert len(results) == 3
+
+def test_ivf_search_probes_only_closest_lists():
+    index = LocalVectorIndex(ivf_lists=8, nprobe=1)
+    index.IVF_MIN_DOCUMENTS = 100
+    vectors = random_vectors(400)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(400)], vectors)
+    index.flush()
+
+    results = index.search(vectors[7], top_k=400)
+
+    assert results[0]["id"] == "id-7"
+    assert len(results) < 400
+
+def test_search_never_trains_lists():
+    index = LocalVectorIndex(ivf_lists=8, nprobe=1)
+    index.IVF_MIN_DOCUMENTS = 100
+    vectors = random_vectors(400)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(400)], vectors)
+
+    # Untrained, every row is scored
+    assert len(index.search(vectors[7], top_k=400)) == 400
+    assert index.centroids is None
+
+    index.flush()
+    assert index.trained_count == 400
+    index.index_documents([make_chunk(f"new-{i}") for i in range(100)], random_vectors(100, seed=1))
+    index.flush()
+    # Retrained only once the index has doubled
+    assert index.trained_count == 400
+
+def test_ivf_assigns_new_documents_to_lists():
+    index = LocalVectorIndex(ivf_lists=4, nprobe=1)
+    index.IVF_MIN_DOCUMENTS = 50
+    vectors = random_vectors(100)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(60)], vectors[:60])
+    index.flush()
+
+    index.index_documents([make_chunk(f"id-{i}") for i in range(60, 100)], vectors[60:])
+
+    assert index.search(vectors[90], top_k=1)[0]["id"] == "id-90"
+
+def test_save_and_load_memory_maps_vectors(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalVectorIndex(path)
+    vectors = random_vectors(5)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(5)], vectors)
+    index.flush()
+
+    loaded = LocalVectorIndex(path)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert len(loaded) == 5
+    assert loaded.search(vectors[2], top_k=1)[0]["id"] == "id-2"
+    assert loaded.get_document_ids("a.pdf") == [f"id-{i}" for i in range(5)]
+
+def test_loaded_index_can_be_updated(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalVectorIndex(path)
+    vectors = random_vectors(3)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(3)], vectors)
+    index.flush()
+
+    loaded = LocalVectorIndex(path)
+    loaded.delete_documents(["id-0"])
+    loaded.index_documents([make_chunk("id-3")], random_vectors(1, seed=1))
+    loaded.flush()
+
+    reloaded = LocalVectorIndex(path)
+    assert sorted(reloaded.get_document_ids("a.pdf")) == ["id-1", "id-2", "id-3"]
+
+def test_save_and_load_keeps_ivf_partitions(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalVectorIndex(path, ivf_lists=4)
+    index.IVF_MIN_DOCUMENTS = 50
+    vectors = random_vectors(100)
+    index.index_documents([make_chunk(f"id-{i}") for i in range(100)], vectors)
+    index.flush()
+
+    loaded = LocalVectorIndex(path)
+
+    assert loaded.ivf_lists == 4
+    np.testing.assert_array_equal(loaded.assignments, index.assignments[:100])
@@ -1,12 +1,16 @@
+import contextvars
 import io
 import logging
-from unittest.mock import MagicMock, call, patch
+import threading
+from unittest.mock import ANY, MagicMock, call, patch
 import pytest
 
 from src.pdfprocessor import PDFProcessor
 from src.embeddingservice import EmbeddingService
 from src.azuresearchindexer import AzureSearchIndexer
 from src.pdfindexingservice import PdfIndexingService
+from src.ingestioncheckpoint import LocalCheckpointStore
+from src import telemetry
 
 @pytest.fixture
 def mock_pdf_processor():
@@ -18,7 +22,10 @@ def mock_embedding_service():
 
 @pytest.fixture
 def mock_search_indexer():
-    return MagicMock(spec=AzureSearchIndexer)
+    indexer = MagicMock(spec=AzureSearchIndexer)
+    indexer.get_document_ids.return_value = []
+    indexer.delete_documents.return_value = {}
+    return indexer
 
 @pytest.fixture
 def mock_logger():
@@ -54,30 +61,50 @@ class TestPdfIndexingService:
 
         chunk1 = {"id": "uuid1", "content": "content one"}
         chunk2 = {"id": "uuid2", "content": "content two"}
-        mock_pdf_processor.process_pdf_to_chunks.return_value = [chunk1, chunk2]
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [chunk1, chunk2]
 
         embedding1 = [0.1, 0.2]
         embedding2 = [0.3, 0.4]
-        mock_embedding_service.get_embedding.side_effect = [embedding1, embedding2]
+        mock_embedding_service.get_embeddings.return_value = [embedding1, embedding2]
+        mock_search_indexer.index_documents.return_value = {}
 
         indexing_service.process_and_index_pdf(dummy_stream, blob_name)
 
-        mock_pdf_processor.process_pdf_to_chunks.assert_called_once_with(dummy_stream)
+        mock_pdf_processor.extract_pages.assert_called_once_with(dummy_stream, 1)
+        mock_pdf_processor.chunk_pages.assert_called_once_with([(1, "page one")], blob_name)
         mock_logger.info.assert_any_call(f"Extracted 2 chunks from {blob_name}.")
 
-        assert mock_embedding_service.get_embedding.call_count == 2
-        mock_embedding_service.get_embedding.assert_has_calls([
-            call("content one"),
-            call("content two")
-        ])
-
-        assert mock_search_indexer.index_document.call_count == 2
-        mock_search_indexer.index_document.assert_has_calls([
-            call(chunk1, embedding1),
-            call(chunk2, embedding2)
-        ])
+        mock_embedding_service.get_embeddings.assert_called_once_with(["content one", "content two"])
+        mock_search_indexer.index_documents.assert_called_once_with([chunk1, chunk2], [embedding1, embedding2])
         mock_logger.info.assert_any_call(f"Successfully processed and initiated indexing for chunks from {blob_name}")
 
+    def test_process_and_index_pdf_traces_stages_in_callers_context(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer
+    ):
+        request_id = contextvars.ContextVar("request_id", default=None)
+        seen = []
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [{"id": "uuid1", "content": "content one"}]
+        mock_embedding_service.get_embeddings.side_effect = lambda texts: seen.append(request_id.get()) or [[0.1]]
+        mock_search_indexer.index_documents.side_effect = lambda chunks, embeddings: seen.append(request_id.get()) or {}
+        recorder = telemetry.configure("memory")
+        request_id.set("blob-1")
+        try:
+            indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "test.pdf")
+        finally:
+            telemetry.configure("none")
+
+        # Worker threads see the caller's context, which carries the active span
+        assert seen == ["blob-1", "blob-1"]
+        [(name, _, attributes)] = recorder.spans
+        assert name == "ingest.pdf"
+        assert attributes == {"engine": "threaded", "chunks": 1, "unchanged": 0, "indexed": 1, "deleted": 0}
+
     def test_process_and_index_pdf_no_chunks(
         self,
         indexing_service,
@@ -89,14 +116,14 @@ class TestPdfIndexingService:
         dummy_stream = io.BytesIO(b"dummy pdf content")
         blob_name = "empty.pdf"
 
-        mock_pdf_processor.process_pdf_to_chunks.return_value = []
+        mock_pdf_processor.extract_pages.return_value = []
 
         indexing_service.process_and_index_pdf(dummy_stream, blob_name)
 
-        mock_pdf_processor.process_pdf_to_chunks.assert_called_once_with(dummy_stream)
+        mock_pdf_processor.extract_pages.assert_called_once_with(dummy_stream, 1)
         mock_logger.warning.assert_called_once_with(f"No text chunks were extracted from {blob_name}. Skipping indexing.")
-        mock_embedding_service.get_embedding.assert_not_called()
-        mock_search_indexer.index_document.assert_not_called()
+        mock_embedding_service.get_embeddings.assert_not_called()
+        mock_search_indexer.index_documents.assert_not_called()
         # Check the final success message is NOT logged
         assert call(f"Successfully processed and initiated indexing for chunks from {blob_name}") not in mock_logger.info.call_args_list
 
@@ -111,33 +138,28 @@ class TestPdfIndexingService:
     ):
         dummy_stream = io.BytesIO(b"dummy pdf content")
         blob_name = "error.pdf"
-        test_exception = ValueError("Embedding failed")
 
         chunk1 = {"id": "uuid1", "content": "content one"}
         chunk2 = {"id": "uuid2", "content": "content two"} # This one will succeed
-        mock_pdf_processor.process_pdf_to_chunks.return_value = [chunk1, chunk2]
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [chunk1, chunk2]
 
         embedding2 = [0.3, 0.4]
-        # First call fails, second succeeds
-        mock_embedding_service.get_embedding.side_effect = [test_exception, embedding2]
+        # First chunk could not be embedded, second succeeds
+        mock_embedding_service.get_embeddings.return_value = [None, embedding2]
+        mock_search_indexer.index_documents.return_value = {}
 
         indexing_service.process_and_index_pdf(dummy_stream, blob_name)
 
-        mock_pdf_processor.process_pdf_to_chunks.assert_called_once_with(dummy_stream)
-
-        assert mock_embedding_service.get_embedding.call_count == 2
-        mock_embedding_service.get_embedding.assert_has_calls([
-            call("content one"),
-            call("content two")
-        ])
+        mock_pdf_processor.extract_pages.assert_called_once_with(dummy_stream, 1)
+        mock_embedding_service.get_embeddings.assert_called_once_with(["content one", "content two"])
 
         # Indexing should only be called for the successful chunk (chunk2)
-        mock_search_indexer.index_document.assert_called_once_with(chunk2, embedding2)
+        mock_search_indexer.index_documents.assert_called_once_with([chunk2], [embedding2])
 
         # Check that the error for the specific chunk was logged
         mock_logger.error.assert_called_once_with(
-            f"Error processing chunk uuid1 for {blob_name}: {test_exception}",
-            exc_info=True
+            f"Error processing chunk uuid1 for {blob_name}: no embedding was generated"
         )
         mock_logger.info.assert_any_call(f"Successfully processed and initiated indexing for chunks from {blob_name}")
 
@@ -152,36 +174,33 @@ class TestPdfIndexingService:
     ):
         dummy_stream = io.BytesIO(b"dummy pdf content")
         blob_name = "index_error.pdf"
-        test_exception = ConnectionError("Search index unavailable")
+        error_message = "Search index unavailable"
 
         chunk1 = {"id": "uuid1", "content": "content one"} # This one fails indexing
         chunk2 = {"id": "uuid2", "content": "content two"} # This one succeeds
-        mock_pdf_processor.process_pdf_to_chunks.return_value = [chunk1, chunk2]
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [chunk1, chunk2]
 
         embedding1 = [0.1, 0.2]
         embedding2 = [0.3, 0.4]
-        mock_embedding_service.get_embedding.side_effect = [embedding1, embedding2]
+        mock_embedding_service.get_embeddings.return_value = [embedding1, embedding2]
 
-        # First call fails, second succeeds
-        mock_search_indexer.index_document.side_effect = [test_exception, None]
+        # First chunk is rejected by the index, second succeeds
+        mock_search_indexer.index_documents.return_value = {"uuid1": error_message}
 
         indexing_service.process_and_index_pdf(dummy_stream, blob_name)
 
-        mock_pdf_processor.process_pdf_to_chunks.assert_called_once_with(dummy_stream)
-        assert mock_embedding_service.get_embedding.call_count == 2
+        mock_pdf_processor.extract_pages.assert_called_once_with(dummy_stream, 1)
+        mock_embedding_service.get_embeddings.assert_called_once()
 
         # Indexing is attempted for both
-        assert mock_search_indexer.index_document.call_count == 2
-        mock_search_indexer.index_document.assert_has_calls([
-            call(chunk1, embedding1),
-            call(chunk2, embedding2)
-        ])
+        mock_search_indexer.index_documents.assert_called_once_with([chunk1, chunk2], [embedding1, embedding2])
 
         # Check that the error for the specific chunk was logged
         mock_logger.error.assert_called_once_with(
-            f"Error processing chunk uuid1 for {blob_name}: {test_exception}",
-            exc_info=True
+            f"Error indexing chunk uuid1 for {blob_name}: {error_message}"
         )
+        mock_logger.info.assert_any_call(f"Indexed 1 of 2 new or changed chunks from {blob_name}.")
         mock_logger.info.assert_any_call(f"Successfully processed and initiated indexing for chunks from {blob_name}")
 
 
@@ -197,17 +216,257 @@ class TestPdfIndexingService:
         blob_name = "processor_error.pdf"
         test_exception = RuntimeError("PDF processing failed badly")
 
-        mock_pdf_processor.process_pdf_to_chunks.side_effect = test_exception
+        mock_pdf_processor.extract_pages.side_effect = test_exception
 
         with pytest.raises(RuntimeError, match="PDF processing failed badly"):
             indexing_service.process_and_index_pdf(dummy_stream, blob_name)
 
-        mock_pdf_processor.process_pdf_to_chunks.assert_called_once_with(dummy_stream)
-        mock_embedding_service.get_embedding.assert_not_called()
-        mock_search_indexer.index_document.assert_not_called()
+        mock_pdf_processor.extract_pages.assert_called_once_with(dummy_stream, 1)
+        mock_embedding_service.get_embeddings.assert_not_called()
+        mock_search_indexer.index_documents.assert_not_called()
 
         # Check that the overall processing error was logged
         mock_logger.error.assert_called_once_with(
             f"Failed during processing of {blob_name}: {test_exception}",
             exc_info=True
         )
+
+
+    def test_process_and_index_pdf_batches_chunks_across_pages(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer,
+        mock_logger
+    ):
+        indexing_service.EMBED_BATCH_SIZE = 2
+        indexing_service.EMBED_WORKERS = 1
+        indexing_service.INDEX_WORKERS = 1
+        blob_name = "pages.pdf"
+        chunks_by_page = {
+            1: [{"id": "p1c0", "content": "1-0"}, {"id": "p1c1", "content": "1-1"}, {"id": "p1c2", "content": "1-2"}],
+            2: [{"id": "p2c0", "content": "2-0"}],
+        }
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one"), (2, "page two")]
+        mock_pdf_processor.chunk_pages.side_effect = lambda pages, source: [
+            chunk for page_num, _ in pages for chunk in chunks_by_page[page_num]
+        ]
+        mock_embedding_service.get_embeddings.side_effect = lambda texts: [[float(len(t))] for t in texts]
+        mock_search_indexer.index_documents.return_value = {}
+
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), blob_name)
+
+        mock_embedding_service.get_embeddings.assert_has_calls([
+            call(["1-0", "1-1"]),
+            call(["1-2", "2-0"])
+        ])
+        indexed_ids = [
+            chunk["id"]
+            for args in mock_search_indexer.index_documents.call_args_list
+            for chunk in args[0][0]
+        ]
+        assert indexed_ids == ["p1c0", "p1c1", "p1c2", "p2c0"]
+        mock_logger.info.assert_any_call(f"Extracted 4 chunks from {blob_name}.")
+        mock_logger.info.assert_any_call(f"Indexed 4 of 4 new or changed chunks from {blob_name}.")
+
+    def test_process_and_index_pdf_embeds_while_extracting(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer
+    ):
+        indexing_service.EMBED_BATCH_SIZE = 1
+        first_batch_embedding = threading.Event()
+
+        def extract_pages(stream, first_page=1):
+            yield (1, "page one")
+            # The second page is only extracted once the first is being embedded
+            assert first_batch_embedding.wait(timeout=5)
+            yield (2, "page two")
+
+        def get_embeddings(texts):
+            first_batch_embedding.set()
+            return [[0.1] for _ in texts]
+
+        mock_pdf_processor.extract_pages.side_effect = extract_pages
+        mock_pdf_processor.chunk_pages.side_effect = lambda pages, source: [
+            {"id": f"p{page_num}", "content": text} for page_num, text in pages
+        ]
+        mock_embedding_service.get_embeddings.side_effect = get_embeddings
+        mock_search_indexer.index_documents.return_value = {}
+
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "overlap.pdf")
+
+        assert mock_embedding_service.get_embeddings.call_count == 2
+
+    def test_process_and_index_pdf_chunking_error_propagates(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_search_indexer,
+        mock_logger
+    ):
+        blob_name = "chunk_error.pdf"
+        test_exception = ValueError("Tokenizer failed")
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one"), (2, "page two")]
+        mock_pdf_processor.chunk_pages.side_effect = test_exception
+
+        with pytest.raises(ValueError, match="Tokenizer failed"):
+            indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), blob_name)
+
+        mock_search_indexer.index_documents.assert_not_called()
+        mock_logger.error.assert_called_once_with(
+            f"Failed during processing of {blob_name}: {test_exception}",
+            exc_info=True
+        )
+
+
+    def test_process_and_index_pdf_only_indexes_changed_chunks(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer,
+        mock_logger
+    ):
+        blob_name = "edited.pdf"
+        unchanged = {"id": "same", "content": "unchanged text"}
+        edited = {"id": "new", "content": "edited text"}
+        mock_search_indexer.get_document_ids.return_value = ["same", "old"]
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [unchanged, edited]
+        mock_embedding_service.get_embeddings.return_value = [[0.1]]
+        mock_search_indexer.index_documents.return_value = {}
+
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), blob_name)
+
+        mock_search_indexer.get_document_ids.assert_called_once_with(blob_name)
+        mock_embedding_service.get_embeddings.assert_called_once_with(["edited text"])
+        mock_search_indexer.index_documents.assert_called_once_with([edited], [[0.1]])
+        mock_search_indexer.delete_documents.assert_called_once_with(["old"])
+        mock_logger.info.assert_any_call(f"Skipped 1 unchanged chunks from {blob_name}.")
+        mock_logger.info.assert_any_call(f"Deleted 1 stale chunks of {blob_name}.")
+
+    def test_process_and_index_pdf_unchanged_document_is_not_reindexed(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer
+    ):
+        chunk = {"id": "same", "content": "unchanged text"}
+        mock_search_indexer.get_document_ids.return_value = ["same"]
+        mock_pdf_processor.extract_pages.return_value = [(1, "page one")]
+        mock_pdf_processor.chunk_pages.return_value = [chunk]
+
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "same.pdf")
+
+        mock_embedding_service.get_embeddings.assert_not_called()
+        mock_search_indexer.index_documents.assert_not_called()
+        mock_search_indexer.delete_documents.assert_not_called()
+
+    def test_process_and_index_pdf_keeps_old_chunks_when_processing_fails(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_search_indexer
+    ):
+        mock_search_indexer.get_document_ids.return_value = ["old"]
+        mock_pdf_processor.extract_pages.side_effect = RuntimeError("Corrupt PDF")
+
+        with pytest.raises(RuntimeError):
+            indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "broken.pdf")
+
+        mock_search_indexer.delete_documents.assert_not_called()
+
+    def test_process_and_index_pdf_bounds_chunks_in_flight(
+        self,
+        indexing_service,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer
+    ):
+        indexing_service.MAX_CHUNKS_IN_FLIGHT = 2
+        lock = threading.Lock()
+        in_flight = {"current": 0, "peak": 0}
+
+        def chunk_pages(pages, source):
+            return [{"id": f"p{page_num}c{i}", "content": text} for page_num, text in pages for i in range(3)]
+
+        def get_embeddings(texts):
+            with lock:
+                in_flight["current"] += len(texts)
+                in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            return [[0.1] for _ in texts]
+
+        def index_documents(chunks, embeddings):
+            with lock:
+                in_flight["current"] -= len(chunks)
+            return {}
+
+        mock_pdf_processor.extract_pages.return_value = [(page, "text") for page in range(1, 5)]
+        mock_pdf_processor.chunk_pages.side_effect = chunk_pages
+        mock_embedding_service.get_embeddings.side_effect = get_embeddings
+        mock_search_indexer.index_documents.side_effect = index_documents
+
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "big.pdf")
+
+        indexed = sum(len(args[0][0]) for args in mock_search_indexer.index_documents.call_args_list)
+        assert indexed == 12
+        assert in_flight["peak"] <= 2
+
+    def test_process_and_index_pdf_resumes_after_last_committed_page(
+        self,
+        mock_pdf_processor,
+        mock_embedding_service,
+        mock_search_indexer,
+        mock_logger,
+        tmp_path
+    ):
+        store = LocalCheckpointStore(str(tmp_path))
+        indexing_service = PdfIndexingService(mock_pdf_processor, mock_embedding_service, mock_search_indexer, mock_logger, store)
+        indexing_service.EMBED_BATCH_SIZE = 1
+        indexed_ids = set()
+        pages_one_and_two_indexed = threading.Event()
+
+        def index_documents(chunks, embeddings):
+            indexed_ids.update(chunk["id"] for chunk in chunks)
+            if {"p1", "p2"} <= indexed_ids:
+                pages_one_and_two_indexed.set()
+            return {}
+
+        def timed_out_extraction(stream, first_page=1):
+            yield (1, "one")
+            yield (2, "two")
+            yield (3, "three")
+            pages_one_and_two_indexed.wait(5)
+            raise TimeoutError("function timed out")
+
+        mock_pdf_processor.chunk_pages.side_effect = lambda pages, source: [
+            {"id": f"p{page_num}", "content": text, "metadata": {"source_page": page_num, "chunk_index": 0}}
+            for page_num, text in pages
+        ]
+        mock_embedding_service.get_embeddings.side_effect = lambda texts: [[0.1] for _ in texts]
+        mock_search_indexer.index_documents.side_effect = index_documents
+        mock_pdf_processor.extract_pages.side_effect = timed_out_extraction
+
+        with pytest.raises(TimeoutError):
+            indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "big.pdf", etag="v1")
+        assert store.load("big.pdf")["committed_page"] == 2
+
+        # The retry starts after page 2 and keeps its chunks
+        mock_search_indexer.get_document_ids.return_value = sorted(indexed_ids)
+        mock_pdf_processor.extract_pages.side_effect = None
+        mock_pdf_processor.extract_pages.return_value = [(3, "three")]
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "big.pdf", etag="v1")
+
+        mock_pdf_processor.extract_pages.assert_called_with(ANY, 3)
+        mock_search_indexer.delete_documents.assert_not_called()
+        assert store.load("big.pdf")["status"] == "completed"
+
+        # A completed version is not processed again
+        mock_pdf_processor.extract_pages.reset_mock()
+        indexing_service.process_and_index_pdf(io.BytesIO(b"pdf"), "big.pdf", etag="v1")
+        mock_pdf_processor.extract_pages.assert_not_called()
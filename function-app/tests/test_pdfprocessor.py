@@ -1,9 +1,11 @@
 import io
-import uuid
+import os
 from unittest.mock import MagicMock, patch, call, PropertyMock
+import fitz
 import pytest
 from transformers import GPT2TokenizerFast
 from src.pdfprocessor import PDFProcessor
+from src.spooledpdf import SpooledPdf
 
 # --- Fixtures ---
 
@@ -13,6 +15,17 @@ def mock_tokenizer():
     mock = MagicMock(spec=GPT2TokenizerFast)
     mock.encode.side_effect = lambda text: list(range(len(text)))
     mock.decode.side_effect = lambda tokens: "".join([f"t{t}" for t in tokens])
+    mock.is_fast = False
+    return mock
+
+@pytest.fixture
+def mock_fast_tokenizer():
+    # One token per character, with character offsets like a fast tokenizer
+    mock = MagicMock(spec=GPT2TokenizerFast)
+    mock.is_fast = True
+    mock.backend_tokenizer.encode_batch.side_effect = lambda texts, add_special_tokens: [
+        MagicMock(offsets=[(i, i + 1) for i in range(len(text))]) for text in texts
+    ]
     return mock
 
 # --- Test Class ---
@@ -23,9 +36,8 @@ class TestPDFProcessor:
         processor = PDFProcessor(tokenizer=mock_tokenizer)
         assert processor.tokenizer is mock_tokenizer
 
-    # Test the static-like method __extract_text_from_pdf
     @patch('src.pdfprocessor.fitz.open') # Patch where fitz is imported/used
-    def test_extract_text_from_pdf_logic(self, mock_fitz_open):
+    def test_extract_pages_logic(self, mock_fitz_open, mock_tokenizer):
         # Arrange
         # Mock the document object returned by fitz.open
         mock_doc = MagicMock()
@@ -42,15 +54,25 @@ class TestPDFProcessor:
 
         # Make the mock document iterable, yielding the mock pages
         mock_doc.__iter__.return_value = [mock_page1, mock_page2, mock_page3, mock_page4]
-        mock_fitz_open.return_value = mock_doc # fitz.open returns our mock doc
+        mock_doc.page_count = 4
+        mock_doc.is_closed = False
+        opened_with = {}
+        def fitz_open(stream, filetype):
+            # Capture the bytes while the buffer view is still alive
+            opened_with.update(stream=bytes(stream), filetype=filetype)
+            return mock_doc
+        mock_fitz_open.side_effect = fitz_open # fitz.open returns our mock doc
 
         dummy_bytes = b"dummy pdf bytes"
         pdf_stream = io.BytesIO(dummy_bytes)
 
-        extracted_data = PDFProcessor._PDFProcessor__extract_text_from_pdf(self, pdf_stream)
+        processor = PDFProcessor(tokenizer=mock_tokenizer)
+        extracted_data = list(processor.extract_pages(pdf_stream))
 
         # Assert
-        mock_fitz_open.assert_called_once_with(stream=dummy_bytes, filetype="pdf")
+        mock_fitz_open.assert_called_once()
+        assert opened_with == {"stream": dummy_bytes, "filetype": "pdf"}
+        mock_doc.close.assert_called_once()
         assert mock_page1.get_text.call_count == 1
         assert mock_page2.get_text.call_count == 1
         assert mock_page3.get_text.call_count == 1
@@ -62,6 +84,57 @@ class TestPDFProcessor:
             # Page 3 & 4 skipped as text is empty or None
         ]
 
+    def test_extract_pages_in_parallel_matches_serial(self, mock_tokenizer):
+        doc = fitz.open()
+        for page_index in range(7):
+            page = doc.new_page()
+            if page_index != 3: # Leave one page empty
+                page.insert_text((72, 72), f"Text from page {page_index + 1}.")
+        pdf_bytes = doc.tobytes()
+        doc.close()
+
+        serial = PDFProcessor(tokenizer=mock_tokenizer)
+        serial.EXTRACT_PROCESSES = 1
+        parallel = PDFProcessor(tokenizer=mock_tokenizer)
+        parallel.EXTRACT_PROCESSES = 2
+        parallel.PARALLEL_EXTRACT_MIN_PAGES = 5
+        parallel.PAGE_RANGE_SIZE = 2
+
+        try:
+            expected = list(serial.extract_pages(io.BytesIO(pdf_bytes)))
+            result = list(parallel.extract_pages(io.BytesIO(pdf_bytes)))
+        finally:
+            parallel.close()
+
+        assert [page_num for page_num, _ in expected] == [1, 2, 3, 5, 6, 7]
+        assert result == expected
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_extract_pages_from_spooled_pdf(self, mock_tokenizer, tmp_path, monkeypatch, parallel):
+        doc = fitz.open()
+        for page_index in range(6):
+            doc.new_page().insert_text((72, 72), f"Text from page {page_index + 1}.")
+        pdf_bytes = doc.tobytes()
+        doc.close()
+        processor = PDFProcessor(tokenizer=mock_tokenizer)
+        processor.EXTRACT_PROCESSES = 2 if parallel else 1
+        processor.PARALLEL_EXTRACT_MIN_PAGES = 5
+        processor.PAGE_RANGE_SIZE = 2
+        expected = list(processor.extract_pages(pdf_bytes))
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+        try:
+            with SpooledPdf.spool(io.BytesIO(pdf_bytes), len(pdf_bytes), max_in_memory_bytes=0) as pdf:
+                # Workers read the spooled file itself rather than a second copy
+                assert os.listdir(tmp_path) == [os.path.basename(pdf.path)]
+                result = list(processor.extract_pages(pdf))
+                assert os.listdir(tmp_path) == [os.path.basename(pdf.path)]
+        finally:
+            processor.close()
+
+        assert len(expected) == 6
+        assert result == expected
+
     def test_chunk_text_logic(self, mock_tokenizer):
         # Arrange
         processor = PDFProcessor(tokenizer=mock_tokenizer)
@@ -87,16 +160,42 @@ class TestPDFProcessor:
             call([8, 9])
         ])
 
+    def test_chunk_pages_by_offsets(self, mock_fast_tokenizer):
+        processor = PDFProcessor(tokenizer=mock_fast_tokenizer)
+        processor.CHUNK_SIZE = 5
+        processor.CHUNK_OVERLAP = 1
+
+        records = processor.chunk_pages([(1, "abcdefghij"), (2, "xyz")], "a.pdf")
+
+        # Same windows as the decoding chunker, sliced from the page text
+        assert [(r["metadata"]["source_page"], r["content"]) for r in records] == [
+            (1, "abcde"), (1, "efghi"), (1, "ij"), (2, "xyz")
+        ]
+        # All pages are tokenized in one batched call and nothing is decoded
+        mock_fast_tokenizer.backend_tokenizer.encode_batch.assert_called_once_with(
+            ["abcdefghij", "xyz"], add_special_tokens=False
+        )
+        mock_fast_tokenizer.decode.assert_not_called()
+
+    def test_chunk_pages_strips_window_whitespace(self, mock_fast_tokenizer):
+        processor = PDFProcessor(tokenizer=mock_fast_tokenizer)
+        processor.CHUNK_SIZE = 4
+        processor.CHUNK_OVERLAP = 0
+
+        records = processor.chunk_pages([(1, "ab  cd")], "a.pdf")
+
+        assert [r["content"] for r in records] == ["ab", "cd"]
+
     # Test the public orchestration method
-    @patch('src.pdfprocessor.uuid.uuid4')
     @patch.object(PDFProcessor, '_PDFProcessor__chunk_text')
-    @patch.object(PDFProcessor, '_PDFProcessor__extract_text_from_pdf')
+    @patch.object(PDFProcessor, 'extract_pages')
     def test_process_pdf_to_chunks_orchestration(
-        self, mock_extract, mock_chunk, mock_uuid, mock_tokenizer
+        self, mock_extract, mock_chunk, mock_tokenizer
     ):
         # Arrange
         processor = PDFProcessor(tokenizer=mock_tokenizer)
         dummy_stream = io.BytesIO(b"dummy pdf")
+        source = "uploads/manual.pdf"
 
         # Configure mocks for internal methods
         mock_extract.return_value = [
@@ -114,44 +213,63 @@ class TestPDFProcessor:
                 return []
         mock_chunk.side_effect = chunk_side_effect
 
-        # Configure mock UUIDs
-        mock_uuid_values = [uuid.UUID('11111111-1111-1111-1111-111111111111'),
-                            uuid.UUID('22222222-2222-2222-2222-222222222222'),
-                            uuid.UUID('33333333-3333-3333-3333-333333333333')]
-        mock_uuid.side_effect = [str(u) for u in mock_uuid_values]
-
         # Act
-        chunk_records = processor.process_pdf_to_chunks(dummy_stream)
+        chunk_records = processor.process_pdf_to_chunks(dummy_stream, source)
 
         # Assert
         # Check internal methods were called correctly
-        mock_extract.assert_called_once_with(dummy_stream)
+        mock_extract.assert_called_once_with(dummy_stream, 1)
         assert mock_chunk.call_count == 2
         mock_chunk.assert_has_calls([
             call("Full text page 1."),
             call("Full text page 3.")
         ], any_order=False) # Order matters here
 
-        # Check uuid was called for each final chunk
-        assert mock_uuid.call_count == 3
-
         # Check the final output structure
         expected_records = [
             {
-                "id": '11111111-1111-1111-1111-111111111111',
+                "id": PDFProcessor.make_chunk_id(source, 1, 0, "chunk1a"),
+                "source": source,
                 "content": "chunk1a",
                 "metadata": {"source_page": 1, "chunk_index": 0}
             },
             {
-                "id": '22222222-2222-2222-2222-222222222222',
+                "id": PDFProcessor.make_chunk_id(source, 1, 1, "chunk1b"),
+                "source": source,
                 "content": "chunk1b",
                 "metadata": {"source_page": 1, "chunk_index": 1}
             },
             {
-                "id": '33333333-3333-3333-3333-333333333333',
+                "id": PDFProcessor.make_chunk_id(source, 3, 0, "chunk3a"),
+                "source": source,
                 "content": "chunk3a",
                 "metadata": {"source_page": 3, "chunk_index": 0}
             }
         ]
         assert chunk_records == expected_records
 
+    @patch.object(PDFProcessor, 'chunk_pages')
+    @patch.object(PDFProcessor, 'extract_pages')
+    def test_iter_chunks_is_lazy(self, mock_extract, mock_chunk_pages, mock_tokenizer):
+        processor = PDFProcessor(tokenizer=mock_tokenizer)
+        processor.PAGE_BATCH_SIZE = 2
+        mock_extract.return_value = iter([(1, "page one"), (2, "page two"), (3, "page three")])
+        mock_chunk_pages.side_effect = lambda pages, source: [{"page": page_num} for page_num, _ in pages]
+
+        chunks = processor.iter_chunks(io.BytesIO(b"pdf"), "a.pdf")
+
+        assert next(chunks) == {"page": 1}
+        # Only the first batch of pages has been chunked so far
+        mock_chunk_pages.assert_called_once_with([(1, "page one"), (2, "page two")], "a.pdf")
+        assert list(chunks) == [{"page": 2}, {"page": 3}]
+
+    def test_make_chunk_id_is_deterministic(self):
+        chunk_id = PDFProcessor.make_chunk_id("a.pdf", 1, 0, "text")
+
+        assert chunk_id == PDFProcessor.make_chunk_id("a.pdf", 1, 0, "text")
+        assert chunk_id != PDFProcessor.make_chunk_id("b.pdf", 1, 0, "text")
+        assert chunk_id != PDFProcessor.make_chunk_id("a.pdf", 2, 0, "text")
+        assert chunk_id != PDFProcessor.make_chunk_id("a.pdf", 1, 1, "text")
+        assert chunk_id != PDFProcessor.make_chunk_id("a.pdf", 1, 0, "edited text")
+        # Valid Azure AI Search document key
+        assert all(c in "0123456789abcdef" for c in chunk_id)
@@ -0,0 +1,243 @@
+import asyncio
+import threading
+from unittest.mock import Mock
+import pytest
+from src import ratelimiter, telemetry
+from src.ratelimiter import RateLimiter, get_rate_limiter, retry_after_seconds
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class ThrottledError(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("Too Many Requests")
+        self.response = Mock(headers=headers or {})
+
+class ServerError(Exception):
+    status_code = 503
+
+def make_limiter(tokens_per_minute=None, requests_per_minute=None, max_concurrency=None):
+    clock = FakeClock()
+    limiter = RateLimiter(tokens_per_minute, requests_per_minute, max_concurrency, clock=clock)
+    limiter.DEFAULT_RETRY_AFTER_SECONDS = 0
+    limiter.TRANSIENT_BACKOFF_SECONDS = 0
+    return limiter, clock
+
+def test_token_bucket_limits_burst_and_refills():
+    # 600 tokens per minute = 10 per second, with 10 seconds of burst
+    limiter, clock = make_limiter(tokens_per_minute=600)
+
+    first, _ = limiter.try_acquire(80)
+    second, wait = limiter.try_acquire(80)
+
+    assert first is not None
+    assert second is None
+    assert wait == pytest.approx(6.0)
+
+    limiter.release(first)
+    clock.now += 6
+    second, wait = limiter.try_acquire(80)
+    assert second is not None
+
+def test_request_bucket_limits_requests_per_minute():
+    limiter, clock = make_limiter(requests_per_minute=6)
+
+    permit, _ = limiter.try_acquire()
+    limiter.release(permit)
+    _, wait = limiter.try_acquire()
+
+    assert wait == pytest.approx(10.0)
+
+def test_oversized_request_waits_for_full_bucket():
+    limiter, clock = make_limiter(tokens_per_minute=600)
+
+    permit, _ = limiter.try_acquire(50)
+    limiter.release(permit)
+    blocked, wait = limiter.try_acquire(1000)
+    clock.now += wait
+    granted, _ = limiter.try_acquire(1000)
+
+    assert blocked is None
+    assert granted is not None
+
+def test_actual_usage_settles_estimate():
+    limiter, clock = make_limiter(tokens_per_minute=600)
+
+    permit, _ = limiter.try_acquire(10)
+    limiter.release(permit, tokens_used=60)
+
+    assert limiter.tokens.level == pytest.approx(40)
+
+def test_concurrency_limit_blocks_until_release():
+    limiter, clock = make_limiter(max_concurrency=2)
+
+    permits = [limiter.try_acquire()[0] for _ in range(3)]
+
+    assert permits[2] is None
+    limiter.release(permits[0])
+    assert limiter.try_acquire()[0] is not None
+
+def test_concurrency_grows_additively_and_halves_on_throttle():
+    limiter, clock = make_limiter()
+    limiter.concurrency = 8.0
+
+    for _ in range(8):
+        permit, _ = limiter.try_acquire()
+        limiter.release(permit)
+    assert int(limiter.concurrency) == 8
+    assert limiter.concurrency > 8.9
+
+    clock.now += 1
+    permit, _ = limiter.try_acquire()
+    limiter.release(permit, succeeded=False, throttled=True, retry_after=2)
+
+    assert int(limiter.concurrency) == 4
+    assert limiter.stats()["throttled"] == 1
+
+def test_throttle_signals_from_same_round_cut_once():
+    limiter, clock = make_limiter()
+    limiter.concurrency = 8.0
+    permits = [limiter.try_acquire()[0] for _ in range(4)]
+
+    clock.now += 1
+    for permit in permits:
+        limiter.release(permit, succeeded=False, throttled=True)
+
+    assert limiter.concurrency == 4.0
+
+def test_retry_after_pauses_every_caller():
+    limiter, clock = make_limiter()
+
+    permit, _ = limiter.try_acquire()
+    limiter.release(permit, succeeded=False, throttled=True, retry_after=3)
+    blocked, wait = limiter.try_acquire()
+    clock.now += 3
+
+    assert blocked is None
+    assert wait == pytest.approx(3)
+    assert limiter.try_acquire()[0] is not None
+
+def test_retry_after_seconds_reads_headers():
+    assert retry_after_seconds(ThrottledError({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(ThrottledError({"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(ThrottledError()) is None
+    assert retry_after_seconds(ValueError()) is None
+
+def test_call_retries_throttled_and_transient_failures():
+    limiter, clock = make_limiter()
+    request = Mock(side_effect=[ThrottledError(), ServerError(), "ok"])
+
+    assert limiter.call(request) == "ok"
+    assert request.call_count == 3
+    assert limiter.in_flight == 0
+
+def test_call_counts_retries_and_throttles():
+    limiter, clock = make_limiter()
+    limiter.name = "text-embedding-ada-002"
+    request = Mock(side_effect=[ThrottledError(), ServerError(), "ok"])
+    recorder = telemetry.configure("memory")
+    try:
+        limiter.call(request)
+    finally:
+        telemetry.configure("none")
+
+    assert recorder.total(telemetry.RETRIES, limiter="text-embedding-ada-002") == 2
+    assert recorder.total(telemetry.THROTTLES, limiter="text-embedding-ada-002") == 1
+    assert len(recorder.values(telemetry.RATE_LIMIT_WAIT)) == 3
+
+def test_call_raises_other_errors_immediately():
+    limiter, clock = make_limiter()
+    request = Mock(side_effect=ValueError("bad input"))
+
+    with pytest.raises(ValueError):
+        limiter.call(request)
+    assert request.call_count == 1
+    assert limiter.in_flight == 0
+
+def test_call_gives_up_after_max_retries():
+    limiter, clock = make_limiter()
+    limiter.MAX_RETRIES = 2
+    request = Mock(side_effect=ThrottledError())
+
+    with pytest.raises(ThrottledError):
+        limiter.call(request)
+    assert request.call_count == 3
+
+def test_call_async_retries_throttled_calls():
+    limiter, clock = make_limiter()
+    responses = [ThrottledError(), "ok"]
+
+    async def request():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert asyncio.run(limiter.call_async(request)) == "ok"
+    assert limiter.in_flight == 0
+
+def test_acquire_shares_slots_between_threads():
+    limiter = RateLimiter(max_concurrency=2)
+    limiter.INITIAL_CONCURRENCY = 2
+    active = {"current": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            active["current"] += 1
+            active["peak"] = max(active["peak"], active["current"])
+        threading.Event().wait(0.01)
+        with lock:
+            active["current"] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(request,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert active["peak"] <= 2
+
+def test_get_rate_limiter_is_shared_per_deployment(monkeypatch):
+    monkeypatch.setattr(ratelimiter, "_shared_limiters", {})
+
+    first = get_rate_limiter("embeddings", tokens_per_minute=1000)
+    again = get_rate_limiter("embeddings")
+    other = get_rate_limiter("chat")
+
+    assert first is again
+    assert first is not other
+
+class Chunk:
+    def __init__(self, total_tokens=None):
+        self.usage = Mock(total_tokens=total_tokens) if total_tokens is not None else None
+
+def test_stream_holds_the_slot_until_exhausted():
+    limiter, clock = make_limiter(tokens_per_minute=600)
+    stream = limiter.stream(Mock(return_value=[Chunk(), Chunk(), Chunk(60)]), tokens=10)
+
+    next(stream)
+    assert limiter.in_flight == 1
+    assert len(list(stream)) == 2
+
+    assert limiter.in_flight == 0
+    # Settled against the usage of the final chunk
+    assert limiter.tokens.level == pytest.approx(40)
+
+def test_stream_closed_early_releases_the_slot():
+    limiter, clock = make_limiter()
+    response = Mock()
+    response.__iter__ = Mock(return_value=iter([Chunk(), Chunk()]))
+    stream = limiter.stream(Mock(side_effect=[ThrottledError(), response]))
+
+    next(stream)
+    stream.close()
+
+    assert limiter.in_flight == 0
+    response.close.assert_called_once()
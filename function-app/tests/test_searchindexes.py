@@ -0,0 +1,100 @@
+import pytest
+from unittest.mock import MagicMock
+from src.searchindexes import INDEXED_AT_FIELD, SearchIndexAdmin, embedding_deployment, has_field, versioned_definition
+
+URL = "https://test.search.windows.net"
+
+def index_definition(name="rag-index"):
+    return {
+        "@odata.etag": '"0x1"',
+        "name": name,
+        "fields": [
+            {"name": "id", "type": "Edm.String", "key": True},
+            {"name": "embedding", "type": "Collection(Edm.Single)", "dimensions": 1536, "vectorSearchProfile": "profile-1"}
+        ],
+        "vectorSearch": {
+            "algorithms": [{"name": "hnsw-1", "kind": "hnsw"}],
+            "profiles": [{"name": "profile-1", "algorithm": "hnsw-1"}],
+            "vectorizers": []
+        }
+    }
+
+def response(status_code=200, json=None, text=""):
+    result = MagicMock(status_code=status_code, text=text)
+    result.json.return_value = json
+    return result
+
+@pytest.fixture
+def session():
+    return MagicMock()
+
+@pytest.fixture
+def admin(session):
+    return SearchIndexAdmin(URL, "key", session)
+
+def test_versioned_definition_records_the_new_deployment():
+    definition = index_definition()
+
+    versioned = versioned_definition(definition, "rag-index-v2", "text-embedding-3-large", "https://openai.example", dimensions=3072)
+
+    assert versioned["name"] == "rag-index-v2"
+    assert "@odata.etag" not in versioned
+    assert versioned["fields"][1]["dimensions"] == 3072
+    assert embedding_deployment(versioned) == "text-embedding-3-large"
+    assert versioned["vectorSearch"]["vectorizers"][0]["azureOpenAIParameters"] == {
+        "resourceUri": "https://openai.example",
+        "deploymentId": "text-embedding-3-large",
+        "modelName": "text-embedding-3-large"
+    }
+    # The source definition is left alone
+    assert definition["name"] == "rag-index" and embedding_deployment(definition) is None
+
+def test_versioned_definition_keeps_the_deployment_by_default():
+    versioned = versioned_definition(index_definition(), "rag-index-v2", "ada", "https://openai.example")
+
+    copied = versioned_definition(versioned, "rag-index-v3")
+
+    assert embedding_deployment(copied) == "ada"
+    assert copied["fields"][1]["dimensions"] == 1536
+
+def test_resolve_follows_the_alias(admin, session):
+    definition = versioned_definition(index_definition(), "rag-index-v2", "text-embedding-3-large", "https://openai.example")
+    session.request.side_effect = [response(json={"name": "rag", "indexes": ["rag-index-v2"]}), response(json=definition)]
+
+    assert admin.resolve("rag") == ("rag-index-v2", "text-embedding-3-large")
+
+    alias_call, index_call = session.request.call_args_list
+    assert alias_call.args == ("GET", f"{URL}/aliases/rag?api-version={SearchIndexAdmin.ALIAS_API_VERSION}")
+    assert index_call.args == ("GET", f"{URL}/indexes/rag-index-v2?api-version={SearchIndexAdmin.API_VERSION}")
+
+def test_resolve_an_index_name(admin, session):
+    session.request.side_effect = [response(404), response(json=index_definition())]
+
+    assert admin.resolve("rag-index") == ("rag-index", None)
+
+def test_describe_returns_the_definition(admin, session):
+    session.request.side_effect = [response(json={"name": "rag", "indexes": ["rag-index"]}), response(json=index_definition())]
+
+    index_name, definition = admin.describe("rag")
+
+    assert index_name == "rag-index" and definition == index_definition()
+
+def test_has_field():
+    assert has_field(index_definition(), "embedding")
+    assert not has_field(index_definition(), INDEXED_AT_FIELD)
+
+def test_create_index_never_replaces_one(admin, session):
+    session.request.return_value = response(412)
+
+    with pytest.raises(ValueError):
+        admin.create_index(index_definition())
+
+    assert session.request.call_args.kwargs["headers"]["If-None-Match"] == "*"
+
+def test_set_alias_and_count(admin, session):
+    session.request.side_effect = [response(200), response(text="\ufeff42")]
+
+    admin.set_alias("rag", "rag-index-v2")
+    assert admin.count_documents("rag-index-v2") == 42
+
+    assert session.request.call_args_list[0].kwargs["json"] == {"name": "rag", "indexes": ["rag-index-v2"]}
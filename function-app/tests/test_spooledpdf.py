@@ -0,0 +1,47 @@
+import io
+import os
+import pytest
+from src.spooledpdf import SpooledPdf
+
+PDF_BYTES = b"%PDF-1.7 " + bytes(range(256)) * 40
+
+class FailingStream(io.BytesIO):
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise IOError("connection reset")
+        return super().read(size)
+
+def test_small_blob_stays_in_the_bytes_it_was_read_into():
+    stream = io.BytesIO(PDF_BYTES)
+
+    with SpooledPdf.spool(stream, len(PDF_BYTES)) as pdf:
+        assert pdf.path is None
+        assert pdf.data is PDF_BYTES
+        assert pdf.size == len(PDF_BYTES)
+
+def test_large_blob_is_streamed_to_a_file(monkeypatch):
+    monkeypatch.setattr(SpooledPdf, "READ_SIZE", 1000)
+
+    with SpooledPdf.spool(io.BytesIO(PDF_BYTES), len(PDF_BYTES), max_in_memory_bytes=4096) as pdf:
+        assert pdf.data is None
+        with open(pdf.path, "rb") as f:
+            assert f.read() == PDF_BYTES
+        assert pdf.size == len(PDF_BYTES)
+        path = pdf.path
+
+    assert not os.path.exists(path)
+
+@pytest.mark.parametrize("max_in_memory_bytes, in_memory", [(len(PDF_BYTES), True), (len(PDF_BYTES) - 1, False)])
+def test_unknown_length_is_probed_up_to_the_threshold(max_in_memory_bytes, in_memory):
+    with SpooledPdf.spool(io.BytesIO(PDF_BYTES), max_in_memory_bytes=max_in_memory_bytes) as pdf:
+        assert (pdf.path is None) == in_memory
+        assert pdf.size == len(PDF_BYTES)
+
+def test_failed_read_leaves_no_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+    with pytest.raises(IOError):
+        SpooledPdf.spool(FailingStream(PDF_BYTES), len(PDF_BYTES), max_in_memory_bytes=100)
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,96 @@
+import contextvars
+import pytest
+from src import telemetry
+from src.telemetry import InMemoryTelemetry, Telemetry
+
+@pytest.fixture
+def recorder():
+    recorder = telemetry.configure("memory")
+    yield recorder
+    telemetry.configure("none")
+
+def test_disabled_by_default_and_records_nothing():
+    assert type(telemetry.get_telemetry()) is Telemetry
+
+    with telemetry.span("stage", items=3) as span:
+        span.set_attribute("more", 1)
+    telemetry.record(telemetry.BATCH_SIZE, 16)
+    telemetry.count(telemetry.RETRIES)
+
+def test_span_records_duration_and_attributes(recorder):
+    with telemetry.span("embedding.request", texts=16) as span:
+        span.set_attribute("tokens", 800)
+
+    [(name, duration, attributes)] = recorder.spans
+    assert name == "embedding.request"
+    assert duration >= 0
+    assert attributes == {"texts": 16, "tokens": 800}
+    assert recorder.values(telemetry.STAGE_DURATION, stage="embedding.request") == [duration]
+
+def test_span_marks_errors_and_reraises(recorder):
+    with pytest.raises(ValueError):
+        with telemetry.span("search.index"):
+            raise ValueError("bad document")
+
+    assert recorder.spans[0][2] == {"error": "ValueError"}
+
+def test_histograms_and_counters_filter_by_attributes(recorder):
+    telemetry.record(telemetry.BATCH_SIZE, 16, stage="embedding.request")
+    telemetry.record(telemetry.BATCH_SIZE, 200, stage="search.upload")
+    telemetry.count(telemetry.RETRIES, limiter="chat")
+    telemetry.count(telemetry.RETRIES, 2, limiter="embedding")
+
+    assert recorder.values(telemetry.BATCH_SIZE, stage="search.upload") == [200]
+    assert sorted(recorder.values(telemetry.BATCH_SIZE)) == [16, 200]
+    assert recorder.total(telemetry.RETRIES) == 3
+    assert recorder.total(telemetry.RETRIES, limiter="embedding") == 2
+    assert recorder.total(telemetry.THROTTLES) == 0
+
+def test_values_are_capped(recorder):
+    recorder.MAX_VALUES = 2
+    for value in range(5):
+        telemetry.record(telemetry.PAYLOAD_SIZE, value)
+
+    assert recorder.values(telemetry.PAYLOAD_SIZE) == [0, 1]
+
+def test_summary_per_stage(recorder):
+    for _ in range(3):
+        with telemetry.span("pdf.extract"):
+            pass
+    with telemetry.span("pdf.chunk"):
+        pass
+
+    summary = recorder.summary()
+    assert summary["pdf.extract"]["count"] == 3
+    assert summary["pdf.chunk"]["count"] == 1
+    assert summary["pdf.extract"]["max"] >= summary["pdf.extract"]["p50"]
+
+def test_configure_rejects_unknown_exporter():
+    with pytest.raises(ValueError):
+        telemetry.configure("zipkin")
+
+def test_opentelemetry_exporter_needs_the_api(monkeypatch):
+    monkeypatch.setattr(telemetry, "otel_trace", None)
+
+    with pytest.raises(RuntimeError):
+        telemetry.configure("opentelemetry")
+
+def test_set_telemetry_installs_backend():
+    recorder = InMemoryTelemetry()
+    telemetry.set_telemetry(recorder)
+    try:
+        # Looked up on every call, so modules that imported telemetry earlier see it too
+        contextvars.copy_context().run(telemetry.count, telemetry.THROTTLES)
+    finally:
+        telemetry.set_telemetry(Telemetry())
+
+    assert recorder.total(telemetry.THROTTLES) == 1
+
+@pytest.mark.parametrize("exporter", ["zipkin", "opentelemetry"])
+def test_configure_or_disable_falls_back_to_no_op(monkeypatch, exporter):
+    monkeypatch.setattr(telemetry, "otel_trace", None)
+
+    backend = telemetry.configure_or_disable(exporter)
+
+    assert type(backend) is Telemetry
+    assert telemetry.get_telemetry() is backend
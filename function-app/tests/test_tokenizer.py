@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import pytest
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from src import tokenizer as tokenizer_module
+from src.tokenizer import SlimTokenizer, load_tokenizer
+
+TEXT = "the vector index holds one embedding per chunk of the document"
+
+@pytest.fixture
+def tokenizer_path(tmp_path):
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=300, initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False)
+    backend.train_from_iterator([TEXT] * 10, trainer)
+    path = str(tmp_path / "tokenizer.json")
+    backend.save(path)
+    return path
+
+def test_load_tokenizer_reads_the_file(tokenizer_path):
+    tokenizer = load_tokenizer(tokenizer_path)
+
+    assert isinstance(tokenizer, SlimTokenizer)
+    assert tokenizer.is_fast
+    ids = tokenizer.encode(TEXT)
+    assert ids
+    assert tokenizer.decode(ids) == TEXT
+
+def test_backend_tokenizer_gives_offsets_for_chunking(tokenizer_path):
+    tokenizer = load_tokenizer(tokenizer_path)
+
+    [encoding] = tokenizer.backend_tokenizer.encode_batch([TEXT])
+
+    assert encoding.offsets[0][0] == 0
+    assert encoding.offsets[-1][1] == len(TEXT)
+
+def test_load_tokenizer_uses_environment_path(tokenizer_path, monkeypatch):
+    monkeypatch.setenv("TOKENIZER_PATH", tokenizer_path)
+
+    assert isinstance(load_tokenizer(), SlimTokenizer)
+
+def test_load_tokenizer_requires_the_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("TOKENIZER_PATH", raising=False)
+    monkeypatch.setattr(tokenizer_module, "DEFAULT_TOKENIZER_PATH", str(tmp_path / "missing.json"))
+
+    with pytest.raises(FileNotFoundError):
+        load_tokenizer()
+
+def test_slim_load_does_not_import_transformers(tokenizer_path):
+    code = "import sys; from src.tokenizer import load_tokenizer; load_tokenizer(sys.argv[1]); print('transformers' in sys.modules)"
+    app_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    result = subprocess.run([sys.executable, "-c", code, tokenizer_path], cwd=app_path, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
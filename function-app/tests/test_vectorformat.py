@@ -0,0 +1,47 @@
+import base64
+import numpy as np
+import pytest
+from src.vectorformat import check_vector_format, decode_embedding, encode_vector, vector_values
+
+def test_decode_embedding_base64():
+    raw = np.array([0.5, -0.25, 1.0], dtype="<f4")
+
+    vector = decode_embedding(base64.b64encode(raw.tobytes()).decode("ascii"))
+
+    assert vector.dtype == np.float32
+    np.testing.assert_array_equal(vector, raw)
+
+def test_decode_embedding_list():
+    vector = decode_embedding([0.5, -0.25])
+
+    assert vector.dtype == np.float32
+    np.testing.assert_array_equal(vector, [0.5, -0.25])
+
+def test_encode_vector_float16():
+    vector = encode_vector([0.1, -0.2], "float16")
+
+    assert vector.dtype == np.float16
+    assert vector.nbytes == 4
+
+def test_encode_vector_int8_preserves_cosine():
+    rng = np.random.default_rng(0)
+    a, b = rng.standard_normal((2, 1536)).astype(np.float32) * 0.02
+
+    qa, qb = encode_vector(a, "int8"), encode_vector(b, "int8")
+
+    assert qa.dtype == np.int8
+    assert np.abs(qa).max() == 127
+    cosine = lambda x, y: float(np.dot(x, y) / (np.linalg.norm(x) * np.linalg.norm(y)))
+    assert cosine(qa.astype(np.float32), qb.astype(np.float32)) == pytest.approx(cosine(a, b), abs=0.01)
+
+def test_encode_vector_int8_zero_vector():
+    np.testing.assert_array_equal(encode_vector([0.0, 0.0], "int8"), [0, 0])
+
+def test_vector_values():
+    assert vector_values(np.array([1, -2], dtype=np.int8)) == [1, -2]
+    assert vector_values(np.array([0.5], dtype=np.float16)) == [0.5]
+    assert vector_values([1, 2]) == [1.0, 2.0]
+
+def test_check_vector_format_rejects_unknown():
+    with pytest.raises(ValueError, match="bfloat16"):
+        check_vector_format("bfloat16")
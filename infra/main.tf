@@ -12,6 +12,10 @@ terraform {
       source  = "azure/azapi"
       version = "~> 1.0.0"
     }
+    null = {
+      source  = "hashicorp/null"
+      version = "~> 3.0"
+    }
  }
 
   required_version = ">= 1.1.0"
@@ -72,6 +76,8 @@ module "storage_account" {
 
    resource_group_name = azurerm_resource_group.rg.name
    location            = azurerm_resource_group.rg.location
+   vector_format       = var.vector_format
+   search_index_alias  = var.search_index_alias
 
    providers = {
      azurerm = azurerm
@@ -91,6 +97,24 @@ module "storage_account" {
    }
  }
 
+# Both apps load the GPT-2 tokenizer from this file, so cold starts neither
+# import transformers nor download it; it has to be in place before either
+# app's code is zipped. Needs the function app requirements installed here.
+resource "null_resource" "export_tokenizer" {
+  triggers = {
+    tokenizer_module = filesha256("${path.module}/../function-app/src/tokenizer.py")
+  }
+
+  provisioner "local-exec" {
+    working_dir = "${path.module}/../function-app"
+    command     = <<-EOT
+      python -m src.tokenizer && \
+      mkdir -p ../chat-ui/assets && \
+      cp assets/gpt2-tokenizer.json ../chat-ui/assets/gpt2-tokenizer.json
+    EOT
+  }
+}
+
 module "function_app" {
   source = "./modules/functions/"
   resource_group_name   = azurerm_resource_group.rg.name
@@ -103,12 +127,15 @@ module "function_app" {
   open_ai_endpoint = module.open_ai.open_ai_endpoint
   ai_search_url = module.ai_search.search_api_url
   ai_search_key = module.ai_search.search_api_key
+  ai_search_index_name = module.ai_search.search_index_alias
+  vector_format = var.vector_format
   log_analytics_workspace_id = module.monitor.log_analytics_workspace_id
 
   providers = {
     azurerm = azurerm
     random = random
   }
+  depends_on = [null_resource.export_tokenizer]
 }
 
 module "web_ui_app" {
@@ -121,6 +148,8 @@ module "web_ui_app" {
   open_ai_endpoint = module.open_ai.open_ai_endpoint
   ai_search_url = module.ai_search.search_api_url
   ai_search_key = module.ai_search.search_api_key
+  ai_search_index_name = module.ai_search.search_index_alias
+  vector_format = var.vector_format
   log_analytics_workspace_id = module.monitor.log_analytics_workspace_id
   function_app_url = module.function_app.function_app_url
   function_app_key = module.function_app.function_app_key
@@ -129,4 +158,5 @@ module "web_ui_app" {
     azurerm = azurerm
     random = random
   }
+  depends_on = [null_resource.export_tokenizer]
 }
\ No newline at end of file
@@ -46,10 +46,15 @@ resource "null_resource" "create_search_index_via_post" {
   provisioner "local-exec" {
     command = <<-EOT
       # Inlined API version string here
-      curl -f -v -X POST "https://${random_pet.search_service_name.id}.search.windows.net/indexes?api-version=2023-10-01-Preview" \
+      curl -f -v -X POST "https://${random_pet.search_service_name.id}.search.windows.net/indexes?api-version=2024-07-01" \
       -H "Content-Type: application/json" \
       -H "api-key: ${azurerm_search_service.search_service.primary_key}" \
-      -d "@${path.module}/rag-index.json"
+      -d "@${path.module}/${var.vector_format == "float32" ? "rag-index.json" : "rag-index-${var.vector_format}.json"}"
+      # Aliases are only in the preview API versions
+      curl -f -v -X PUT "https://${random_pet.search_service_name.id}.search.windows.net/aliases/${var.search_index_alias}?api-version=2024-05-01-preview" \
+      -H "Content-Type: application/json" \
+      -H "api-key: ${azurerm_search_service.search_service.primary_key}" \
+      -d '{"name": "${var.search_index_alias}", "indexes": ["rag-index"]}'
     EOT
   }
 
@@ -7,4 +7,7 @@ output search_api_key {
     sensitive = true
 }
 
-
+output search_index_alias {
+    value = var.search_index_alias
+    depends_on = [null_resource.create_search_index_via_post]
+}
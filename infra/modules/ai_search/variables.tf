@@ -5,3 +5,13 @@ variable "resource_group_name" {
 variable "location" {
   type = string
 }
+
+variable "vector_format" {
+  type        = string
+  description = "Element type of the embedding field: float32, float16 or int8"
+}
+
+variable "search_index_alias" {
+  type        = string
+  description = "Alias created for the index, which the apps use instead of its name"
+}
@@ -90,6 +90,11 @@ resource "azurerm_linux_function_app" "index_function" {
     "AZURE_OPENAI_ENDPOINT" = var.open_ai_endpoint
     "AZURE_SEARCH_API_URL" = var.ai_search_url
     "AZURE_SEARCH_API_KEY" = var.ai_search_key
+    "AZURE_SEARCH_INDEX_NAME" = var.ai_search_index_name
+    "VECTOR_FORMAT" = var.vector_format
+    # HTTP streams: every HTTP route uses the extension's Request and
+    # Response types, and POST /blobs reads its body as a stream
+    "PYTHON_ENABLE_INIT_INDEXING" = "1"
   }
   identity {
     type = "SystemAssigned"
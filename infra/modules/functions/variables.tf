@@ -38,3 +38,12 @@ variable "ai_search_key" {
   type        = string
 }
 
+variable "ai_search_index_name" {
+  type        = string
+  description = "Index or index alias to read and write"
+}
+
+variable "vector_format" {
+  type        = string
+  description = "Element type of the embedding field: float32, float16 or int8"
+}
@@ -78,6 +78,8 @@ resource "azurerm_linux_web_app" "chat_web_ui_app" {
     "AZURE_OPENAI_ENDPOINT" = var.open_ai_endpoint
     "AZURE_SEARCH_API_URL" = var.ai_search_url
     "AZURE_SEARCH_API_KEY" = var.ai_search_key
+    "AZURE_SEARCH_INDEX_NAME" = var.ai_search_index_name
+    "VECTOR_FORMAT" = var.vector_format
     "WEBSITES_PORT"                       = "8000" 
     "AZURE_FUNCTION_APP_URL" = var.function_app_url
     "AZURE_FUNCTION_APP_KEY" = var.function_app_key
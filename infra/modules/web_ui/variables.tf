@@ -30,10 +30,20 @@ variable "ai_search_key" {
   type        = string
 }
 
+variable "ai_search_index_name" {
+  type        = string
+  description = "Index or index alias to read and write"
+}
+
 variable "function_app_url" {
   type        = string
 }
 
 variable "function_app_key" {
   type        = string
-}
\ No newline at end of file
+}
+
+variable "vector_format" {
+  type        = string
+  description = "Element type of the embedding field: float32, float16 or int8"
+}
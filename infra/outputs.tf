@@ -41,4 +41,8 @@ output "function_app_url" {
 output "function_app_key" {
   value = module.function_app.function_app_key
   sensitive = true
-}
\ No newline at end of file
+}
+
+output "search_index_alias" {
+  value = module.ai_search.search_index_alias
+}
@@ -4,6 +4,7 @@ echo "Setting environment variables from Terraform outputs..."
 
 export AZURE_SEARCH_API_KEY=$(terraform output -raw search_api_key)
 export AZURE_SEARCH_API_URL=$(terraform output -raw search_api_url)
+export AZURE_SEARCH_INDEX_NAME=$(terraform output -raw search_index_alias)
 export AZURE_OPENAI_API_KEY=$(terraform output -raw openai_api_key)
 export AZURE_OPENAI_ENDPOINT=$(terraform output -raw open_ai_endpoint_url)
 export AzureWebJobsStorage=$(terraform output -raw function_storage_account_connection_string)
@@ -1,3 +1,15 @@
 variable "subscription_id" {
     type = string
-}
\ No newline at end of file
+}
+
+variable "vector_format" {
+  type        = string
+  default     = "float32"
+  description = "Element type of the embedding field: float32, float16 or int8"
+}
+
+variable "search_index_alias" {
+  type        = string
+  default     = "rag"
+  description = "Search index alias the apps read and write through; src.indexmigration repoints it"
+}